@@ -1,17 +1,15 @@
 # Version 1.0.4 - Fixed Indentation
 import streamlit as st
-import requests
-from PIL import Image
+import streamlit.components.v1 as components
 import os
-from image_to_video import ImageToVideoConverter
-import tempfile
 import uuid
-import io
-import json
-import stripe
-import base64
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
+from datetime import datetime
+from resources import (get_auth, get_billing, get_config, get_encoding_profiles, get_frame_cache,
+                       get_frame_generator, get_frame_validator, get_generation_pool, get_prompt_index, get_router,
+                       get_singleflight, load_environment, new_converter, new_frame_store, new_previews)
+from auth import cookie_from_headers, cookie_script
+from prompt_index import prompt_key
+from storyboard import TRANSITIONS, parse_scenes, render_scenes
 
 # Set page config (MUST BE FIRST st. command)
 st.set_page_config(
@@ -21,24 +19,20 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Load environment variables
-load_dotenv()
+# Load environment variables (cached, runs once per process)
+load_environment()
+config = get_config()
 
-# Debug logging
-st.write("Debug: App Started")
-st.write(f"Debug: STABILITY_API_KEY exists: {bool(os.getenv('STABILITY_API_KEY'))}")
-st.write(f"Debug: STRIPE_SECRET_KEY exists: {bool(os.getenv('STRIPE_SECRET_KEY'))}")
-st.write(f"Debug: COOKIE_KEY exists: {bool(os.getenv('COOKIE_KEY'))}")
-
-# Initialize Stripe
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+def debug(*args):
+    """Write debug output to the page when DEBUG is enabled"""
+    if config['debug']:
+        st.write(*args)
 
-# Constants
-SD_URL = "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image"
-PRICE_IDS = {
-    'basic': 'price_H5ggYwtDq8jGy7',  # $9.99/month
-    'pro': 'price_H5ggYwtDq8jGy8'     # $29.99/month
-}
+# Debug logging
+debug("Debug: App Started")
+debug(f"Debug: STABILITY_API_KEY exists: {bool(os.getenv('STABILITY_API_KEY'))}")
+debug(f"Debug: STRIPE_SECRET_KEY exists: {bool(os.getenv('STRIPE_SECRET_KEY'))}")
+debug(f"Debug: COOKIE_KEY exists: {bool(os.getenv('COOKIE_KEY'))}")
 
 # Initialize session state
 if 'user_usage' not in st.session_state:
@@ -74,75 +68,154 @@ def increment_usage(username):
     if username in st.session_state.user_usage:
         st.session_state.user_usage[username]['count'] += 1
 
-def generate_image(prompt, negative_prompt="", width=1024, height=1024, steps=30):
-    """Generate an image using Stability AI API"""
-    st.write("Debug: Starting image generation")
-    st.write(f"Debug: Prompt: '{prompt}'")
+def generate_image(store, prompt, negative_prompt="", width=1024, height=1024, steps=30, frame=0, on_progress=None,
+                   check=None, use_cache=True):
+    """Generate an image on the best available backend (see backends.py) into a frame store
     
-    if not os.getenv('STABILITY_API_KEY'):
-        st.error("Missing Stability API key")
-        return None
-        
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {os.getenv('STABILITY_API_KEY')}"
-    }
+    See generation.FrameGenerator for the cache, coalescing, progress and
+    retry steps. Returns the stored frame as an RGB array (None on failure)
+    and whether it came from the cache.
+    """
+    debug("Debug: Starting image generation")
+    debug(f"Debug: Prompt: '{prompt}'")
+    
+    generator = get_frame_generator()
+    try:
+        image, cached = generator.generate(store, frame, prompt, negative_prompt, width, height, steps, check=check,
+                                           use_cache=use_cache, on_progress=on_progress, on_warning=st.warning)
+        debug("Debug: Frame served from cache" if cached else "Debug: Image generated successfully")
+        debug("Debug: Backend calls saved by coalescing:", generator.stats()['coalescing'])
+        return image, cached
+    except Exception as e:
+        st.error(f"Error generating image: {str(e)}")
+        debug("Debug: Backend stats:", generator.stats()['backends'])
+        return None, False
+
+def render_storyboard(scenes, negative_prompt="", width=1024, height=1024, steps=30, high_quality=False,
+                      use_cache=True):
+    """Render every scene's keyframe in parallel and assemble them into a video with transitions
     
-    # Build text prompts list
-    text_prompts = [{"text": prompt, "weight": 1}]
-    if negative_prompt:  # Only add negative prompt if it's not empty
-        text_prompts.append({"text": negative_prompt, "weight": -1})
-        st.write(f"Debug: Added negative prompt: '{negative_prompt}'")
+    Keyframes are cached per scene under the same key as the first frame of
+    a single-prompt job, so after editing one scene only that scene goes to a
+    backend again; without use_cache every scene is rendered anew. Returns the
+    encoded videos (see convert_frames_to_profiles), or None on failure, and
+    the number of scenes that went to a backend.
+    """
+    settings = config.get('storyboard', {})
+    fps = settings.get('fps', 12)
     
-    payload = {
-        "text_prompts": text_prompts,
-        "cfg_scale": 7,
-        "height": height,
-        "width": width,
-        "steps": steps,
-        "samples": 1,
-    }
+    def scene_key(scene):
+        return prompt_key(scene.prompt, negative_prompt, width, height, steps, 0)
+    
+    # Resolved here: fetch runs on the generation pool, outside the script thread
+    singleflight, router = get_singleflight(), get_router()
     
-    st.write("Debug: Payload:", payload)
+    def fetch(scene):
+        return singleflight.do(scene_key(scene), router.txt2img, scene.prompt, negative_prompt, width, height, steps)
     
+    # Keyframes stay in memory (or a memory-mapped spill file) until encoded
+    store = new_frame_store(len(scenes), width, height)
+    previews = new_previews()
     try:
-        st.write(f"Debug: Making API request to {SD_URL}")
-        response = requests.post(SD_URL, headers=headers, json=payload)
-        st.write(f"Debug: API Response Status: {response.status_code}")
-        st.write(f"Debug: API Response Headers: {dict(response.headers)}")
+        os.makedirs('output', exist_ok=True)
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+        status_text.text(f"Rendering {len(scenes)} scenes...")
+        thumbnails = st.columns(min(len(scenes), 4))
         
-        if response.status_code == 200:
-            try:
-                response_json = response.json()
-                st.write("Debug: Successfully parsed JSON response")
-                image_data = base64.b64decode(response_json["artifacts"][0]["base64"])
-                image = Image.open(io.BytesIO(image_data))
-                st.write("Debug: Image generated successfully")
-                return image
-            except Exception as e:
-                st.error(f"Error processing API response: {str(e)}")
-                st.write("Debug: Response content:", response.text[:500])  # Show first 500 chars
-                return None
-        else:
-            st.error(f"API Error: {response.text}")
-            return None
+        def show_scene(index, cached):
+            """Show a finished scene's thumbnail as soon as it arrives"""
+            progress_bar.progress(len(store) / len(scenes))
+            status_text.text(f"Rendered {len(store)}/{len(scenes)} scenes")
+            thumbnails[index % len(thumbnails)].image(
+                previews.add(index, store.get(index)),
+                caption=f"Scene {index + 1}" + (" (cached)" if cached else ""))
+        
+        # Scenes may repeat on purpose, so only blank and filtered keyframes are re-requested
+        check = get_frame_validator().job(duplicates=False)
+        try:
+            counts = render_scenes(store, scenes, fetch, scene_key, get_generation_pool(),
+                                   cache=get_frame_cache() if use_cache else None,
+                                   on_scene=show_scene, check=check)
+        finally:
+            check.finish(len(store) == len(scenes))
+        debug(f"Debug: Scenes from cache: {counts['cached']}, rendered: {counts['rendered']}, "
+              f"re-requested: {counts['retried']}")
+        if check.bad:
+            st.warning("Still unusable after retries: " +
+                       ", ".join(f"scene {index + 1} ({reason})" for index, reason in sorted(check.bad.items())))
+        
+        # Convert to video
+        status_text.text("Converting to video...")
+        output_path = os.path.join('output', f'storyboard_{uuid.uuid4()}.mp4')
+        profiles = get_encoding_profiles()
+        wanted = [profiles['web']] + ([profiles['master']] if high_quality else [])
+        converter = new_converter(output_path=output_path, fps=fps)
+        videos = converter.convert_storyboard_to_profiles(store, scenes, wanted,
+                                                          settings.get('transition_seconds', 0.75))
+        status_text.empty()
+        progress_bar.empty()
+        return videos or None, counts['rendered']
     except Exception as e:
-        st.error(f"Error generating image: {str(e)}")
-        st.write(f"Debug: Full error: {repr(e)}")
+        st.error(f"An error occurred: {str(e)}")
+        return None, 0
+    finally:
+        # Free the keyframes
+        store.close()
+
+def request_cookie(name):
+    """A cookie the browser sent when this session connected, or None"""
+    try:
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+        return cookie_from_headers(_get_websocket_headers(), name)
+    except Exception:
         return None
 
-# Authentication
+def sign_in(user, token=None):
+    """Mark the session as signed in, with a new session token unless it came with one"""
+    st.session_state['authentication_status'] = True
+    st.session_state['username'] = user['username']
+    st.session_state['name'] = user['name']
+    st.session_state['session_token'] = token or auth.issue_token(user['username'])
+    st.session_state['cookie_action'] = None if token else 'set'
+
+# Authentication (users from config.yaml, see auth.py)
+auth = get_auth()
+
+# A session cookie from an earlier login (a reload, another tab) signs in without checking the password
+if st.session_state['authentication_status'] != True and 'cookie_checked' not in st.session_state:
+    st.session_state['cookie_checked'] = True
+    token = request_cookie(auth.cookie_name)
+    user = auth.user_from_token(token)
+    if user is not None:
+        sign_in(user, token)
+
+# A session whose token was revoked (a logout in another tab) is signed out on its next rerun
+if st.session_state['authentication_status'] == True and \
+        auth.user_from_token(st.session_state.get('session_token')) is None:
+    st.session_state['authentication_status'] = False
+    st.session_state['session_token'] = None
+    st.session_state['cookie_action'] = 'clear'
+
 if st.session_state['authentication_status'] != True:
+    if st.session_state.get('cookie_action') == 'clear':
+        components.html(cookie_script(auth.cookie_name), height=0)
+        st.session_state['cookie_action'] = None  # written once; later reruns need not render it again
+    
     # Show login form
     username = st.text_input("Username")
     password = st.text_input("Password", type="password")
     
     if st.button("Login"):
-        if username == "demo" and password == "abc123":
-            st.session_state['authentication_status'] = True
-            st.session_state['username'] = username
-            st.session_state['name'] = "Demo User"
+        # bcrypt runs on the auth pool, so other sessions are not held up while this one waits
+        with st.spinner("Signing in..."):
+            try:
+                user = auth.login(username, password).result()
+            except Exception as e:
+                debug("Debug: Login failed:", e)
+                user = None
+        if user is not None:
+            sign_in(user)
             st.experimental_rerun()
         else:
             st.error("Invalid username or password")
@@ -152,35 +225,48 @@ else:
     username = st.session_state['username']
     name = st.session_state['name']
     
+    # Remember the login in a cookie, so new tabs and reloads skip the login form
+    if st.session_state.get('cookie_action') == 'set':
+        components.html(cookie_script(auth.cookie_name, st.session_state['session_token'], auth.expiry_seconds),
+                        height=0)
+        st.session_state['cookie_action'] = None
+    
     # Show logout button in sidebar
     if st.sidebar.button("Logout"):
+        # The token stays in the browser's cookie jar until the script deletes it, and could be copied;
+        # revoking makes it (and the user's other tokens) worthless either way
+        auth.revoke(username)
         st.session_state['authentication_status'] = False
+        st.session_state['session_token'] = None
+        st.session_state['cookie_action'] = 'clear'
         st.experimental_rerun()
     
     st.sidebar.title(f"Welcome {name}")
     
     # Subscription Management in Sidebar
     st.sidebar.header("Subscription")
-    current_tier = "free"  # You would typically get this from a database
+    # Tier lookups are cached per user; Stripe is only asked again after the TTL
+    current_tier = get_billing().get_tier(username) if os.getenv('STRIPE_SECRET_KEY') else "free"
+    checkout_slot = None
     
     if current_tier == "free":
         st.sidebar.info("You're on the Free tier")
         if st.sidebar.button("Upgrade to Pro"):
-            # Create Stripe checkout session
-            try:
-                checkout_session = stripe.checkout.Session.create(
-                    payment_method_types=['card'],
-                    line_items=[{
-                        'price': PRICE_IDS['pro'],
-                        'quantity': 1,
-                    }],
-                    mode='subscription',
-                    success_url=st.get_option("server.baseUrlPath") + '/success',
-                    cancel_url=st.get_option("server.baseUrlPath") + '/cancel',
-                )
-                st.sidebar.markdown(f"[Upgrade Now]({checkout_session.url})")
-            except Exception as e:
-                st.sidebar.error("Error creating checkout session")
+            # Start creating the Stripe checkout session in the background
+            st.session_state['checkout_tier'] = 'pro'
+        checkout_slot = st.sidebar.empty()
+    
+    def request_checkout():
+        """Start (or reuse) the checkout session for the requested tier"""
+        return get_billing().request_checkout(
+            username,
+            st.session_state['checkout_tier'],
+            success_url=st.get_option("server.baseUrlPath") + '/success',
+            cancel_url=st.get_option("server.baseUrlPath") + '/cancel',
+        )
+    
+    if checkout_slot is not None and st.session_state.get('checkout_tier'):
+        request_checkout()
     
     # Main App Interface
     st.title("🎬 AI Video Generator Pro")
@@ -191,95 +277,229 @@ else:
         # Sidebar settings
         with st.sidebar:
             st.header("Settings")
-            num_frames = st.slider("Number of frames", min_value=4, max_value=8, value=4)
-            fps = st.slider("Frames per second", min_value=1, max_value=5, value=2)
+            mode = st.radio("Mode", ["Single prompt", "Storyboard"], horizontal=True,
+                            help="Storyboard: a list of scenes, each with its own prompt, joined by transitions")
+            if mode == "Single prompt":
+                num_frames = st.slider("Number of frames", min_value=4, max_value=8, value=4)
+                fps = st.slider("Frames per second", min_value=1, max_value=5, value=2)
             
             st.header("Image Settings")
             width = st.select_slider("Image Width", options=[512, 768, 1024], value=1024)
             height = st.select_slider("Image Height", options=[512, 768, 1024], value=1024)
             steps = st.slider("Sampling Steps", min_value=20, max_value=50, value=30)
+            
+            st.header("Output")
+            high_quality = st.checkbox("High-quality download",
+                                       help="Also encode a full-resolution master; the page shows a smaller preview")
+            new_variation = st.checkbox("New variation",
+                                        help="Generate new images even if this prompt was generated before")
 
         # Main interface
-        prompt = st.text_area("Enter your prompt", height=100, 
-                            placeholder="Describe what you want to generate... Be creative!")
-        negative_prompt = st.text_area("Enter negative prompt (optional)", height=100,
-                                     placeholder="Describe what you want to avoid in the generation...")
-        
-        if st.button("Generate Video", type="primary"):
-            if not prompt:
-                st.error("Please enter a prompt first")
-            else:
-                st.write(f"Debug: Starting video generation")
-                st.write(f"Debug: Prompt: '{prompt}'")
-                st.write(f"Debug: Settings - Frames: {num_frames}, FPS: {fps}, Size: {width}x{height}, Steps: {steps}")
-                
+        if mode == "Storyboard":
+            max_scenes = config.get('storyboard', {}).get('max_scenes', 8)
+            st.caption(f"Each scene is one image held for its duration, up to {max_scenes} scenes. "
+                       "Scenes render in parallel and are cached, so editing one scene only re-renders that scene.")
+            rows = st.data_editor(
+                [
+                    {'prompt': "a quiet harbour at dawn, fishing boats, mist", 'duration': 3.0,
+                     'transition': 'crossfade'},
+                    {'prompt': "the same harbour at noon, busy market on the pier", 'duration': 3.0,
+                     'transition': 'fade'},
+                    {'prompt': "the harbour at night, lanterns reflected in the water", 'duration': 3.0,
+                     'transition': 'crossfade'},
+                ],
+                num_rows="dynamic",
+                use_container_width=True,
+                column_config={
+                    'prompt': st.column_config.TextColumn("Scene prompt", width="large", required=True),
+                    'duration': st.column_config.NumberColumn("Seconds", min_value=0.5, max_value=10.0, step=0.5,
+                                                              default=3.0),
+                    'transition': st.column_config.SelectboxColumn("Transition", options=list(TRANSITIONS),
+                                                                   default='crossfade'),
+                },
+                key='storyboard',
+            )
+            negative_prompt = st.text_area("Enter negative prompt (optional)", height=100,
+                                         placeholder="Describe what you want to avoid in every scene...")
+            
+            if st.button("Render Storyboard", type="primary"):
                 try:
-                    # Create directories if they don't exist
-                    os.makedirs('generated', exist_ok=True)
-                    os.makedirs('output', exist_ok=True)
-                    
-                    # Show progress
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    image_paths = []
-                    
-                    # Generate frames
-                    status_text.text("Generating frames...")
+                    scenes, problem = parse_scenes(rows), None
+                except ValueError as e:
+                    scenes, problem = [], str(e)
+                if problem:
+                    st.error(f"Please fix the storyboard: {problem}")
+                elif not scenes:
+                    st.error("Please enter at least one scene prompt")
+                elif len(scenes) > max_scenes:
+                    st.error(f"A storyboard can have at most {max_scenes} scenes")
+                else:
+                    videos, rendered = render_storyboard(scenes, negative_prompt, width, height, steps, high_quality,
+                                                         use_cache=not new_variation)
+                    if videos:
+                        for name, video in videos.items():
+                            debug(f"Debug: {name} video {video['resolution']}, "
+                                  f"{video['size_bytes'] / 1024:.0f} KiB in {video['seconds']:.2f}s")
+                        st.success("Video generated successfully!")
+                        st.video(videos['web']['path'])
+                        if 'master' in videos:
+                            with open(videos['master']['path'], 'rb') as f:
+                                st.download_button("Download high-quality video", data=f.read(),
+                                                   file_name=os.path.basename(videos['master']['path']),
+                                                   mime="video/mp4")
+                        # A storyboard made only of cached scenes cost no backend time
+                        if rendered:
+                            increment_usage(username)
+                    else:
+                        st.error("Failed to render the storyboard")
+        else:
+            prompt = st.text_area("Enter your prompt", height=100, 
+                                placeholder="Describe what you want to generate... Be creative!")
+            negative_prompt = st.text_area("Enter negative prompt (optional)", height=100,
+                                         placeholder="Describe what you want to avoid in the generation...")
+            
+            # Offer a past result of this user for a near-identical prompt before spending backend time on it
+            past = None
+            if prompt:
+                similarity = config.get('prompt_cache', {}).get('similarity', 0.7)
+                past = next(((score, record) for score, record in
+                             get_prompt_index().similar(prompt, negative_prompt, owner=username, threshold=similarity)
+                             if os.path.exists(record['video'])), None)
+            if past:
+                score, record = past
+                st.info(f"{'An identical' if score == 1.0 else f'A {score:.0%} similar'} prompt was generated before: "
+                        f"\"{record['prompt']}\" ({record['frames']} frames, {record['width']}x{record['height']})")
+                if st.button("Reuse this result"):
+                    if record.get('sheet') and os.path.exists(record['sheet']):
+                        st.image(record['sheet'], caption="All frames")
+                    st.video(record['video'])
+                    if record.get('master') and os.path.exists(record['master']):
+                        with open(record['master'], 'rb') as f:
+                            st.download_button("Download high-quality video", data=f.read(),
+                                               file_name=os.path.basename(record['master']), mime="video/mp4")
+            
+            if st.button("Generate Video", type="primary"):
+                if not prompt:
+                    st.error("Please enter a prompt first")
+                else:
+                    debug(f"Debug: Starting video generation")
+                    debug(f"Debug: Prompt: '{prompt}'")
+                    debug(f"Debug: Settings - Frames: {num_frames}, FPS: {fps}, Size: {width}x{height}, Steps: {steps}")
                     
-                    for i in range(num_frames):
-                        st.write(f"Debug: Generating frame {i+1} of {num_frames}")
-                        image = generate_image(prompt, negative_prompt, width, height, steps)
+                    # Frames stay in memory (or a memory-mapped spill file) until encoded
+                    store = new_frame_store(num_frames, width, height)
+                    previews = new_previews()
+                    try:
+                        # Create directories if they don't exist
+                        os.makedirs('output', exist_ok=True)
                         
-                        if image:
-                            # Save image
-                            temp_path = os.path.join('generated', f'frame_{i}.png')
-                            image.save(temp_path)
-                            image_paths.append(temp_path)
-                            st.write(f"Debug: Saved frame {i+1}")
-                            
-                            # Update progress
-                            progress = (i + 1) / num_frames
-                            progress_bar.progress(progress)
-                            
-                            # Show the generated frame
-                            st.image(image, caption=f"Frame {i+1}")
-                        else:
-                            st.error(f"Failed to generate frame {i+1}")
-                            break
-                    
-                    if len(image_paths) == num_frames:
-                        # Convert to video
-                        status_text.text("Converting to video...")
-                        output_path = os.path.join('output', f'video_{uuid.uuid4()}.mp4')
+                        # Show progress
+                        progress_bar = st.progress(0)
+                        status_text = st.empty()
+                        preview_slot = st.empty()
+                        
+                        # Generate frames
+                        status_text.text("Generating frames...")
                         
-                        converter = ImageToVideoConverter(output_path=output_path, fps=fps)
-                        if converter.convert_images_to_video(image_paths):
-                            # Show video
-                            status_text.empty()
-                            progress_bar.empty()
+                        def show_progress(snapshot, frame=0):
+                            """Advance the progress bar and live preview within a frame"""
+                            progress_bar.progress(min((frame + snapshot['progress']) / num_frames, 1.0))
+                            status_text.text(f"Generating frame {frame + 1}/{num_frames} "
+                                             f"(step {snapshot['step']}/{snapshot['steps']})")
+                            if snapshot['preview']:
+                                preview_slot.image(snapshot['preview'], caption="Live preview")
+                        
+                        # Bad frames (blank, filtered, duplicated) are re-requested one by one
+                        check = get_frame_validator().job()
+                        generated = 0
+                        for i in range(num_frames):
+                            debug(f"Debug: Generating frame {i+1} of {num_frames}")
+                            image, cached = generate_image(store, prompt, negative_prompt, width, height, steps,
+                                                           frame=i, check=check, use_cache=not new_variation,
+                                                           on_progress=lambda snapshot, i=i: show_progress(snapshot, i))
+                            generated += image is not None and not cached
+                            preview_slot.empty()
                             
-                            st.success("Video generated successfully!")
-                            st.video(output_path)
+                            if image is not None:
+                                debug(f"Debug: Stored frame {i+1} (spilled to disk: {store.spilled})")
+                                
+                                # Update progress
+                                progress = (i + 1) / num_frames
+                                progress_bar.progress(progress)
+                                
+                                # Show a thumbnail; full frames only go to the encoder
+                                st.image(previews.add(i, image), caption=f"Frame {i+1}")
+                            else:
+                                st.error(f"Failed to generate frame {i+1}")
+                                break
+                        
+                        check.finish(len(store) == num_frames)
+                        debug("Debug: Frame checks:", get_frame_validator().stats())
+                        
+                        if len(store) == num_frames:
+                            # Convert to video
+                            status_text.text("Converting to video...")
+                            output_path = os.path.join('output', f'video_{uuid.uuid4()}.mp4')
                             
-                            # Increment usage
-                            increment_usage(username)
-                        else:
-                            st.error("Failed to convert images to video")
-                    
-                except Exception as e:
-                    st.error(f"An error occurred: {str(e)}")
-                    
-                finally:
-                    # Clean up temporary files
-                    for path in image_paths:
-                        if os.path.exists(path):
-                            os.remove(path)
+                            profiles = get_encoding_profiles()
+                            wanted = [profiles['web']] + ([profiles['master']] if high_quality else [])
+                            converter = new_converter(output_path=output_path, fps=fps)
+                            videos = converter.convert_frames_to_profiles(store, wanted)
+                            if videos:
+                                for name, video in videos.items():
+                                    debug(f"Debug: {name} video {video['resolution']}, "
+                                          f"{video['size_bytes'] / 1024:.0f} KiB in {video['seconds']:.2f}s")
+                                
+                                # Show video
+                                status_text.empty()
+                                progress_bar.empty()
+                                
+                                st.success("Video generated successfully!")
+                                st.image(previews.contact_sheet(), caption="All frames")
+                                st.video(videos['web']['path'])
+                                
+                                # Index the job so near-identical prompts can reuse it
+                                sheet_path = os.path.splitext(output_path)[0] + '_sheet.jpg'
+                                with open(sheet_path, 'wb') as f:
+                                    f.write(previews.contact_sheet())
+                                get_prompt_index().add(prompt, negative_prompt, owner=username, width=width,
+                                                       height=height, steps=steps, frames=num_frames, fps=fps,
+                                                       video=videos['web']['path'],
+                                                       master=videos.get('master', {}).get('path'), sheet=sheet_path)
+                                
+                                if 'master' in videos:
+                                    with open(videos['master']['path'], 'rb') as f:
+                                        st.download_button("Download high-quality video", data=f.read(),
+                                                           file_name=os.path.basename(videos['master']['path']),
+                                                           mime="video/mp4")
+                                
+                                # Increment usage, unless every frame came from the cache
+                                if generated:
+                                    increment_usage(username)
+                            else:
+                                st.error("Failed to convert images to video")
+                        
+                    except Exception as e:
+                        st.error(f"An error occurred: {str(e)}")
+                        
+                    finally:
+                        # Free the frames
+                        store.close()
         
         # Show usage info
         if username in st.session_state.user_usage:
             st.sidebar.info(f"Generations today: {st.session_state.user_usage[username]['count']}")
     else:
         st.warning("You've reached your daily generation limit. Please upgrade to continue!")
+    
+    # Resolve the checkout last so the rest of the page never waits on Stripe
+    if checkout_slot is not None and st.session_state.get('checkout_tier'):
+        try:
+            checkout_session = request_checkout().result(timeout=15)
+            checkout_slot.markdown(f"[Upgrade Now]({checkout_session.url})")
+        except Exception as e:
+            checkout_slot.error("Error creating checkout session")
+            del st.session_state['checkout_tier']
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,260 @@
+"""
+Logins against the credentials in config.yaml, off the script thread
+
+Passwords are stored as bcrypt hashes; checking one costs about 250 ms of
+CPU at cost factor 12, by design. Checks run on a small worker pool of their
+own, so a burst of logins (or a password-guessing script) queues there
+instead of taking every core from the sessions that are generating videos.
+
+A successful login gets a session token: the username and an expiry time,
+signed with HMAC-SHA256 under the configured cookie key. The token is kept
+in the session and in a cookie, so reruns, reloads and new tabs are signed
+in by checking the signature (microseconds) instead of bcrypt. Logging out
+revokes every token of that user issued until then: the logout time is
+recorded per user (and appended to a revocation file, so other processes
+sharing it and restarts honour it) and older tokens are rejected. Changing
+the cookie key signs everyone out.
+A correct password is also remembered for a few minutes as a keyed hash,
+so logging in again (another browser, cookies cleared) skips bcrypt too.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from typing import Any, Dict, Optional
+
+import bcrypt
+
+from billing import TTLCache
+
+PLACEHOLDER_KEY = 'default_secret_key'  # cookie.key in the repository's config.yaml
+
+# bcrypt only uses this many bytes of a password; bcrypt 5 raises ValueError on longer ones instead of ignoring the rest
+MAX_PASSWORD_BYTES = 72
+
+# Checked for unknown usernames, so they take as long as wrong passwords (cost 12, like the real ones)
+_DUMMY_HASH = b'$2b$12$SpBcuKpE1AcrpmPVVOHDSuV3V3acis.FvlApVN63Den0a.PAY20l6'
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class Authenticator:
+    def __init__(self, credentials: Dict[str, Any], cookie_key: Optional[str], cookie_name: str = 'session',
+                 expiry_days: float = 30, max_workers: int = 2, remember_seconds: float = 600,
+                 revocation_path: Optional[str] = None):
+        """
+        Index the configured users
+
+        :param credentials: The credentials section of config.yaml ({'usernames': {name: {name, email, password}}})
+        :param cookie_key: Secret the session tokens are signed with (None for a random key, so
+                           sessions only last as long as the process)
+        :param cookie_name: Name of the cookie holding the session token
+        :param expiry_days: Days a session token stays valid
+        :param max_workers: Threads checking passwords; bounds the CPU logins can take
+        :param remember_seconds: Seconds a verified password is remembered (0 to always run bcrypt)
+        :param revocation_path: JSONL file logouts are recorded in (None to only remember them in this process)
+        """
+        self.users: Dict[str, Dict[str, Any]] = {}
+        for username, entry in ((credentials or {}).get('usernames') or {}).items():
+            self.users[username.casefold()] = {
+                'username': username,
+                'name': entry.get('name', username),
+                'email': entry.get('email'),
+                'hash': entry['password'].encode(),
+            }
+        self.cookie_name = cookie_name
+        self.expiry_seconds = expiry_days * 24 * 60 * 60
+        self._key = cookie_key.encode() if cookie_key else os.urandom(32)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='auth')
+        self._remembered = TTLCache(remember_seconds)
+        self._remember_key = os.urandom(32)  # per process: remembered digests are useless elsewhere
+        self.remember_seconds = remember_seconds
+        self.revocation_path = revocation_path
+        self._revoked: Dict[str, float] = {}  # casefolded username: tokens issued until then are invalid
+        self._revocation_stamp = None  # (mtime, size) of the revocation file when it was last read
+        self._revocation_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], **kwargs) -> 'Authenticator':
+        """
+        Build an authenticator from a parsed config.yaml
+
+        The placeholder cookie key shipped in config.yaml is treated as unset.
+
+        :param config: Configuration with credentials and cookie sections
+        :param kwargs: Further constructor arguments (e.g. the auth section)
+        :return: Authenticator instance
+        """
+        cookie = config.get('cookie', {})
+        key = cookie.get('key')
+        if key == PLACEHOLDER_KEY:
+            key = None  # anyone could sign tokens with the key from the repository
+        return cls(config.get('credentials'), key, cookie_name=cookie.get('name', 'session'),
+                   expiry_days=cookie.get('expiry_days', 30), **kwargs)
+
+    def login(self, username: str, password: str) -> Future:
+        """
+        Check a username and password on the worker pool
+
+        :param username: Username as typed (case-insensitive)
+        :param password: Password as typed
+        :return: Future resolving to the user ({'username', 'name', 'email'}) or None if the login is wrong
+        """
+        user = self.users.get((username or '').strip().casefold())
+        digest = hmac.new(self._remember_key, f'{username}\x00{password}'.encode(), hashlib.sha256).digest()
+        if user is not None and self._remembered.get(user['username']) == digest:
+            future = Future()
+            future.set_result(self._public(user))
+            return future
+        return self._executor.submit(self._check, user, password, digest)
+
+    def _check(self, user: Optional[Dict[str, Any]], password: str, digest: bytes) -> Optional[Dict[str, Any]]:
+        # Truncated like older bcrypt releases did, so hashes made by them keep matching
+        password_bytes = (password or '').encode()[:MAX_PASSWORD_BYTES]
+        if user is None:
+            bcrypt.checkpw(password_bytes, _DUMMY_HASH)
+            return None
+        try:
+            matches = bcrypt.checkpw(password_bytes, user['hash'])
+        except ValueError as e:
+            print(f"Warning: invalid password hash for '{user['username']}' in config.yaml: {e}")
+            return None
+        if not matches:
+            return None
+        if self.remember_seconds:
+            self._remembered.set(user['username'], digest)
+        return self._public(user)
+
+    @staticmethod
+    def _public(user: Dict[str, Any]) -> Dict[str, Any]:
+        return {'username': user['username'], 'name': user['name'], 'email': user['email']}
+
+    def issue_token(self, username: str) -> str:
+        """
+        Signed session token for a signed-in user
+
+        :param username: User the token is for
+        :return: Token to store in the session and the cookie
+        """
+        now = time.time()
+        payload = _b64encode(json.dumps({'u': username, 'iat': now, 'exp': int(now + self.expiry_seconds)}).encode())
+        return f'{payload}.{self._sign(payload)}'
+
+    def user_from_token(self, token: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        The user a session token was issued to, if it is genuine, unexpired, not revoked and the user still exists
+
+        :param token: Token from issue_token (None or garbage is fine)
+        :return: The user ({'username', 'name', 'email'}) or None
+        """
+        if not token or token.count('.') != 1:
+            return None
+        payload, signature = token.split('.')
+        if not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+        if not isinstance(claims, dict) or claims.get('exp', 0) < time.time():
+            return None
+        user = self.users.get(str(claims.get('u', '')).casefold())
+        if user is None or claims.get('iat', 0) <= self._revoked_until(user['username']):
+            return None
+        return self._public(user)
+
+    def revoke(self, username: str) -> None:
+        """
+        Sign a user out everywhere: every token issued to them so far stops working
+
+        :param username: User logging out
+        """
+        key, now = username.casefold(), time.time()
+        with self._revocation_lock:
+            self._revoked[key] = max(self._revoked.get(key, 0.0), now)
+            if self.revocation_path:
+                directory = os.path.dirname(self.revocation_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                line = (json.dumps({'u': key, 'until': now}) + '\n').encode()
+                with open(self.revocation_path, 'a+b') as f:
+                    if f.seek(0, os.SEEK_END):
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b'\n':
+                            line = b'\n' + line  # after a line cut short by a crash
+                    f.write(line)
+
+    def _revoked_until(self, username: str) -> float:
+        if self.revocation_path:
+            self._load_revocations()
+        return self._revoked.get(username.casefold(), 0.0)
+
+    def _load_revocations(self) -> None:
+        # One stat per check; the file is only read again after another process (or a restart) wrote to it
+        try:
+            stat = os.stat(self.revocation_path)
+        except OSError:
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._revocation_stamp:
+            return
+        with self._revocation_lock:
+            with open(self.revocation_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        key, until = str(record['u']), float(record['until'])
+                    except (ValueError, KeyError, TypeError):
+                        continue  # a line cut short by a crash
+                    self._revoked[key] = max(self._revoked.get(key, 0.0), until)
+            self._revocation_stamp = stamp
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self._key, payload.encode(), hashlib.sha256).digest())
+
+
+def cookie_from_headers(headers: Optional[Dict[str, str]], name: str) -> Optional[str]:
+    """
+    Value of a cookie sent with the page's websocket connection
+
+    :param headers: Request headers (see streamlit's _get_websocket_headers), None outside a browser session
+    :param name: Cookie name
+    :return: Cookie value or None
+    """
+    if not headers:
+        return None
+    cookies = SimpleCookie()
+    try:
+        cookies.load(headers.get('Cookie', ''))
+    except Exception:
+        return None
+    morsel = cookies.get(name)
+    return morsel.value if morsel is not None else None
+
+
+def cookie_script(name: str, value: str = '', max_age: float = 0) -> str:
+    """
+    HTML that sets (or with max_age 0, deletes) a cookie on the app's page, for st.components.v1.html
+
+    Streamlit cannot set cookies from Python; component iframes share the
+    app's origin, so a script in one can write the parent page's cookies.
+
+    :param name: Cookie name
+    :param value: Cookie value (a session token, URL-safe)
+    :param max_age: Seconds the browser keeps the cookie
+    :return: HTML snippet
+    """
+    cookie = f'{name}={value}; Max-Age={int(max_age)}; Path=/; SameSite=Strict'
+    return ("<script>const secure = window.parent.location.protocol === 'https:' ? '; Secure' : '';"
+            f"window.parent.document.cookie = {json.dumps(cookie)} + secure;</script>")
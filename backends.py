@@ -0,0 +1,336 @@
+"""
+Routing of image generation requests over several backends
+
+Backends (Stability cloud, any number of Stable Diffusion WebUI boxes) are
+listed in config.yaml. The router keeps a moving average of latency and
+error rate per backend, sends each frame to the one with the best score,
+fails over to the next one on error, and stops sending traffic to a backend
+(circuit breaker) after repeated failures until a cooldown has passed.
+A request the backend rejects as invalid (HTTP 4xx, e.g. an unsupported size
+or a bad API key) is the request's fault: it is neither failed over nor
+counted against the backend's health.
+"""
+import base64
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import requests
+
+STABILITY_URL = "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image"
+
+# Used when config.yaml lists no backend of the requested kind
+DEFAULT_BACKENDS = {
+    'stability': {
+        'name': 'stability-cloud',
+        'kind': 'stability',
+        'url': STABILITY_URL,
+        'api_key_env': 'STABILITY_API_KEY',
+        'capabilities': ['txt2img'],
+    },
+    'webui': {
+        'name': 'webui-local',
+        'kind': 'webui',
+        'url': os.getenv('SD_API_URL', 'http://127.0.0.1:7860'),
+        'capabilities': ['txt2img', 'progress'],
+    },
+}
+
+
+class BackendError(Exception):
+    """Raised when no backend could serve a request"""
+
+
+class ContentFiltered(BackendError):
+    """Raised when a backend answered with a content-filtered placeholder instead of the image"""
+
+
+class RequestRejected(BackendError):
+    """Raised when a backend rejected the request itself (HTTP 4xx: bad size, bad key), not failed on it"""
+
+
+# Client errors that still say something about the backend's state, so they count as failures
+RETRYABLE_STATUS = {408, 429}
+
+
+def check_response(response: requests.Response) -> None:
+    """
+    Raise for a reply that carries no image
+
+    :param response: HTTP response of a backend
+    :raises RequestRejected: For client errors, except timeouts and rate limits
+    :raises BackendError: For any other status than 200
+    """
+    if response.status_code == 200:
+        return
+    message = f"API Error {response.status_code}: {response.text[:500]}"
+    if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_STATUS:
+        raise RequestRejected(message)
+    raise BackendError(message)
+
+
+class Backend:
+    def __init__(self, name: str, kind: str, url: str, weight: float = 1.0,
+                 capabilities: Iterable[str] = ('txt2img',), api_key_env: Optional[str] = None,
+                 timeout: float = 120.0):
+        """
+        A single image generation server and its health statistics
+
+        :param name: Display name, unique within the router
+        :param kind: API flavour, 'stability' or 'webui'
+        :param url: Endpoint URL (Stability) or base URL (WebUI)
+        :param weight: Relative share of traffic; higher gets more
+        :param capabilities: Features the backend supports, e.g. txt2img, progress
+        :param api_key_env: Environment variable holding the bearer token, if any
+        :param timeout: Seconds to wait for a response
+        """
+        if kind not in ('stability', 'webui'):
+            raise ValueError(f"Unknown backend kind '{kind}' for backend '{name}'")
+        self.name = name
+        self.kind = kind
+        self.url = url.rstrip('/')
+        self.weight = float(weight)
+        self.capabilities = set(capabilities)
+        self.api_key_env = api_key_env
+        self.timeout = timeout
+
+        self.latency = None  # moving average, seconds
+        self.error_rate = 0.0  # moving average, 0..1
+        self.inflight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0  # circuit open (no traffic) until this time
+        self.probing = False  # a half-open trial request is in flight
+
+    @property
+    def api_key(self) -> Optional[str]:
+        return os.getenv(self.api_key_env) if self.api_key_env else None
+
+    def configured(self) -> bool:
+        """Whether the backend has everything it needs (e.g. its API key)"""
+        return not self.api_key_env or bool(self.api_key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of the health statistics"""
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'inflight': self.inflight,
+            'requests': self.requests,
+            'failures': self.failures,
+            'circuit_open': self.open_until > time.monotonic(),
+        }
+
+
+class BackendRouter:
+    def __init__(self, backends: List[Backend], session: Optional[requests.Session] = None,
+                 alpha: float = 0.2, failure_threshold: int = 3, cooldown: float = 30.0):
+        """
+        Initialize the router
+
+        :param backends: Backends to route over
+        :param session: Pooled HTTP session to send requests with
+        :param alpha: Smoothing factor of the moving averages (weight of the newest sample)
+        :param failure_threshold: Consecutive failures that open a backend's circuit
+        :param cooldown: Seconds an open circuit rejects traffic before a trial request
+        """
+        if not backends:
+            raise ValueError("BackendRouter needs at least one backend")
+        self.backends = backends
+        self.session = session or requests.Session()
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, entries: Optional[List[Dict[str, Any]]], kind: Optional[str] = None,
+                    **kwargs) -> 'BackendRouter':
+        """
+        Build a router from the 'backends' list in config.yaml
+
+        :param entries: Backend definitions (keyword arguments of Backend, plus 'enabled')
+        :param kind: Only use backends of this kind
+        :return: BackendRouter instance
+        """
+        entries = [entry for entry in entries or []
+                   if entry.get('enabled', True) and (kind is None or entry['kind'] == kind)]
+        if not entries:
+            entries = [DEFAULT_BACKENDS[kind or 'stability']]
+        backends = [Backend(**{k: v for k, v in entry.items() if k != 'enabled'}) for entry in entries]
+        return cls(backends, **kwargs)
+
+    def choose(self, capability: str = 'txt2img', exclude: Iterable[Backend] = ()) -> Backend:
+        """
+        Pick the backend with the best expected latency for a request
+
+        The score is the moving-average latency, scaled up by queued work and
+        error rate and down by weight. Backends without samples yet score as
+        the fastest known one so they get traffic and a measurement.
+
+        :param capability: Required capability
+        :param exclude: Backends already tried for this request
+        :return: Chosen backend, already counted as in flight
+        """
+        now = time.monotonic()
+        with self._lock:
+            capable = [b for b in self.backends if capability in b.capabilities and b not in exclude]
+            candidates = [b for b in capable if b.configured()]
+            if not candidates:
+                missing = sorted({b.api_key_env for b in capable if not b.configured()})
+                hint = f" (missing {', '.join(missing)})" if missing else ""
+                raise BackendError(f"No backend configured for {capability}{hint}")
+
+            known = [b.latency for b in candidates if b.latency is not None]
+            default_latency = min(known) if known else 0.0
+
+            def score(backend: Backend) -> float:
+                latency = backend.latency if backend.latency is not None else default_latency
+                penalty = 1.0 / max(1.0 - backend.error_rate, 0.05)
+                return (latency + 0.001) * (1 + backend.inflight) * penalty / backend.weight
+
+            # An open circuit past its cooldown gets a single trial request;
+            # otherwise route to the best backend whose circuit is closed
+            closed = [b for b in candidates if b.consecutive_failures < self.failure_threshold]
+            half_open = [b for b in candidates
+                         if b not in closed and b.open_until <= now and not b.probing]
+            if half_open:
+                backend = half_open[0]
+                backend.probing = True
+            elif closed:
+                backend = min(closed, key=score)
+            else:
+                raise BackendError(f"All backends for {capability} are unavailable")
+            backend.inflight += 1
+            return backend
+
+    def record(self, backend: Backend, latency: float, ok: bool) -> None:
+        """
+        Update a backend's statistics after a request
+
+        :param backend: Backend the request went to
+        :param latency: Seconds the request took
+        :param ok: Whether it succeeded
+        """
+        with self._lock:
+            backend.inflight -= 1
+            backend.requests += 1
+            backend.probing = False
+            backend.error_rate += self.alpha * ((0.0 if ok else 1.0) - backend.error_rate)
+            if ok:
+                backend.latency = latency if backend.latency is None else \
+                    backend.latency + self.alpha * (latency - backend.latency)
+                backend.consecutive_failures = 0
+                backend.open_until = 0.0
+            else:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.failure_threshold:
+                    backend.open_until = time.monotonic() + self.cooldown
+
+    def release(self, backend: Backend) -> None:
+        """
+        Finish a request without counting it in the backend's statistics
+
+        :param backend: Backend the request went to
+        """
+        with self._lock:
+            backend.inflight -= 1
+            backend.probing = False
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Health statistics of every backend"""
+        with self._lock:
+            return [backend.stats() for backend in self.backends]
+
+    def txt2img(self, prompt: str, negative_prompt: str = "", width: int = 1024, height: int = 1024,
+                steps: int = 30, on_backend: Optional[Callable[[Backend, str], None]] = None) -> bytes:
+        """
+        Generate one image on the best available backend, failing over on error
+
+        :param prompt: Text prompt
+        :param negative_prompt: What to avoid in the generation
+        :param width: Image width
+        :param height: Image height
+        :param steps: Sampling steps
+        :param on_backend: Called with each backend the request is sent to and the task id it is sent
+                           with, e.g. to follow its progress (see progress.py)
+        :return: Encoded image bytes (PNG)
+        :raises ContentFiltered: If the backend filtered the image (not retried on other backends)
+        :raises RequestRejected: If the backend rejected the request as invalid (not retried on other backends)
+        """
+        tried = []
+        errors = []
+        while True:
+            try:
+                backend = self.choose('txt2img', exclude=tried)
+            except BackendError:
+                if errors:
+                    raise BackendError("; ".join(errors))
+                raise
+            tried.append(backend)
+            task_id = f"task({uuid.uuid4().hex})"  # WebUI's own format; progress is only reported per task
+            if on_backend is not None:
+                on_backend(backend, task_id)
+            start = time.perf_counter()
+            try:
+                image_data = self._txt2img(backend, prompt, negative_prompt, width, height, steps, task_id)
+            except ContentFiltered:
+                # The backend is healthy; the caller decides whether to ask again
+                self.record(backend, time.perf_counter() - start, ok=True)
+                raise
+            except RequestRejected:
+                # The request is at fault, not the backend: another backend would reject it too
+                self.release(backend)
+                raise
+            except Exception as e:
+                self.record(backend, time.perf_counter() - start, ok=False)
+                errors.append(f"{backend.name}: {e}")
+                continue
+            self.record(backend, time.perf_counter() - start, ok=True)
+            return image_data
+
+    def _txt2img(self, backend: Backend, prompt: str, negative_prompt: str, width: int, height: int,
+                 steps: int, task_id: Optional[str] = None) -> bytes:
+        headers = {"Authorization": f"Bearer {backend.api_key}"} if backend.api_key else {}
+
+        if backend.kind == 'stability':
+            text_prompts = [{"text": prompt, "weight": 1}]
+            if negative_prompt:  # Only add negative prompt if it's not empty
+                text_prompts.append({"text": negative_prompt, "weight": -1})
+            payload = {
+                "text_prompts": text_prompts,
+                "cfg_scale": 7,
+                "height": height,
+                "width": width,
+                "steps": steps,
+                "samples": 1,
+            }
+            response = self.session.post(backend.url, headers=headers, json=payload, timeout=backend.timeout)
+            check_response(response)
+            artifact = response.json()["artifacts"][0]
+            if artifact.get("finishReason") == "CONTENT_FILTERED":
+                raise ContentFiltered(f"{backend.name}: image was content-filtered")
+            return base64.b64decode(artifact["base64"])
+
+        payload = {
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "steps": steps,
+            "width": width,
+            "height": height,
+            "sampler_name": "DPM++ 2M Karras",
+            "cfg_scale": 7,
+            "seed": -1,
+        }
+        if task_id:
+            payload["force_task_id"] = task_id
+        response = self.session.post(f"{backend.url}/sdapi/v1/txt2img", headers=headers, json=payload,
+                                     timeout=backend.timeout)
+        check_response(response)
+        return base64.b64decode(response.json()['images'][0])
@@ -0,0 +1,356 @@
+"""
+Headless batch rendering, without Streamlit
+
+Takes either a JSONL manifest of generation jobs or a directory tree of
+image folders, runs the jobs on a worker pool and writes one video per job
+and encoding profile (see encoding.py), e.g. renders/sunset_web.mp4. Frames
+are held in a FrameStore under the frame_store budget of config.yaml, as in
+the apps. Finished jobs are appended to a checkpoint file, so an
+interrupted run picks up where it stopped when started again with the same
+checkpoint.
+
+Manifest lines look like:
+    {"id": "sunset", "prompt": "a sunset over the sea", "negative_prompt": "",
+     "num_frames": 4, "fps": 2, "width": 1024, "height": 1024, "steps": 30}
+
+Usage:
+    python batch.py jobs.jsonl --output renders/ --workers 4 --profiles web,master
+    python batch.py image_folders/ --output renders/ --fps 2
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional
+
+import requests
+import yaml
+from PIL import Image
+
+from backends import BackendRouter
+from encoding import EncodingProfile, load_profiles
+from frame_store import FrameStore, MemoryBudget
+from image_to_video import ImageToVideoConverter, is_image, probe_fourcc
+
+JOB_DEFAULTS = {
+    'negative_prompt': '',
+    'num_frames': 4,
+    'fps': 2,
+    'width': 1024,
+    'height': 1024,
+    'steps': 30,
+}
+
+
+class Checkpoint:
+    def __init__(self, path: str):
+        """
+        Append-only record of finished jobs
+
+        :param path: JSONL file; created if missing
+        """
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load(path)
+
+    def _load(self, path: str) -> None:
+        with open(path, 'rb+') as f:
+            lines = f.readlines()
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    self.done.add(json.loads(line)['id'])
+                except (ValueError, KeyError, TypeError):
+                    if number < len(lines):
+                        raise ValueError(f"{path}:{number}: corrupt checkpoint line")
+                    # A crash or a full disk mid-write; the job is simply not done yet
+                    print(f"Warning: dropping the incomplete last line of {path}")
+                    f.truncate(sum(len(previous) for previous in lines[:-1]))
+                    return
+            if lines and not lines[-1].endswith(b'\n'):
+                f.seek(0, os.SEEK_END)
+                f.write(b'\n')  # so the next record starts on its own line
+
+    def record(self, result: Dict[str, Any]) -> None:
+        """Mark a job as finished (durably, so a crash right after does not redo it)"""
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.done.add(result['id'])
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """
+    Read generation jobs from a JSONL manifest
+
+    :param path: Manifest path
+    :return: Jobs with defaults filled in; ids default to the line number
+    :raises ValueError: If a job has no prompt or reuses the id of an earlier one
+    """
+    jobs = []
+    seen = {}
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            job = dict(JOB_DEFAULTS, **json.loads(line))
+            if 'prompt' not in job:
+                raise ValueError(f"{path}:{number}: job has no prompt")
+            job['id'] = str(job.get('id', number))
+            if job['id'] in seen:
+                raise ValueError(f"{path}:{number}: job id '{job['id']}' is already used on line {seen[job['id']]}")
+            seen[job['id']] = number
+            job['kind'] = 'generate'
+            jobs.append(job)
+    return jobs
+
+
+def find_image_folders(root: str, fps: int) -> List[Dict[str, Any]]:
+    """
+    Turn every folder under root that directly contains images into a job
+
+    :param root: Directory tree to scan
+    :param fps: Frames per second of the resulting videos
+    :return: Jobs with ids relative to root
+    """
+    jobs = []
+    for folder, _, files in sorted(os.walk(root)):
+        if any(is_image(name) for name in files):
+            job_id = os.path.relpath(folder, root)
+            jobs.append({'id': job_id if job_id != '.' else os.path.basename(os.path.abspath(root)),
+                         'kind': 'folder', 'folder': folder, 'fps': fps})
+    return jobs
+
+
+def load_config(config_path: str) -> Dict[str, Any]:
+    """
+    Read config.yaml, after loading .env as the apps do
+
+    :param config_path: Path to config.yaml
+    :return: Parsed configuration
+    """
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    with open(config_path) as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_router(config: Dict[str, Any]) -> BackendRouter:
+    """
+    Build the backend router from config.yaml, as the apps do
+
+    :param config: Parsed configuration
+    :return: BackendRouter instance
+    """
+    session = requests.Session()
+    session.headers.update({"Accept": "application/json", "Content-Type": "application/json"})
+    return BackendRouter.from_config(config.get('backends'), session=session, **config.get('routing', {}))
+
+
+class BatchRunner:
+    def __init__(self, output_dir: str, checkpoint: Checkpoint, router: Optional[BackendRouter] = None,
+                 profiles: Optional[List[EncodingProfile]] = None, fourcc: str = 'mp4v',
+                 budget: Optional[MemoryBudget] = None, spill_dir: Optional[str] = None):
+        """
+        Initialize the runner
+
+        :param output_dir: Directory the videos are written to
+        :param checkpoint: Record of finished jobs
+        :param router: Backend router, needed for manifest (generate) jobs
+        :param profiles: Renditions to encode per job (default: the 'web' profile)
+        :param fourcc: Codec for the OpenCV fallback when there is no ffmpeg
+        :param budget: Memory budget shared by the frame stores of all jobs (None keeps frames in memory)
+        :param spill_dir: Directory for frame stores that do not fit the budget
+        """
+        self.output_dir = output_dir
+        self.checkpoint = checkpoint
+        self.router = router
+        self.profiles = profiles or [load_profiles()['web']]
+        self.fourcc = fourcc
+        self.budget = budget
+        self.spill_dir = spill_dir
+
+    def output_path(self, job: Dict[str, Any]) -> str:
+        """Video path of a job, derived from its id; each profile's file gets the profile name appended"""
+        name = re.sub(r'[^A-Za-z0-9._-]+', '_', job['id']).strip('_') or 'job'
+        return os.path.join(self.output_dir, f"{name}.mp4")
+
+    def check_outputs(self, jobs: Iterable[Dict[str, Any]]) -> None:
+        """
+        Make sure no two jobs write the same video
+
+        Ids are reduced to safe file names, so different ids ('a/b' and
+        'a_b') can end up with the same file; such jobs would overwrite each
+        other and both be marked done in the checkpoint.
+
+        :param jobs: All jobs of the run
+        :raises ValueError: Naming the jobs that share an output path
+        """
+        owners: Dict[str, str] = {}
+        clashes = []
+        for job in jobs:
+            path = os.path.normcase(self.output_path(job))
+            if path in owners:
+                root, ext = os.path.splitext(self.output_path(job))
+                clashes.append(f"'{owners[path]}' and '{job['id']}' would both write {root}_<profile>{ext}")
+            else:
+                owners[path] = job['id']
+        if clashes:
+            raise ValueError("Jobs with clashing output files (give them distinct ids): " + "; ".join(clashes))
+
+    def run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Render one job
+
+        :param job: Job description (see load_manifest / find_image_folders)
+        :return: Result with per-stage timings in seconds
+        """
+        result = {'id': job['id'], 'output': self.output_path(job), 'status': 'ok',
+                  'generate_s': 0.0, 'encode_s': 0.0}
+        started = time.perf_counter()
+        try:
+            if job['kind'] == 'generate':
+                store = self._generate(job)
+                result['generate_s'] = round(time.perf_counter() - started, 3)
+            else:
+                store = self._load_folder(job['folder'])
+
+            with store:
+                encode_started = time.perf_counter()
+                converter = ImageToVideoConverter(output_path=result['output'], fps=job['fps'], fourcc=self.fourcc)
+                videos = converter.convert_frames_to_profiles(store, self.profiles)
+                if not videos:
+                    raise RuntimeError("No frames to encode")
+                result['encode_s'] = round(time.perf_counter() - encode_started, 3)
+            result['outputs'] = {name: video['path'] for name, video in videos.items()}
+            result['output'] = result['outputs'][self.profiles[0].name]
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        result['total_s'] = round(time.perf_counter() - started, 3)
+
+        if result['status'] == 'ok':
+            self.checkpoint.record(result)
+        return result
+
+    def _new_store(self, num_frames: int, width: int, height: int) -> FrameStore:
+        return FrameStore(num_frames, width, height, budget=self.budget, spill_dir=self.spill_dir)
+
+    def _generate(self, job: Dict[str, Any]) -> FrameStore:
+        store = self._new_store(job['num_frames'], job['width'], job['height'])
+        try:
+            for i in range(job['num_frames']):
+                store.put(i, self.router.txt2img(job['prompt'], job['negative_prompt'], job['width'],
+                                                 job['height'], job['steps']))
+        except BaseException:
+            store.close()
+            raise
+        return store
+
+    def _load_folder(self, folder: str) -> FrameStore:
+        # Frames take the size of the first image, as convert_images_to_video does
+        paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if is_image(name)]
+        if not paths:
+            raise RuntimeError("No frames to encode")
+        with Image.open(paths[0]) as first:
+            width, height = first.size
+        store = self._new_store(len(paths), width, height)
+        try:
+            for i, path in enumerate(paths):
+                with open(path, 'rb') as f:
+                    store.put(i, f.read())
+        except BaseException:
+            store.close()
+            raise
+        return store
+
+
+def print_summary(results: Iterable[Dict[str, Any]], skipped: int, elapsed: float) -> None:
+    """Print a table of per-job timings"""
+    results = list(results)
+    print(f"\n{'job':<40} {'status':<8} {'generate':>9} {'encode':>8} {'total':>8}")
+    for result in results:
+        print(f"{result['id'][:40]:<40} {result['status']:<8} {result['generate_s']:>8.2f}s "
+              f"{result['encode_s']:>7.2f}s {result['total_s']:>7.2f}s")
+        if result['status'] != 'ok':
+            print(f"    {result['error']}")
+    failed = sum(result['status'] != 'ok' for result in results)
+    print(f"\n{len(results) - failed} done, {failed} failed, {skipped} skipped (already in checkpoint) "
+          f"in {elapsed:.1f}s")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='JSONL manifest of generation jobs, or a directory tree of image folders')
+    parser.add_argument('--output', '-o', default='output', help='directory for the videos (default: output)')
+    parser.add_argument('--workers', '-w', type=int, default=4, help='jobs rendered in parallel (default: 4)')
+    parser.add_argument('--checkpoint', help='checkpoint file (default: <output>/.checkpoint.jsonl)')
+    parser.add_argument('--summary', help='also write the per-job results as JSON to this file')
+    parser.add_argument('--fps', type=int, default=2, help='frames per second for image folder jobs (default: 2)')
+    parser.add_argument('--profiles', default='web',
+                        help='comma-separated encoding profiles from config.yaml to write per job (default: web)')
+    parser.add_argument('--config', default=os.getenv('APP_CONFIG', 'config.yaml'),
+                        help='config with the backends, encoding profiles and frame budget (default: config.yaml)')
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    available = load_profiles(config.get('encoding', {}).get('profiles'))
+    names = [name.strip() for name in args.profiles.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        parser.error(f"unknown profile(s) {', '.join(unknown) or '(none given)'}; "
+                     f"config.yaml has {', '.join(available)}")
+    store_settings = config.get('frame_store', {})
+    decode_mb = store_settings.get('decode_mb')
+    budget = MemoryBudget(store_settings.get('budget_mb', 512) * 1024 * 1024,
+                          decode_bytes=decode_mb * 1024 * 1024 if decode_mb is not None else None)
+
+    os.makedirs(args.output, exist_ok=True)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.output, '.checkpoint.jsonl'))
+
+    try:
+        if os.path.isdir(args.source):
+            jobs = find_image_folders(args.source, args.fps)
+            router = None
+        else:
+            jobs = load_manifest(args.source)
+            router = load_router(config)
+        runner = BatchRunner(args.output, checkpoint, router, profiles=[available[name] for name in names],
+                             fourcc=probe_fourcc(), budget=budget, spill_dir=store_settings.get('spill_dir'))
+        runner.check_outputs(jobs)
+    except ValueError as e:
+        parser.error(str(e))
+
+    pending = [job for job in jobs if job['id'] not in checkpoint.done]
+    print(f"{len(pending)} jobs to render ({len(jobs) - len(pending)} already done), {args.workers} workers")
+
+    started = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(runner.run, job) for job in pending]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{len(results)}/{len(pending)}] {result['id']}: {result['status']} ({result['total_s']:.2f}s)")
+
+    print_summary(results, len(jobs) - len(pending), time.perf_counter() - started)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if any(result['status'] != 'ok' for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Logins per second per dyno, and what a burst of logins does to other
+sessions
+
+Measures, against the demo user's bcrypt hash (cost 12):
+  password  - full logins (bcrypt) per second, as many at once as --clients
+  remembered - logins repeating a recently verified password
+  token     - sessions signed in from a session token (reloads, new tabs)
+  burst     - while --clients password logins are in flight, how long
+              another session's CPU-bound job (0.2 s on an idle machine,
+              like encoding a frame) takes:
+              bcrypt on every session's own thread (the old way, as
+              streamlit_authenticator does it) vs on the auth pool
+
+Usage:
+    python benchmarks/bench_auth.py --clients 16 --workers 2
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+import numpy as np
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import Authenticator  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rate(fn, count: int, clients: int) -> float:
+    """Calls per second of fn, with this many callers at once"""
+    with ThreadPoolExecutor(max_workers=clients) as callers:
+        start = time.perf_counter()
+        list(callers.map(lambda _: fn(), range(count)))
+        return count / (time.perf_counter() - start)
+
+
+def work(units: int) -> None:
+    total = 0
+    for value in range(units):
+        total += value
+
+
+def calibrate(seconds: float) -> int:
+    """Loop iterations taking about this long on an idle machine"""
+    units = 100_000
+    start = time.perf_counter()
+    work(units)
+    return int(units * seconds / (time.perf_counter() - start))
+
+
+def probe(units: int, stop: threading.Event, jobs: list) -> None:
+    """Another session's script thread: CPU-bound jobs back to back, recording how long each took"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        work(units)
+        jobs.append(time.perf_counter() - start)
+
+
+def burst(login, clients: int, units: int) -> dict:
+    stop = threading.Event()
+    jobs = []
+    thread = threading.Thread(target=probe, args=(units, stop, jobs))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as sessions:
+        thread.start()
+        list(sessions.map(lambda _: login(), range(clients)))
+    seconds = time.perf_counter() - start
+    stop.set()
+    thread.join()
+    during = np.array(jobs[:-1] or jobs)  # the last job may have finished after the burst
+    return {
+        'logins': clients,
+        'seconds': round(seconds, 2),
+        'other_session_job_seconds': round(float(np.median(during)), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, default=16, help='logins in flight at once')
+    parser.add_argument('--workers', type=int, default=2, help='auth pool size')
+    parser.add_argument('--count', type=int, default=32, help='password logins to time')
+    args = parser.parse_args()
+
+    with open(os.path.join(REPO_ROOT, 'config.yaml')) as f:
+        config = yaml.safe_load(f)
+    config['cookie']['key'] = 'bench'
+    auth = Authenticator.from_config(config, max_workers=args.workers)
+    cold = Authenticator.from_config(config, max_workers=args.workers, remember_seconds=0)
+    assert cold.login('demo', 'abc123').result() is not None, "config.yaml demo hash must match 'abc123'"
+
+    demo_hash = config['credentials']['usernames']['demo']['password'].encode()
+    token = auth.issue_token('demo')
+    auth.login('demo', 'abc123').result()
+    units = calibrate(0.2)
+
+    print(json.dumps({
+        'cpus': os.cpu_count(),
+        'auth_workers': args.workers,
+        'logins_per_second': {
+            'password': round(rate(lambda: cold.login('demo', 'abc123').result(), args.count, args.clients), 2),
+            'remembered': round(rate(lambda: auth.login('demo', 'abc123').result(), 20_000, 1)),
+            'token': round(rate(lambda: auth.user_from_token(token), 20_000, 1)),
+        },
+        'burst': {
+            'on_session_threads': burst(lambda: bcrypt.checkpw(b'abc123', demo_hash), args.clients, units),
+            'on_auth_pool': burst(lambda: cold.login('demo', 'abc123').result(), args.clients, units),
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
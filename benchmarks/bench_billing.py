@@ -0,0 +1,126 @@
+"""
+Run BillingManager against the local Stripe stub with the real stripe client
+
+Reports, as JSON, what the Streamlit render path pays for billing and how
+many Stripe calls it causes:
+
+  checkout  - repeated "Upgrade" clicks of one user (and of several users):
+              time until request_checkout returns, checkout sessions created
+  tier      - get_tier on a cold cache (waits for Stripe once), a warm cache,
+              an expired entry (served stale while refreshed), and reruns
+              during an outage where Stripe fails fast or hangs: the slowest
+              rerun and the Stripe calls made during the back-off
+
+Usage:
+    python benchmarks/bench_billing.py --latency 0.2 --reruns 40
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import stripe
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from billing import BillingManager  # noqa: E402
+from stripe_stub import StripeStub  # noqa: E402
+
+PRICES = {'basic': 'price_basic', 'pro': 'price_pro'}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def reruns(manager: BillingManager, stub: StripeStub, username: str, count: int, interval: float) -> dict:
+    """get_tier once per simulated rerun; latency of each and Stripe requests made meanwhile"""
+    requests = stub.requests
+    seconds = []
+    tiers = set()
+    for _ in range(count):
+        tier, elapsed = timed(lambda: manager.get_tier(username))
+        tiers.add(tier)
+        seconds.append(elapsed)
+        time.sleep(interval)
+    return {
+        'reruns': count,
+        'first_ms': round(seconds[0] * 1000, 1),
+        'p50_ms': round(statistics.median(seconds) * 1000, 3),
+        'max_after_first_ms': round(max(seconds[1:]) * 1000, 3),
+        'stripe_requests': stub.requests - requests,
+        'tiers': sorted(tiers),
+    }
+
+
+def checkout(manager: BillingManager, stub: StripeStub, clicks: int, users: int, prefix: str) -> dict:
+    created = stub.calls['checkout.sessions.create']
+    returns = []
+    futures = []
+    for click in range(clicks):
+        future, elapsed = timed(lambda: manager.request_checkout(f'{prefix}{click % users}', 'pro',
+                                                                 'http://app/success', 'http://app/cancel'))
+        returns.append(elapsed)
+        futures.append(future)
+    sessions = {future.result()['id'] for future in futures}
+    return {
+        'clicks': clicks,
+        'users': users,
+        'request_max_ms': round(max(returns) * 1000, 3),
+        'sessions_created': stub.calls['checkout.sessions.create'] - created,
+        'distinct_sessions': len(sessions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds per Stripe request (default: 0.2)')
+    parser.add_argument('--reruns', type=int, default=40, help='simulated reruns per scenario (default: 40)')
+    parser.add_argument('--interval', type=float, default=0.05, help='seconds between reruns (default: 0.05)')
+    parser.add_argument('--lookup-timeout', type=float, default=2.0)
+    parser.add_argument('--backoff', type=float, default=30.0)
+    args = parser.parse_args()
+
+    stub = StripeStub(args.latency, {'paying': PRICES['pro']})
+    server = stub.serve()
+    stripe.api_key = 'sk_test_stub'
+    stripe.api_base = 'http://%s:%d' % server.server_address
+
+    tier_ttl = args.reruns * args.interval + 0.5  # outlives one scenario
+    manager = BillingManager(stripe, PRICES, tier_ttl=tier_ttl, lookup_timeout=args.lookup_timeout,
+                             failure_backoff=args.backoff)
+    report = {
+        'stripe_latency_s': args.latency,
+        'checkout': {
+            'one_user': checkout(manager, stub, 20, 1, 'clicker'),
+            'five_users': checkout(manager, stub, 20, 5, 'buyer'),
+        },
+        'tier': {
+            'cold_then_cached': reruns(manager, stub, 'paying', args.reruns, args.interval),
+        },
+    }
+    time.sleep(tier_ttl)
+    report['tier']['expired'] = reruns(manager, stub, 'paying', args.reruns, args.interval)
+
+    # Outage: Stripe answers HTTP 500
+    stub.down = True
+    time.sleep(tier_ttl)
+    report['tier']['outage_known_user'] = reruns(manager, stub, 'paying', args.reruns, args.interval)
+    report['tier']['outage_new_user'] = reruns(manager, stub, 'newcomer', args.reruns, args.interval)
+
+    # Slow outage: Stripe hangs far longer than lookup_timeout
+    stub.down = False
+    stub.latency = 4 * args.lookup_timeout
+    report['tier']['hanging_new_user'] = reruns(manager, stub, 'hung', args.reruns, args.interval)
+
+    print(json.dumps(report, indent=2))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
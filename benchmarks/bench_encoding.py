@@ -0,0 +1,105 @@
+"""
+Output size and encode time per encoding profile
+
+Encodes the same frames with:
+  opencv       - ImageToVideoConverter.convert_frames_to_video, the probed OpenCV codec
+  web          - the 'web' profile from config.yaml alone
+  web+master   - both profiles from one pass over the frames
+and reports file size, bitrate and wall time for each rendition, plus the
+time of a single pass against encoding the two profiles one after another.
+
+Frames are synthetic but photo-like (smooth gradients plus blurred noise) and
+differ from one another the way generated frames do.
+
+Usage:
+    python benchmarks/bench_encoding.py --frames 8 --size 1024 --fps 2
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from encoding import find_ffmpeg, load_profiles  # noqa: E402
+from image_to_video import ImageToVideoConverter, probe_fourcc  # noqa: E402
+
+
+def make_frame(size: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    base = np.stack([x, y, 1 - x * y], axis=-1) * 200
+    noise = cv2.GaussianBlur(rng.normal(0, 40, (size, size, 3)).astype(np.float32), (0, 0), 3)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def describe(name: str, path: str, seconds: float, duration: float, resolution: str) -> dict:
+    size = os.path.getsize(path)
+    return {
+        'rendition': name,
+        'resolution': resolution,
+        'size_kib': round(size / 1024, 1),
+        'bitrate_kbps': round(size * 8 / duration / 1000, 1),
+        'seconds': round(seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=8)
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--fps', type=int, default=2)
+    parser.add_argument('--config', default='config.yaml')
+    args = parser.parse_args()
+
+    with open(args.config) as file:
+        profiles = load_profiles(((yaml.safe_load(file) or {}).get('encoding') or {}).get('profiles'))
+    frames = [make_frame(args.size, seed) for seed in range(args.frames)]
+    duration = args.frames / args.fps
+    resolution = f"{args.size}x{args.size}"
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fourcc = probe_fourcc()
+        path = os.path.join(tmp_dir, 'opencv.mp4')
+        started = time.perf_counter()
+        ImageToVideoConverter(path, args.fps, fourcc).convert_frames_to_video(frames)
+        results.append(dict(describe(f'opencv ({fourcc})', path, time.perf_counter() - started, duration,
+                                     resolution), scenario='opencv'))
+
+        separate = 0.0
+        for name in ('web', 'master'):
+            converter = ImageToVideoConverter(os.path.join(tmp_dir, 'alone.mp4'), args.fps, fourcc)
+            started = time.perf_counter()
+            converter.convert_frames_to_profiles(frames, [profiles[name]])
+            separate += time.perf_counter() - started
+
+        converter = ImageToVideoConverter(os.path.join(tmp_dir, 'both.mp4'), args.fps, fourcc)
+        started = time.perf_counter()
+        videos = converter.convert_frames_to_profiles(frames, [profiles['web'], profiles['master']])
+        single_pass = time.perf_counter() - started
+        for name, video in videos.items():
+            results.append(dict(describe(name, video['path'], video['seconds'], duration, video['resolution']),
+                                scenario='web+master', encoder=video['encoder']))
+
+    opencv, web = results[0], results[1]
+    print(json.dumps({
+        'frames': args.frames,
+        'frame_size': args.size,
+        'fps': args.fps,
+        'ffmpeg': find_ffmpeg(),
+        'results': results,
+        'web_size_vs_opencv': round(web['size_kib'] / opencv['size_kib'], 3),
+        'two_profiles_single_pass_s': round(single_pass, 3),
+        'two_profiles_separate_passes_s': round(separate, 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
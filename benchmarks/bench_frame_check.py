@@ -0,0 +1,169 @@
+"""
+Accuracy and cost of frame validation (frame_check.py), and the full-job
+regenerations it avoids
+
+Frames are synthetic but photo-like (random shapes, gradients and texture);
+bad frames are the kinds backends actually return: solid or near-solid black
+(WebUI safety checker), white and gray placeholders, heavily blurred frames
+(Stability content filter) and re-encoded duplicates. Reported:
+
+  accuracy  - good frames wrongly rejected, and bad frames caught by kind
+  cost      - milliseconds to check a frame, one by one and in batches
+  jobs      - simulated jobs where each backend answer is bad with some
+              probability: without validation any bad frame makes the user
+              regenerate the whole job, with it only the bad frames are
+              requested again; backend calls per finished job for both
+
+Usage:
+    python benchmarks/bench_frame_check.py --size 1024 --bad-rate 0.05
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_check import FrameValidator  # noqa: E402
+
+
+def make_frame(size: int, seed: int) -> np.ndarray:
+    """A photo-like frame: a lit background with random shapes and grain"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    colors = rng.uniform(30, 220, (2, 3)).astype(np.float32)
+    frame = colors[0] * (1 - y[..., None]) + colors[1] * y[..., None] + 20 * np.sin(6 * x)[..., None]
+    for _ in range(rng.integers(6, 20)):
+        color = tuple(float(c) for c in rng.uniform(0, 255, 3))
+        center = tuple(int(c) for c in rng.integers(0, size, 2))
+        if rng.random() < 0.5:
+            cv2.circle(frame, center, int(rng.integers(size // 20, size // 4)), color, -1, cv2.LINE_AA)
+        else:
+            corner = tuple(int(c) for c in rng.integers(0, size, 2))
+            cv2.rectangle(frame, center, corner, color, -1)
+    frame = cv2.GaussianBlur(frame, (0, 0), size / 512)
+    frame += cv2.GaussianBlur(rng.normal(0, 12, frame.shape).astype(np.float32), (0, 0), 1)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def make_sky(size: int, seed: int) -> np.ndarray:
+    """A nearly featureless but legitimate frame: clear sky with a faint horizon"""
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, size, dtype=np.float32)[:, None, None]
+    top, bottom = rng.uniform(60, 140, 3), rng.uniform(160, 240, 3)
+    frame = top * (1 - y) + bottom * y + np.zeros((size, size, 3), np.float32)
+    frame[int(size * 0.8):] -= 25
+    frame += rng.normal(0, 2, frame.shape)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def bad_frames(good: np.ndarray, size: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    jpeg = cv2.imdecode(cv2.imencode('.jpg', good, [cv2.IMWRITE_JPEG_QUALITY, 60])[1], cv2.IMREAD_UNCHANGED)
+    return {
+        'black': np.zeros_like(good),
+        'near_black': rng.integers(0, 6, good.shape, dtype=np.uint8),
+        'white': np.full_like(good, 255),
+        'gray': np.full_like(good, int(rng.integers(60, 200))),
+        'blurred': cv2.GaussianBlur(good, (0, 0), size / 24),
+        'duplicate': jpeg,
+    }
+
+
+def accuracy(validator: FrameValidator, size: int, count: int) -> dict:
+    rejected_good = 0
+    caught = {}
+    for seed in range(count):
+        good, other = make_frame(size, seed), make_frame(size, 10_000 + seed)
+        sky = make_sky(size, seed)
+        reasons = validator.problems([good, other, sky])
+        rejected_good += sum(reason is not None for reason in reasons)
+        job = validator.job()
+        job.check(0, good)
+        for kind, frame in bad_frames(good, size, seed).items():
+            caught.setdefault(kind, 0)
+            caught[kind] += job.check(1, frame) is not None
+    return {
+        'good_frames': 3 * count,
+        'false_rejections': rejected_good,
+        'caught': {kind: f'{value}/{count}' for kind, value in caught.items()},
+    }
+
+
+def cost(validator: FrameValidator, size: int, repeat: int = 20) -> dict:
+    frames = [make_frame(size, seed) for seed in range(8)]
+    job = validator.job()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for index, frame in enumerate(frames):
+            job.check(index, frame)
+    single = (time.perf_counter() - start) / (repeat * len(frames))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        validator.problems(frames)
+    batch = (time.perf_counter() - start) / (repeat * len(frames))
+    return {'ms_per_frame': round(single * 1000, 3), 'ms_per_frame_batch_of_8': round(batch * 1000, 3)}
+
+
+def jobs(bad_rate: float, frames: int, count: int, retries: int, seed: int = 0, size: int = 128) -> dict:
+    """Backend calls per finished job, without and with per-frame validation"""
+    rng = np.random.default_rng(seed)
+    calls_without = 0
+    for _ in range(count):
+        while True:  # the user regenerates the whole job until no frame is bad
+            calls_without += frames
+            if not (rng.random(frames) < bad_rate).any():
+                break
+
+    # Real checks on small frames: a pool of distinct good frames and a black one
+    pool = [make_frame(size, seed) for seed in range(4 * frames)]
+    black = np.zeros_like(pool[0])
+    validator = FrameValidator(retries=retries)
+    calls_with = 0
+    for _ in range(count):
+        job = validator.job()
+        answers = iter(rng.permutation(len(pool)))
+        for index in range(frames):
+            for attempt in range(retries + 1):
+                calls_with += 1
+                frame = black if rng.random() < bad_rate else pool[next(answers)]
+                if job.check(index, frame) is None:
+                    break
+        job.finish(True)
+    stats = validator.stats()
+    return {
+        'bad_rate': bad_rate,
+        'frames_per_job': frames,
+        'backend_calls_per_job_without': round(calls_without / count, 2),
+        'backend_calls_per_job_with': round(calls_with / count, 2),
+        'full_regenerations_without': round(calls_without / frames) - count,
+        'full_regenerations_avoided': stats['jobs_saved'],
+        'jobs_kept_with_bad_frames': stats['jobs_kept_bad'],
+        'false_rejections': stats['rejected']['duplicate'] + stats['rejected']['blurred'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--count', type=int, default=50, help='frames per accuracy case')
+    parser.add_argument('--frames', type=int, default=8, help='frames per simulated job')
+    parser.add_argument('--jobs', type=int, default=2000, help='simulated jobs')
+    parser.add_argument('--bad-rate', type=float, default=0.05, help='share of bad backend answers')
+    args = parser.parse_args()
+
+    validator = FrameValidator()
+    print(json.dumps({
+        'size': args.size,
+        'accuracy': accuracy(validator, args.size, args.count),
+        'cost': cost(validator, args.size),
+        'jobs': jobs(args.bad_rate, args.frames, args.jobs, validator.retries),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Peak memory of many concurrent jobs holding their frames
+
+Simulates N jobs at once, each decoding its frames from PNG, holding all of
+them (as the app does until encoding) and then reading them back as the
+encoder would. A sampler thread records peak RSS while they run.
+
+--mode store uses FrameStore under a MemoryBudget and fails (exit code 1)
+if anonymous memory grows by more than the budget, which covers the decode
+buffers as well as the frames. --mode pil keeps a PIL Image per frame like
+the app used to, for comparison.
+
+Anonymous RSS is what the budget bounds; spilled frames live in the page
+cache, which the kernel can reclaim, so they are reported separately.
+
+Runs with MALLOC_MMAP_THRESHOLD_ set as in the Procfile (the script re-execs
+itself if it is missing): without it glibc raises its mmap threshold after
+the first freed frame buffer and keeps later ones in per-thread arenas.
+
+Usage:
+    python benchmarks/bench_frame_store.py --jobs 20 --budget-mb 128
+    python benchmarks/bench_frame_store.py --jobs 20 --mode pil
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_store import FrameStore, MemoryBudget  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def read_rss() -> dict:
+    """Current resident memory split into anonymous and file-backed, in bytes"""
+    values = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in ('VmRSS', 'RssAnon', 'RssFile'):
+                values[key] = int(rest.split()[0]) * 1024
+    return values
+
+
+class Sampler(threading.Thread):
+    def __init__(self, interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = {'VmRSS': 0, 'RssAnon': 0, 'RssFile': 0}
+        self.running = True
+
+    def run(self):
+        while self.running:
+            for key, value in read_rss().items():
+                self.peak[key] = max(self.peak[key], value)
+            time.sleep(self.interval)
+
+
+def make_png(size: int, seed: int) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (size, size, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def job_store(frames_png, size, budget, barrier, checksums):
+    with FrameStore(len(frames_png), size, size, budget=budget) as store:
+        for index, png in enumerate(frames_png):
+            store.put(index, png)
+        barrier.wait()  # every job holds all of its frames at the same time
+        checksums.append(sum(int(frame[::64, ::64].sum()) for frame in store))
+
+
+def job_pil(frames_png, size, budget, barrier, checksums):
+    images = [Image.open(io.BytesIO(png)).convert('RGB') for png in frames_png]
+    for image in images:
+        image.load()
+    barrier.wait()
+    checksums.append(sum(int(np.asarray(image)[::64, ::64].sum()) for image in images))
+
+
+def main():
+    if 'MALLOC_MMAP_THRESHOLD_' not in os.environ:
+        env = dict(os.environ, MALLOC_MMAP_THRESHOLD_='131072')
+        os.execve(sys.executable, [sys.executable] + sys.argv, env)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--frames', type=int, default=8)
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--budget-mb', type=int, default=128)
+    parser.add_argument('--mode', choices=('store', 'pil'), default='store')
+    args = parser.parse_args()
+
+    frames_png = [make_png(args.size, seed) for seed in range(args.frames)]
+    frame_bytes = args.size * args.size * 3
+    budget = MemoryBudget(args.budget_mb * MB)
+    job = job_store if args.mode == 'store' else job_pil
+
+    gc.collect()
+    baseline = read_rss()
+    sampler = Sampler()
+    sampler.start()
+
+    barrier = threading.Barrier(args.jobs)
+    checksums = []
+    threads = [threading.Thread(target=job, args=(frames_png, args.size, budget, barrier, checksums))
+               for _ in range(args.jobs)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    sampler.running = False
+    sampler.join()
+
+    anon_growth = sampler.peak['RssAnon'] - baseline['RssAnon']
+    report = {
+        'mode': args.mode,
+        'jobs': args.jobs,
+        'frames_per_job': args.frames,
+        'frame_data_mb': round(args.jobs * args.frames * frame_bytes / MB, 1),
+        'budget_mb': args.budget_mb if args.mode == 'store' else None,
+        'peak_rss_growth_mb': round((sampler.peak['VmRSS'] - baseline['VmRSS']) / MB, 1),
+        'peak_anon_growth_mb': round(anon_growth / MB, 1),
+        'peak_file_growth_mb': round((sampler.peak['RssFile'] - baseline['RssFile']) / MB, 1),
+        'stores_spilled': budget.spills,
+        'budget_peak_mb': round(budget.peak_bytes / MB, 1),
+        'decode_waits': budget.decode_waits,
+        'elapsed_s': round(elapsed, 2),
+        'jobs_completed': len(checksums),
+    }
+    if args.mode == 'store':
+        report['within_budget'] = anon_growth <= args.budget_mb * MB
+    print(json.dumps(report, indent=2))
+    if args.mode == 'store' and not report['within_budget'] or len(checksums) != args.jobs:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
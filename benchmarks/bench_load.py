@@ -0,0 +1,399 @@
+"""
+Load test: how many concurrent users one dyno can hold
+
+Each concurrency level runs in a fresh interpreter that stands in for one
+dyno (the Procfile runs one Streamlit process per dyno, with the same
+MALLOC_MMAP_THRESHOLD_). Inside it, N simulated users run the real
+app_with_auth.py script through Streamlit's AppTest, one ScriptRunner thread
+per session as the Streamlit server does. Each journey is a new visitor who
+  1. loads the page,
+  2. logs in as the demo user,
+  3. generates a video (a seeded share ask for the high-quality master),
+  4. downloads it from the media file manager, as the browser would.
+Users pause for a seeded, exponentially distributed think time between
+journeys. Image generation goes to fake_backend.FakeWebUI, which runs in the
+parent process so its CPU and memory do not count against the dyno.
+
+Reported per level: journey throughput, latency percentiles per step, peak
+RSS of the dyno (including its ffmpeg children) and CPU seconds and cores
+used. The capacity summary is the largest level whose peak RSS fits the dyno
+memory and whose journey p95 meets --slo. Everything random is seeded, so two
+runs with the same arguments on the same machine do the same work.
+
+Not measured: the websocket transport and browser; AppTest parses the
+ForwardMsgs in-process instead.
+
+Usage:
+    python benchmarks/bench_load.py --users 1,4,8,16 --journeys 3 --output load.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import numpy as np
+import yaml
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+MB = 1024 * 1024
+STEPS = ('page_load', 'login', 'generate', 'download', 'journey')
+
+
+def read_rss(pid: str = 'self') -> int:
+    """Resident memory of a process in bytes (0 if it is gone)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def child_pids() -> List[str]:
+    """PIDs of this process's children (the ffmpeg encoders)"""
+    pids = []
+    for task in os.listdir('/proc/self/task'):
+        try:
+            with open(f'/proc/self/task/{task}/children') as f:
+                pids.extend(f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+class Sampler(threading.Thread):
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_rss = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            rss = read_rss() + sum(read_rss(pid) for pid in child_pids())
+            self.peak_rss = max(self.peak_rss, rss)
+            time.sleep(self.interval)
+
+
+def cpu_seconds() -> float:
+    """CPU time of this process and its reaped children"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def percentiles(samples: List[float]) -> Optional[Dict[str, float]]:
+    if not samples:
+        return None
+    values = np.asarray(samples)
+    summary = {f'p{q}': float(np.percentile(values, q)) for q in (50, 90, 95, 99)}
+    summary.update(mean=float(values.mean()), max=float(values.max()), count=len(samples))
+    return {key: round(value, 3) if key != 'count' else value for key, value in summary.items()}
+
+
+# ---------------------------------------------------------------------------
+# Dyno side: runs in the child interpreter
+
+
+def install_runtime():
+    """
+    Share one mock Streamlit runtime between all sessions of this process
+
+    AppTest installs a fresh mock runtime for every run and removes it
+    afterwards, every LocalScriptRunner uses the same session id, and each
+    one compiles the script again (concurrent compile() calls can fail on
+    CPython 3.11 with "AST constructor recursion depth mismatch"). So
+    concurrent AppTests would break each other. A real server has one
+    runtime, one script cache and one id per session; this recreates that.
+    Relies on streamlit 1.31 internals (pinned in requirements.txt).
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import AppTest
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    storage = MemoryMediaFileStorage('/mock/media')
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(storage)
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    script_cache = ScriptCache()
+
+    class SessionTest(AppTest):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.session_id = str(uuid.uuid4())
+
+        def _run(self, widget_state=None, timeout=None):
+            runner = LocalScriptRunner(self._script_path, self.session_state)
+            runner._session_id = self.session_id
+            runner._script_cache = script_cache
+            self._tree = runner.run(widget_state, self.query_params, timeout or self.default_timeout)
+            self._tree._runner = self
+            return self
+
+        def end(self):
+            """What the server does when the browser tab goes away"""
+            runtime.media_file_mgr.clear_session_refs(self.session_id)
+            runtime.media_file_mgr.remove_orphaned_files()
+
+    def fetch(url: str) -> bytes:
+        return storage.get_file(url.rsplit('/', 1)[-1]).content
+
+    return SessionTest, fetch
+
+
+class Journey:
+    def __init__(self, session_test, fetch, args, rng: random.Random, label: str):
+        self.session_test = session_test
+        self.fetch = fetch
+        self.args = args
+        self.rng = rng
+        self.label = label
+        self.timings: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self.bytes_downloaded = 0
+
+    def _step(self, name: str, action) -> None:
+        started = time.perf_counter()
+        at = action()
+        self.timings[name] = time.perf_counter() - started
+        if at.exception:
+            raise RuntimeError(f"{name}: {at.exception[0].value}")
+        errors = [error.value for error in at.error]
+        if errors:
+            raise RuntimeError(f"{name}: {errors[0]}")
+
+    def run(self) -> 'Journey':
+        script = os.path.join(REPO_ROOT, 'app_with_auth.py')
+        at = self.session_test(script, default_timeout=self.args.timeout)
+        started = time.perf_counter()
+        try:
+            self._step('page_load', at.run)
+            at.text_input[0].input('demo')
+            at.text_input[1].input('abc123')
+            self._step('login', lambda: at.button[0].click().run())
+
+            at.sidebar.slider[0].set_value(self.args.frames)
+            at.sidebar.select_slider[0].set_value(self.args.size)
+            at.sidebar.select_slider[1].set_value(self.args.size)
+            high_quality = self.rng.random() < self.args.hq_share
+            if high_quality:
+                at.sidebar.checkbox[0].check()
+            at.text_area[0].input(self.prompt())
+            generate = next(button for button in at.button if button.label == 'Generate Video')
+            self._step('generate', lambda: generate.click().run())
+
+            element = 'download_button' if high_quality else 'video'
+            urls = [item.proto.url for item in at.get(element)]
+            if not urls:
+                raise RuntimeError(f"generate: no {element} on the page")
+            download_started = time.perf_counter()
+            self.bytes_downloaded = len(self.fetch(urls[0]))
+            self.timings['download'] = time.perf_counter() - download_started
+            self.timings['journey'] = time.perf_counter() - started
+        except Exception as e:
+            self.error = str(e)[:200]
+        finally:
+            at.end()
+        return self
+
+    def prompt(self) -> str:
+        if self.args.prompt_pool:
+            return f"load test prompt {self.rng.randrange(self.args.prompt_pool)}"
+        # One word: normalization sorts words, so "0-1" and "1-0" would be the same cached prompt
+        return f"load test prompt journey_{self.label.replace('-', '_')}"
+
+
+def run_dyno(args) -> dict:
+    """Run one concurrency level in this process and return its report"""
+    sys.path.insert(0, REPO_ROOT)
+    session_test, fetch = install_runtime()
+
+    for index in range(args.warmup):
+        journey = Journey(session_test, fetch, args, random.Random(f"{args.seed}-warmup-{index}"), f"w{index}")
+        if journey.run().error:
+            raise SystemExit(f"warm-up journey failed: {journey.error}")
+
+    baseline_rss = read_rss()
+    sampler = Sampler()
+    sampler.start()
+    journeys: List[Journey] = []
+    lock = threading.Lock()
+
+    def user(index: int) -> None:
+        rng = random.Random(f"{args.seed}-{index}")
+        time.sleep(index * args.ramp / max(args.users, 1))
+        for number in range(args.journeys):
+            journey = Journey(session_test, fetch, args, rng, f"{index}-{number}").run()
+            with lock:
+                journeys.append(journey)
+            if args.think and number + 1 < args.journeys:
+                time.sleep(rng.expovariate(1 / args.think))
+
+    cpu_started = cpu_seconds()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(index,), name=f'user-{index}') for index in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    cpu = cpu_seconds() - cpu_started
+    sampler.running = False
+    sampler.join()
+
+    ok = [journey for journey in journeys if journey.error is None]
+    failed = [journey for journey in journeys if journey.error is not None]
+    return {
+        'users': args.users,
+        'journeys_ok': len(ok),
+        'journeys_failed': len(failed),
+        'errors': sorted({journey.error for journey in failed})[:5],
+        'elapsed_s': round(elapsed, 2),
+        'throughput_journeys_per_min': round(len(ok) / elapsed * 60, 2),
+        'frames_per_min': round(len(ok) * args.frames / elapsed * 60, 2),
+        'latency_s': {step: percentiles([journey.timings[step] for journey in ok if step in journey.timings])
+                      for step in STEPS},
+        'downloaded_mb': round(sum(journey.bytes_downloaded for journey in ok) / MB, 2),
+        'memory_mb': {
+            'baseline_rss': round(baseline_rss / MB, 1),
+            'peak_rss': round(sampler.peak_rss / MB, 1),
+            'peak_growth_per_user': round((sampler.peak_rss - baseline_rss) / MB / args.users, 1),
+        },
+        'cpu': {
+            'seconds': round(cpu, 2),
+            'cores_used': round(cpu / elapsed, 2),
+            'seconds_per_journey': round(cpu / len(ok), 3) if ok else None,
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Driver side: starts the fake backend and one dyno process per level
+
+
+def write_config(base_path: str, backend_url: str, dest: str, cache_dir: str) -> None:
+    with open(base_path) as f:
+        config = yaml.safe_load(f) or {}
+    config['backends'] = [{'name': 'fake-webui', 'kind': 'webui', 'url': backend_url,
+                           'capabilities': ['txt2img', 'progress']}]
+    # Each level starts with an empty frame cache and prompt index, or it would replay earlier levels' frames
+    config['prompt_cache'] = dict(config.get('prompt_cache') or {}, dir=cache_dir)
+    with open(dest, 'w') as f:
+        yaml.safe_dump(config, f)
+
+
+def git_revision() -> Optional[str]:
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', default='1,4,8', help='comma-separated concurrency levels (default: 1,4,8)')
+    parser.add_argument('--journeys', type=int, default=2, help='journeys per user (default: 2)')
+    parser.add_argument('--frames', type=int, default=4, help='frames per video, 4-8 (default: 4)')
+    parser.add_argument('--size', type=int, default=1024, choices=(512, 768, 1024), help='frame size (default: 1024)')
+    parser.add_argument('--hq-share', type=float, default=0.25,
+                        help='share of journeys asking for the high-quality master (default: 0.25)')
+    parser.add_argument('--prompt-pool', type=int, default=0,
+                        help='draw prompts from this many distinct ones (default: 0, every prompt unique)')
+    parser.add_argument('--think', type=float, default=1.0, help='mean think time between journeys, s (default: 1)')
+    parser.add_argument('--ramp', type=float, default=2.0, help='seconds over which users start (default: 2)')
+    parser.add_argument('--warmup', type=int, default=1, help='unmeasured journeys per dyno first (default: 1)')
+    parser.add_argument('--backend-delay', type=float, default=0.5, help='fake txt2img seconds (default: 0.5)')
+    parser.add_argument('--backend-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=300, help='seconds allowed per script run')
+    parser.add_argument('--dyno-memory-mb', type=int, default=512, help='dyno memory quota (default: 512)')
+    parser.add_argument('--slo', type=float, default=30.0, help='journey p95 target in seconds (default: 30)')
+    parser.add_argument('--config', default=os.path.join(REPO_ROOT, 'config.yaml'))
+    parser.add_argument('--output', help='also write the report to this file')
+    parser.add_argument('--dyno', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.dyno:
+        args.users = int(args.users)
+        print(json.dumps(run_dyno(args)))
+        return
+
+    sys.path.insert(0, BENCH_DIR)
+    from fake_backend import FakeWebUI
+
+    levels = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for level_number, users in enumerate(int(value) for value in args.users.split(',')):
+            fake = FakeWebUI(args.backend_delay, args.backend_error_rate, seed=args.seed)
+            server = fake.serve()
+            config_path = os.path.join(tmp_dir, 'config.yaml')
+            write_config(args.config, f"http://127.0.0.1:{server.server_address[1]}", config_path,
+                         os.path.join(tmp_dir, f'cache-{level_number}'))
+            env = dict(os.environ, APP_CONFIG=config_path, MALLOC_MMAP_THRESHOLD_='131072', DEBUG='')
+            env.pop('STRIPE_SECRET_KEY', None)
+
+            command = [sys.executable, os.path.abspath(__file__), '--dyno', '--users', str(users)]
+            for name, value in vars(args).items():
+                if name not in ('users', 'dyno', 'output', 'config') and value is not None:
+                    command += [f"--{name.replace('_', '-')}", str(value)]
+            result = subprocess.run(command, env=env, capture_output=True, text=True, cwd=tmp_dir)
+            server.shutdown()
+            if result.returncode != 0:
+                sys.stderr.write(result.stderr[-4000:])
+                raise SystemExit(f"dyno with {users} users failed")
+
+            level = json.loads(result.stdout.strip().splitlines()[-1])
+            level['backend_calls'] = fake.calls
+            levels.append(level)
+            print(f"{users} users: {level['throughput_journeys_per_min']} journeys/min, "
+                  f"journey p95 {(level['latency_s']['journey'] or {}).get('p95')} s, "
+                  f"peak RSS {level['memory_mb']['peak_rss']} MB", file=sys.stderr)
+
+    def fits(level):
+        journey = level['latency_s']['journey']
+        return (level['journeys_failed'] == 0 and journey is not None and journey['p95'] <= args.slo
+                and level['memory_mb']['peak_rss'] <= args.dyno_memory_mb)
+
+    import streamlit
+    report = {
+        'parameters': {name: value for name, value in vars(args).items() if name not in ('dyno', 'output')},
+        'environment': {
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'streamlit': streamlit.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'levels': levels,
+        'capacity': {
+            'dyno_memory_mb': args.dyno_memory_mb,
+            'journey_p95_slo_s': args.slo,
+            'max_users_per_dyno': max((level['users'] for level in levels if fits(level)), default=0),
+        },
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
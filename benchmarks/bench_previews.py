@@ -0,0 +1,107 @@
+"""
+Bytes sent to the browser and server CPU per job for in-page frame display
+
+Runs Streamlit's own st.image conversion (image_to_url) and records the
+bytes it would serve, for:
+  before  - every full-size frame passed to st.image as a PIL Image
+  after   - one JPEG thumbnail per frame plus a contact sheet (previews.py)
+
+Frames are synthetic but photo-like (smooth gradients plus blurred noise) so
+JPEG sizes are realistic.
+
+Usage:
+    python benchmarks/bench_previews.py --frames 8 --size 1024
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+from streamlit.elements import image as st_image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from previews import JobPreviews  # noqa: E402
+
+sent = []
+_ensure_image_size_and_format = st_image._ensure_image_size_and_format
+
+
+def _record(image_data, width, image_format):
+    data = _ensure_image_size_and_format(image_data, width, image_format)
+    sent.append(len(data))
+    return data
+
+
+st_image._ensure_image_size_and_format = _record
+
+
+def make_frame(size: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    base = np.stack([x, y, 1 - x * y], axis=-1) * 200
+    noise = cv2.GaussianBlur(rng.normal(0, 40, (size, size, 3)).astype(np.float32), (0, 0), 3)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def show(image) -> None:
+    """What st.image(image) does on the server, minus the websocket"""
+    st_image.image_to_url(image, width=-1, clamp=False, channels='RGB', output_format='auto',
+                          image_id='bench')
+
+
+def run(name: str, frames, render) -> dict:
+    sent.clear()
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    render(frames)
+    return {
+        'scenario': name,
+        'images_sent': len(sent),
+        'bytes_sent': sum(sent),
+        'server_cpu_ms': round((time.process_time() - cpu) * 1000, 1),
+        'wall_ms': round((time.perf_counter() - wall) * 1000, 1),
+    }
+
+
+def render_before(frames):
+    for frame in frames:
+        show(Image.fromarray(frame))
+
+
+def render_after(frames):
+    previews = JobPreviews()
+    for index, frame in enumerate(frames):
+        show(previews.add(index, frame))
+    show(previews.contact_sheet())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=8)
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario; the fastest is reported')
+    args = parser.parse_args()
+
+    frames = [make_frame(args.size, seed) for seed in range(args.frames)]
+    results = []
+    for name, render in (('before', render_before), ('after', render_after)):
+        runs = [run(name, frames, render) for _ in range(args.repeat)]
+        results.append(min(runs, key=lambda result: result['server_cpu_ms']))
+
+    before, after = results
+    print(json.dumps({
+        'frames': args.frames,
+        'frame_size': args.size,
+        'results': results,
+        'bytes_reduction': round(1 - after['bytes_sent'] / before['bytes_sent'], 3),
+        'cpu_reduction': round(1 - after['server_cpu_ms'] / before['server_cpu_ms'], 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
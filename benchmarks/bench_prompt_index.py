@@ -0,0 +1,137 @@
+"""
+Lookup latency and match quality of the prompt index at scale
+
+Fills a PromptIndex with synthetic prompts (8-20 words drawn from a Zipf-
+distributed vocabulary, like real prompts that share "photo", "8k", ...),
+then times similar() for three kinds of queries:
+  normalized  - a stored prompt reshuffled, re-cased and re-punctuated
+  near        - a stored prompt with one word replaced
+  unrelated   - a fresh prompt that was never stored
+and reports latency percentiles, how often the source prompt is found, and
+the memory the index holds. The index is backed by a JSONL file as in the
+app, and the time to load it back (a dyno restart) is reported too.
+
+Usage:
+    python benchmarks/bench_prompt_index.py --prompts 100000 --queries 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_index import PromptIndex  # noqa: E402
+
+
+def vocabulary(size: int):
+    syllables = ['ka', 'lo', 'mi', 'ren', 'sa', 'tor', 'vel', 'dun', 'pe', 'qua', 'zin', 'hol']
+    rng = random.Random(1)
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+class PromptMaker:
+    def __init__(self, words, seed):
+        self.words = words
+        self.rng = random.Random(seed)
+        ranks = np.arange(1, len(words) + 1)
+        self.weights = (1 / ranks ** 1.1).tolist()
+
+    def prompt(self):
+        count = self.rng.randint(8, 20)
+        return ' '.join(self.rng.choices(self.words, self.weights, k=count))
+
+    def reformat(self, prompt):
+        words = prompt.split()
+        self.rng.shuffle(words)
+        return ',  '.join(word.upper() if self.rng.random() < 0.3 else word for word in words) + '!'
+
+    def replace_word(self, prompt):
+        words = prompt.split()
+        words[self.rng.randrange(len(words))] = self.rng.choice(self.words)
+        return ' '.join(words)
+
+
+def summarize(samples):
+    values = np.asarray(samples) * 1e6
+    return {f'p{q}_us': round(float(np.percentile(values, q)), 1) for q in (50, 90, 99)} | \
+        {'max_us': round(float(values.max()), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prompts', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--threshold', type=float, default=0.7)
+    args = parser.parse_args()
+
+    maker = PromptMaker(vocabulary(args.vocabulary), seed=0)
+    prompts = [maker.prompt() for _ in range(args.prompts)]
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    path = os.path.join(tmp_dir.name, 'prompts.jsonl')
+    started = time.perf_counter()
+    index = PromptIndex(path)
+    for number, prompt in enumerate(prompts):
+        index.add(prompt, '', width=1024, height=1024, video=f'output/video_{number}.mp4')
+    build = time.perf_counter() - started
+
+    del index
+    tracemalloc.start()
+    index = PromptIndex(path)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del index
+    started = time.perf_counter()
+    index = PromptIndex(path)
+    load = time.perf_counter() - started
+    arrays = index._signatures.nbytes + index._bands.nbytes + \
+        sum(array.nbytes for array in index._sorted_hashes + index._sorted_ids)
+
+    results = {}
+    rng = random.Random(2)
+    for kind in ('normalized', 'near', 'unrelated'):
+        timings, found, matched = [], 0, 0
+        for _ in range(args.queries):
+            source = rng.randrange(len(prompts))
+            if kind == 'normalized':
+                query = maker.reformat(prompts[source])
+            elif kind == 'near':
+                query = maker.replace_word(prompts[source])
+            else:
+                query = maker.prompt()
+            started = time.perf_counter()
+            matches = index.similar(query, '', threshold=args.threshold)
+            timings.append(time.perf_counter() - started)
+            matched += bool(matches)
+            found += any(record['video'] == f'output/video_{source}.mp4' for _, record in matches)
+        results[kind] = dict(summarize(timings), queries=args.queries,
+                             with_match=round(matched / args.queries, 3),
+                             **({} if kind == 'unrelated' else {'source_found': round(found / args.queries, 3)}))
+
+    print(json.dumps({
+        'prompts': args.prompts,
+        'indexed': len(index),
+        'add_s': round(build, 2),
+        'add_us_each': round(build / args.prompts * 1e6, 1),
+        'load_s': round(load, 2),
+        'memory_mb': round(memory / 1024 / 1024, 1),
+        'lookup_arrays_mb': round(arrays / 1024 / 1024, 1),
+        'threshold': args.threshold,
+        'lookups': results,
+    }, indent=2))
+    tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Exercise BackendRouter against several local fake WebUI servers
+
+Starts a fast, a slow, a heavier-weighted and a flaky backend, sends a batch
+of concurrent frame requests, takes the fast backend down halfway through
+and brings it back, then prints how traffic was spread and the per-backend
+health statistics as JSON.
+
+Usage:
+    python benchmarks/bench_router.py --requests 200 --concurrency 8
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import BackendRouter  # noqa: E402
+from fake_backend import FakeWebUI  # noqa: E402
+
+SERVERS = {
+    # name: (delay seconds, error rate, weight)
+    'fast': (0.02, 0.0, 1),
+    'slow': (0.15, 0.0, 1),
+    'weighted': (0.05, 0.0, 2),
+    'flaky': (0.02, 0.5, 1),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--cooldown', type=float, default=0.5, help='circuit breaker cooldown, seconds')
+    args = parser.parse_args()
+
+    fakes = {}
+    entries = []
+    for seed, (name, (delay, error_rate, weight)) in enumerate(SERVERS.items()):
+        fakes[name] = FakeWebUI(delay, error_rate, seed=seed)
+        server = fakes[name].serve()
+        entries.append({'name': name, 'kind': 'webui', 'weight': weight,
+                        'url': f"http://127.0.0.1:{server.server_address[1]}"})
+    router = BackendRouter.from_config(entries, cooldown=args.cooldown)
+
+    latencies = []
+    failures = 0
+
+    def frame(i: int) -> None:
+        nonlocal failures
+        if i == args.requests // 3:
+            fakes['fast'].down = True
+        elif i == 2 * args.requests // 3:
+            fakes['fast'].down = False
+        start = time.perf_counter()
+        try:
+            router.txt2img(f"prompt {i}", width=64, height=64, steps=1)
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            failures += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(frame, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    report = {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'failed_requests': failures,
+        'throughput_rps': round(args.requests / elapsed, 1),
+        'latency_ms': {
+            'p50': round(statistics.median(latencies) * 1000, 1),
+            'p95': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        },
+        'backend_calls': {name: {'calls': fake.calls, 'errors': fake.errors} for name, fake in fakes.items()},
+        'router_stats': router.stats(),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
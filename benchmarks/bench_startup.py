@@ -0,0 +1,110 @@
+"""
+Measure cold start and per-rerun latency of the Streamlit app
+
+Each sample runs in a fresh interpreter so module imports (cv2, stripe, ...)
+are really cold. Streamlit itself is imported before the clock starts since
+every deployment pays for it regardless of what the app does.
+
+Usage:
+    python benchmarks/bench_startup.py                  # working tree
+    python benchmarks/bench_startup.py --rev a0761ac    # any git revision
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter; prints one JSON sample
+CHILD = r"""
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+
+script, logged_in, reruns = sys.argv[1], sys.argv[2] == '1', int(sys.argv[3])
+at = AppTest.from_file(script, default_timeout=60)
+if logged_in:
+    at.session_state['authentication_status'] = True
+    at.session_state['username'] = 'demo'
+    at.session_state['name'] = 'Demo User'
+
+start = time.perf_counter()
+at.run()
+cold = time.perf_counter() - start
+if at.exception:
+    raise SystemExit(f"app raised: {at.exception}")
+
+rerun_times = []
+for _ in range(reruns):
+    start = time.perf_counter()
+    at.run()
+    rerun_times.append(time.perf_counter() - start)
+
+print(json.dumps({'cold': cold, 'reruns': rerun_times, 'elements': len(at.main) + len(at.sidebar)}))
+"""
+
+
+def checkout(rev: str, dest: str) -> None:
+    """
+    Extract a git revision into a directory
+
+    :param rev: Any git revision
+    :param dest: Directory to extract into
+    """
+    archive = subprocess.run(['git', 'archive', rev], cwd=REPO_ROOT, check=True, capture_output=True).stdout
+    archive_path = os.path.join(dest, 'rev.tar')
+    with open(archive_path, 'wb') as f:
+        f.write(archive)
+    with tarfile.open(archive_path) as tar:
+        tar.extractall(dest)
+
+
+def sample(workdir: str, script: str, logged_in: bool, reruns: int) -> dict:
+    """Run one cold-start sample in a fresh interpreter"""
+    env = dict(os.environ, DEBUG=os.getenv('DEBUG', ''))
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, script, '1' if logged_in else '0', str(reruns)],
+        cwd=workdir, env=env, check=True, capture_output=True, text=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples: list) -> dict:
+    """Collapse raw samples into medians (milliseconds)"""
+    reruns = [t for s in samples for t in s['reruns']]
+    return {
+        'cold_start_ms': round(statistics.median(s['cold'] for s in samples) * 1000, 2),
+        'rerun_median_ms': round(statistics.median(reruns) * 1000, 2),
+        'rerun_p95_ms': round(sorted(reruns)[int(len(reruns) * 0.95) - 1] * 1000, 2),
+        'elements': samples[-1]['elements'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rev', help='git revision to benchmark instead of the working tree')
+    parser.add_argument('--script', default='app_with_auth.py')
+    parser.add_argument('--samples', type=int, default=5, help='cold starts per scenario')
+    parser.add_argument('--reruns', type=int, default=20, help='reruns per cold start')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workdir = REPO_ROOT
+        if args.rev:
+            checkout(args.rev, tmp_dir)
+            workdir = tmp_dir
+
+        report = {'rev': args.rev or 'working tree', 'script': args.script}
+        for scenario, logged_in in (('login_page', False), ('logged_in', True)):
+            samples = [sample(workdir, args.script, logged_in, args.reruns) for _ in range(args.samples)]
+            report[scenario] = summarize(samples)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
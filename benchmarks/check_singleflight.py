@@ -0,0 +1,146 @@
+"""
+Check SingleFlight's coalescing, failure fan-out and cancellation takeover
+
+Runs concurrent callers of one key against functions that succeed, fail
+and get cancelled, and verifies:
+
+  coalesce  - 10 concurrent callers cause 1 call and all get its result
+  failure   - an exception in the running call reaches every waiting caller,
+              without the call being repeated
+  cancel    - a BaseException (KeyboardInterrupt, a Streamlit rerun/stop)
+              in the running caller is raised to that caller only; one
+              waiter takes over, runs the call, and every waiter gets its
+              result, with a fresh shared info dict
+
+Prints the observed counts as JSON and exits with status 1 if a check fails.
+
+Usage:
+    python benchmarks/check_singleflight.py --callers 10
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from singleflight import SingleFlight  # noqa: E402
+
+
+class Cancelled(BaseException):
+    """Stands in for KeyboardInterrupt / Streamlit's StopException in the leader"""
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("callers did not line up")
+        time.sleep(0.001)
+
+
+def run_callers(flight: SingleFlight, key: str, fn: Callable, callers: int) -> List[tuple]:
+    """Start callers one after another (the first becomes the leader); returns (kind, value) per caller"""
+    outcomes = [None] * callers
+
+    def caller(index: int) -> None:
+        try:
+            outcomes[index] = ('result', flight.do(key, fn, timeout=10))
+        except BaseException as e:  # noqa: B036 - the cancellation is part of what is checked
+            outcomes[index] = ('raised', type(e).__name__)
+
+    threads = [threading.Thread(target=caller, args=(index,)) for index in range(callers)]
+    threads[0].start()
+    wait_for(lambda: flight.stats()['in_flight'] == 1)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def coalesce(callers: int) -> dict:
+    flight = SingleFlight()
+    runs = []
+
+    def fn():
+        runs.append(threading.current_thread().name)
+        wait_for(lambda: flight.stats()['deduped'] == callers - 1)
+        return 'frame'
+
+    outcomes = run_callers(flight, 'k', fn, callers)
+    return {
+        'ok': len(runs) == 1 and outcomes == [('result', 'frame')] * callers,
+        'calls': flight.stats()['calls'],
+        'results': sum(outcome == ('result', 'frame') for outcome in outcomes),
+    }
+
+
+def failure(callers: int) -> dict:
+    flight = SingleFlight()
+    runs = []
+
+    def fn():
+        runs.append(1)
+        wait_for(lambda: flight.stats()['deduped'] == callers - 1)
+        raise ValueError("backend down")
+
+    outcomes = run_callers(flight, 'k', fn, callers)
+    return {
+        'ok': len(runs) == 1 and outcomes == [('raised', 'ValueError')] * callers
+              and flight.stats()['in_flight'] == 0,
+        'calls': flight.stats()['calls'],
+        'raised_to': sum(outcome == ('raised', 'ValueError') for outcome in outcomes),
+    }
+
+
+def cancel(callers: int) -> dict:
+    flight = SingleFlight()
+    runs = []
+    infos = []
+
+    def fn():
+        runs.append(1)
+        info = flight.info('k')
+        info['attempt'] = len(runs)
+        infos.append(dict(info))
+        if len(runs) == 1:
+            wait_for(lambda: flight.stats()['deduped'] == callers - 1)
+            raise Cancelled()
+        # Give the other waiters time to wake up and join the call of the one that took over
+        time.sleep(0.2)
+        return 'frame'
+
+    outcomes = run_callers(flight, 'k', fn, callers)
+    waiters = outcomes[1:]
+    return {
+        'ok': outcomes[0] == ('raised', 'Cancelled') and waiters == [('result', 'frame')] * (callers - 1)
+              and len(runs) == 2 and infos == [{'attempt': 1}, {'attempt': 2}]
+              and flight.stats()['in_flight'] == 0,
+        'calls': flight.stats()['calls'],
+        'leader': outcomes[0],
+        'waiters_with_result': sum(outcome == ('result', 'frame') for outcome in waiters),
+        'takeover_info_fresh': infos == [{'attempt': 1}, {'attempt': 2}],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--callers', type=int, default=10, help='concurrent callers per check (default: 10)')
+    args = parser.parse_args()
+
+    report = {
+        'coalesce': coalesce(args.callers),
+        'failure': failure(args.callers),
+        'cancel': cancel(args.callers),
+    }
+    print(json.dumps(report, indent=2))
+    if not all(check['ok'] for check in report.values()):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
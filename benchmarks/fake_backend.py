@@ -0,0 +1,172 @@
+"""
+Fake Stable Diffusion WebUI server for benchmarks and load tests
+
+Answers /sdapi/v1/txt2img after a configurable delay with a random-noise
+PNG of the requested size (one of a few variants, so the frames of a job
+differ), fails a configurable share of requests and answers another share
+with a black image, like the WebUI safety checker does.
+/internal/progress reports the step of the job with the requested task id
+(force_task_id) as time passes, with a live preview of that job's image
+past half way.
+
+Usage:
+    python benchmarks/fake_backend.py --port 7860 --delay 0.5 --error-rate 0.1 --blank-rate 0.05
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+class FakeWebUI:
+    def __init__(self, delay: float = 0.0, error_rate: float = 0.0, seed: int = 0, blank_rate: float = 0.0,
+                 variants: int = 16):
+        """
+        Initialize the fake backend
+
+        :param delay: Seconds each txt2img request takes
+        :param error_rate: Share of txt2img requests answered with HTTP 500
+        :param seed: Seed for the error and image generators
+        :param blank_rate: Share of successful txt2img requests answered with a black image
+        :param variants: Distinct noise images per size, returned in turn
+        """
+        self.delay = delay
+        self.error_rate = error_rate
+        self.blank_rate = blank_rate
+        self.variants = variants
+        self.down = False  # when set, every request fails
+        self.calls = 0
+        self.errors = 0
+        self.blanks = 0
+        self.progress_calls = 0
+        self._jobs: Dict[str, Tuple[float, int, int]] = {}  # task id -> (started, steps, variant) of running requests
+        self._random = random.Random(seed)
+        self._rng = np.random.default_rng(seed)
+        self._images: Dict[Tuple[int, int, int], str] = {}
+        self._lock = threading.Lock()
+
+    def image(self, width: int, height: int, variant: int = 0) -> str:
+        """Base64 PNG of the requested size (each variant is encoded once; variant -1 is black)"""
+        with self._lock:
+            if (width, height, variant) not in self._images:
+                if variant < 0:
+                    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+                else:
+                    pixels = self._rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+                buffer = io.BytesIO()
+                Image.fromarray(pixels).save(buffer, format='PNG', compress_level=1)
+                self._images[(width, height, variant)] = base64.b64encode(buffer.getvalue()).decode()
+            return self._images[(width, height, variant)]
+
+    def txt2img(self, payload: dict) -> Tuple[int, dict]:
+        with self._lock:
+            self.calls += 1
+            fail = self.down or self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            variant = self.calls % self.variants
+            if not fail and self._random.random() < self.blank_rate:
+                self.blanks += 1
+                variant = -1
+            task_id = payload.get('force_task_id') or f'task(fake-{self.calls})'
+            self._jobs[task_id] = (time.monotonic(), int(payload.get('steps', 20)), variant)
+        time.sleep(self.delay)
+        with self._lock:
+            del self._jobs[task_id]
+        if fail:
+            return 500, {'error': 'RuntimeError', 'detail': 'simulated failure'}
+        image = self.image(int(payload.get('width', 512)), int(payload.get('height', 512)), variant)
+        return 200, {'images': [image], 'parameters': payload, 'info': '{}'}
+
+    def progress(self, request: dict) -> Tuple[int, dict]:
+        with self._lock:
+            self.progress_calls += 1
+            job = self._jobs.get(request.get('id_task'))
+        if job is None:
+            return 200, {'active': False, 'queued': False, 'completed': False, 'progress': None, 'eta': None,
+                         'live_preview': None, 'id_live_preview': -1, 'textinfo': 'Waiting...'}
+        started, steps, variant = job
+        fraction = min((time.monotonic() - started) / self.delay, 1.0) if self.delay else 1.0
+        step = int(fraction * steps)
+        preview = None
+        if fraction > 0.5 and request.get('live_preview') and request.get('id_live_preview') != step:
+            preview = 'data:image/png;base64,' + self.image(64, 64, variant)  # the job's own picture
+        return 200, {
+            'active': True,
+            'queued': False,
+            'completed': False,
+            'progress': fraction,
+            'eta': max(self.delay - (time.monotonic() - started), 0.0),
+            'live_preview': preview,
+            'id_live_preview': step if preview else request.get('id_live_preview', -1),
+            'textinfo': None,
+        }
+
+    def serve(self, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+        """
+        Start serving on a background thread
+
+        :param host: Interface to bind
+        :param port: Port to bind, 0 for any free port
+        :return: The running server (server.server_address has the bound port)
+        """
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, status: int, body: dict) -> None:
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if self.path == '/sdapi/v1/txt2img':
+                    self._reply(*fake.txt2img(body))
+                elif self.path == '/internal/progress':
+                    self._reply(*fake.progress(body))
+                else:
+                    self._reply(404, {'detail': 'Not Found'})
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7860)
+    parser.add_argument('--delay', type=float, default=0.5, help='seconds per txt2img request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests that fail')
+    parser.add_argument('--blank-rate', type=float, default=0.0, help='share of requests answered with black')
+    args = parser.parse_args()
+
+    server = FakeWebUI(args.delay, args.error_rate, blank_rate=args.blank_rate).serve(args.host, args.port)
+    print(f"Fake WebUI listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Minimal local stand-in for the Stripe API
+
+Implements just the endpoints billing.py uses: creating checkout sessions and
+searching subscriptions. Point the app at it with
+
+    STRIPE_API_BASE=http://127.0.0.1:12111 STRIPE_SECRET_KEY=sk_test_stub
+
+Usage:
+    python benchmarks/stripe_stub.py --port 12111 --latency 0.3 --subscribe demo=price_H5ggYwtDq8jGy8
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+class StripeStub:
+    def __init__(self, latency: float = 0.0, subscriptions: Optional[Dict[str, str]] = None):
+        """
+        Initialize the stub state
+
+        :param latency: Seconds each request sleeps, to mimic network round trips
+        :param subscriptions: Mapping of username to the price ID of an active subscription
+        """
+        self.latency = latency
+        self.subscriptions = dict(subscriptions or {})
+        self.down = False  # when set, every request fails with HTTP 500
+        self.requests = 0  # all requests received, including failed ones
+        self.calls: Dict[str, int] = {'checkout.sessions.create': 0, 'subscriptions.search': 0}
+        self._lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] += 1
+
+    def received(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def create_checkout(self, form: Dict[str, str]) -> dict:
+        self.count('checkout.sessions.create')
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        return {
+            'id': session_id,
+            'object': 'checkout.session',
+            'status': 'open',
+            'mode': form.get('mode'),
+            'client_reference_id': form.get('client_reference_id'),
+            'expires_at': int(form.get('expires_at', time.time() + 24 * 3600)),
+            'url': f"https://checkout.stripe.test/pay/{session_id}",
+        }
+
+    def search_subscriptions(self, query: str) -> dict:
+        self.count('subscriptions.search')
+        match = re.search(r"metadata\['username'\]:'((?:[^'\\]|\\.)*)'", query)
+        username = match.group(1).replace("\\'", "'").replace('\\\\', '\\') if match else None
+        data = []
+        if username in self.subscriptions:
+            data.append({
+                'id': f"sub_{username}",
+                'object': 'subscription',
+                'status': 'active',
+                'metadata': {'username': username},
+                'items': {'object': 'list', 'data': [{'price': {'id': self.subscriptions[username]}}]},
+            })
+        return {'object': 'search_result', 'data': data, 'has_more': False, 'url': '/v1/subscriptions/search'}
+
+    def serve(self, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+        """
+        Start serving on a background thread
+
+        :param host: Interface to bind
+        :param port: Port to bind, 0 for any free port
+        :return: The running server (server.server_address has the bound port)
+        """
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status: int, body: dict) -> None:
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                stub.received()
+                time.sleep(stub.latency)
+                if stub.down:
+                    return self._reply(500, {'error': {'type': 'api_error', 'message': 'simulated outage'}})
+                length = int(self.headers.get('Content-Length', 0))
+                form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+                if urlparse(self.path).path == '/v1/checkout/sessions':
+                    self._reply(200, stub.create_checkout(form))
+                else:
+                    self._reply(404, {'error': {'message': f"Unknown path {self.path}"}})
+
+            def do_GET(self):
+                stub.received()
+                time.sleep(stub.latency)
+                if stub.down:
+                    return self._reply(500, {'error': {'type': 'api_error', 'message': 'simulated outage'}})
+                url = urlparse(self.path)
+                if url.path == '/v1/subscriptions/search':
+                    query = parse_qs(url.query).get('query', [''])[0]
+                    self._reply(200, stub.search_subscriptions(query))
+                else:
+                    self._reply(404, {'error': {'message': f"Unknown path {self.path}"}})
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--subscribe', action='append', default=[], metavar='USER=PRICE',
+                        help='give USER an active subscription to PRICE (repeatable)')
+    args = parser.parse_args()
+
+    subscriptions = dict(item.split('=', 1) for item in args.subscribe)
+    server = StripeStub(args.latency, subscriptions).serve(args.host, args.port)
+    print(f"Stripe stub listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
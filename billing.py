@@ -0,0 +1,199 @@
+"""
+Stripe billing off the Streamlit render path
+
+Checkout sessions are created on a small worker pool so a click on
+"Upgrade" never blocks the rerun on a network call, and an open session is
+reused for the same user/price until shortly before Stripe expires it.
+Subscription tiers are looked up the same way and kept in a TTL cache; an
+expired tier is served while it is refreshed in the background, and a
+failed lookup is not retried for a short back-off, so a Stripe outage does
+not slow down reruns.
+
+The stripe module is passed in rather than imported, so the manager can be
+pointed at a local stub (see benchmarks/stripe_stub.py) or a fake object.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+# Stripe only accepts expires_at between 30 minutes and 24 hours out
+CHECKOUT_SESSION_LIFETIME = 60 * 60
+# Stop handing out a cached session this long before it expires
+CHECKOUT_EXPIRY_MARGIN = 5 * 60
+
+
+class TTLCache:
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize a thread-safe cache whose entries expire after a fixed time
+
+        :param ttl: Seconds an entry stays fresh
+        :param clock: Time source, replaceable for testing
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: Dict[Any, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, allow_stale: bool = False):
+        """
+        Look up a value
+
+        :param key: Cache key
+        :param default: Returned when the key is missing (or stale)
+        :param allow_stale: Return expired entries instead of the default
+        :return: Cached value or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return default
+        stored_at, value = entry
+        if not allow_stale and self.clock() - stored_at > self.ttl:
+            return default
+        return value
+
+    def set(self, key, value) -> None:
+        """Store a value, resetting its age"""
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+
+    def invalidate(self, key) -> None:
+        """Drop a value so the next lookup misses"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class BillingManager:
+    def __init__(self, stripe_module, price_ids: Dict[str, str], tier_ttl: float = 300,
+                 lookup_timeout: float = 2.0, max_workers: int = 4, failure_backoff: float = 30):
+        """
+        Initialize the billing manager
+
+        :param stripe_module: Configured stripe module (or a compatible stub)
+        :param price_ids: Mapping of tier name to Stripe price ID
+        :param tier_ttl: Seconds a looked-up subscription tier stays fresh
+        :param lookup_timeout: Seconds get_tier waits for the first lookup of a user before falling back
+        :param max_workers: Size of the worker pool for Stripe calls
+        :param failure_backoff: Seconds after a failed lookup before Stripe is asked again for that user
+        """
+        self.stripe = stripe_module
+        self.price_ids = dict(price_ids)
+        self.tiers_by_price = {price: tier for tier, price in self.price_ids.items()}
+        self.lookup_timeout = lookup_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='billing')
+        self._lock = threading.Lock()
+        self._checkouts: Dict[Tuple[str, str], Future] = {}
+        self._tier_lookups: Dict[str, Future] = {}
+        self._tiers = TTLCache(tier_ttl)
+        self._failed_lookups = TTLCache(failure_backoff)
+
+    def request_checkout(self, username: str, tier: str, success_url: str, cancel_url: str) -> Future:
+        """
+        Get a checkout session for a user upgrading to a tier, without blocking
+
+        Returns the in-flight or cached future when one exists and its session
+        is still usable, so repeated clicks never create duplicate sessions.
+
+        :param username: User starting the checkout
+        :param tier: Tier name from price_ids
+        :param success_url: Where Stripe redirects after payment
+        :param cancel_url: Where Stripe redirects on cancel
+        :return: Future resolving to the Stripe checkout session
+        """
+        key = (username, tier)
+        with self._lock:
+            future = self._checkouts.get(key)
+            if future is None or not self._checkout_usable(future):
+                future = self._executor.submit(self._create_checkout, username, tier, success_url, cancel_url)
+                self._checkouts[key] = future
+            return future
+
+    def get_tier(self, username: str, default: str = 'free') -> str:
+        """
+        Current subscription tier of a user, served from cache when fresh
+
+        Lookups run on the worker pool. Only the first lookup of a user is
+        waited for, at most lookup_timeout; otherwise the last known tier is
+        returned right away while it is refreshed. After a failed lookup the
+        last known tier (or the default) is returned without asking Stripe
+        until failure_backoff has passed.
+
+        :param username: User to look up
+        :param default: Tier for users without an active subscription
+        :return: Tier name
+        """
+        tier = self._tiers.get(username)
+        if tier is not None:
+            return tier
+        known = self._tiers.get(username, allow_stale=True)
+        if self._failed_lookups.get(username):
+            return known if known is not None else default
+
+        with self._lock:
+            future = self._tier_lookups.get(username)
+            running = future is not None and not future.done()
+            if not running:
+                future = self._executor.submit(self._lookup_tier, username, default)
+                self._tier_lookups[username] = future
+        if known is not None or running:
+            return known if known is not None else default
+
+        try:
+            return future.result(timeout=self.lookup_timeout)
+        except Exception:
+            return default
+
+    def invalidate(self, username: str) -> None:
+        """
+        Forget cached state for a user, e.g. after a completed payment
+
+        :param username: User whose tier and checkout sessions should be dropped
+        """
+        self._tiers.invalidate(username)
+        self._failed_lookups.invalidate(username)
+        with self._lock:
+            for key in [key for key in self._checkouts if key[0] == username]:
+                del self._checkouts[key]
+
+    def _checkout_usable(self, future: Future) -> bool:
+        """Whether a checkout future is still pending or holds an open, unexpired session"""
+        if not future.done():
+            return True
+        if future.exception() is not None:
+            return False
+        session = future.result()
+        return (session.get('status', 'open') == 'open'
+                and session['expires_at'] - CHECKOUT_EXPIRY_MARGIN > time.time())
+
+    def _create_checkout(self, username: str, tier: str, success_url: str, cancel_url: str):
+        return self.stripe.checkout.Session.create(
+            payment_method_types=['card'],
+            line_items=[{
+                'price': self.price_ids[tier],
+                'quantity': 1,
+            }],
+            mode='subscription',
+            client_reference_id=username,
+            subscription_data={'metadata': {'username': username}},
+            expires_at=int(time.time()) + CHECKOUT_SESSION_LIFETIME,
+            success_url=success_url,
+            cancel_url=cancel_url,
+        )
+
+    def _lookup_tier(self, username: str, default: str) -> str:
+        quoted = username.replace('\\', '\\\\').replace("'", "\\'")
+        try:
+            result = self.stripe.Subscription.search(
+                query=f"status:'active' AND metadata['username']:'{quoted}'",
+            )
+        except Exception:
+            self._failed_lookups.set(username, True)
+            raise
+        tier = default
+        for subscription in result['data']:
+            for item in subscription['items']['data']:
+                tier = self.tiers_by_price.get(item['price']['id'], tier)
+        self._tiers.set(username, tier)
+        return tier
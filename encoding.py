@@ -0,0 +1,231 @@
+"""
+Encoding profiles: a small fast-start web preview and an optional master
+
+OpenCV's VideoWriter has no bitrate or quality control, so profiles are
+encoded with ffmpeg (libx264, CRF with an optional bitrate cap, moov atom up
+front for progressive playback) when an ffmpeg binary is available: the
+FFMPEG_BINARY environment variable, ffmpeg on PATH, or the one bundled with
+the imageio-ffmpeg package. Without ffmpeg the OpenCV writer is used and only
+the profile's resolution applies.
+
+Frames are read once and fed to every profile's encoder in the same pass.
+Each ffmpeg process is fed from its own thread, so the renditions encode in
+parallel and the pass takes about as long as the slowest profile.
+"""
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Used when config.yaml has no encoding.profiles section
+DEFAULT_PROFILES = {
+    'web': {'max_side': 768, 'crf': 28, 'maxrate': '1M', 'preset': 'veryfast', 'faststart': True},
+    'master': {'crf': 18, 'preset': 'medium', 'faststart': True},
+}
+
+
+class EncodingProfile:
+    def __init__(self, name: str, max_side: Optional[int] = None, crf: int = 23, maxrate: Optional[str] = None,
+                 bufsize: Optional[str] = None, preset: str = 'medium', tune: Optional[str] = None,
+                 faststart: bool = True):
+        """
+        Settings for one output rendition
+
+        :param name: Profile name, e.g. 'web' or 'master'
+        :param max_side: Longest side in pixels; larger frames are downscaled (None keeps the size)
+        :param crf: x264 constant rate factor, lower is better quality (18 is visually lossless)
+        :param maxrate: Bitrate cap such as '1M' (None for pure CRF)
+        :param bufsize: Rate control buffer for maxrate (defaults to twice maxrate)
+        :param preset: x264 speed/size trade-off, ultrafast .. veryslow
+        :param tune: Optional x264 tune, e.g. 'stillimage'
+        :param faststart: Move the index to the front so playback starts before the download ends
+        """
+        self.name = name
+        self.max_side = max_side
+        self.crf = crf
+        self.maxrate = maxrate
+        self.bufsize = bufsize
+        self.preset = preset
+        self.tune = tune
+        self.faststart = faststart
+
+    def output_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Frame size of this rendition (even dimensions, as yuv420p requires)"""
+        scale = min(1.0, self.max_side / max(width, height)) if self.max_side else 1.0
+        return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+def load_profiles(config: Optional[Dict[str, Any]] = None) -> Dict[str, EncodingProfile]:
+    """
+    Build profiles from the encoding.profiles section of config.yaml
+
+    :param config: Mapping of profile name to EncodingProfile arguments
+    :return: Profiles by name
+    """
+    return {name: EncodingProfile(name, **settings) for name, settings in (config or DEFAULT_PROFILES).items()}
+
+
+@lru_cache(maxsize=1)
+def find_ffmpeg() -> Optional[str]:
+    """
+    Locate an ffmpeg binary
+
+    :return: Path to ffmpeg, or None if there is none
+    """
+    binary = os.getenv('FFMPEG_BINARY') or shutil.which('ffmpeg')
+    if binary:
+        return binary
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+class _Encoder(ABC):
+    def __init__(self, profile: EncodingProfile, output_path: str, fps: int, width: int, height: int):
+        self.profile = profile
+        self.output_path = output_path
+        self.size = profile.output_size(width, height)
+        self.seconds = 0.0
+
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return frame
+
+    @abstractmethod
+    def write(self, frame: np.ndarray) -> None:
+        """Encode one HxWx3 uint8 RGB frame"""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Finish the file; raises RuntimeError if encoding failed"""
+
+
+class FFmpegEncoder(_Encoder):
+    def __init__(self, profile: EncodingProfile, output_path: str, fps: int, width: int, height: int,
+                 ffmpeg: str = 'ffmpeg'):
+        super().__init__(profile, output_path, fps, width, height)
+        command = [ffmpeg, '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{self.size[0]}x{self.size[1]}", '-r', str(fps),
+                   '-i', '-',
+                   '-c:v', 'libx264', '-preset', profile.preset, '-crf', str(profile.crf), '-pix_fmt', 'yuv420p']
+        if profile.maxrate:
+            command += ['-maxrate', profile.maxrate, '-bufsize', profile.bufsize or _double_rate(profile.maxrate)]
+        if profile.tune:
+            command += ['-tune', profile.tune]
+        if profile.faststart:
+            command += ['-movflags', '+faststart']
+        command.append(output_path)
+        self._started = time.perf_counter()
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        # A couple of frames of slack; the store's frames stay valid until encode() returns
+        self._queue: queue.Queue = queue.Queue(maxsize=2)
+        self._error: Optional[BaseException] = None
+        self._feeder = threading.Thread(target=self._feed, name=f'ffmpeg-{profile.name}', daemon=True)
+        self._feeder.start()
+
+    def _feed(self) -> None:
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            if self._error is not None:
+                continue  # keep draining so write() never blocks
+            try:
+                self._process.stdin.write(np.ascontiguousarray(self.prepare(frame)).tobytes())
+            except (BrokenPipeError, OSError) as e:
+                self._error = e
+
+    def write(self, frame: np.ndarray) -> None:
+        self._queue.put(frame)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._feeder.join()
+        _, stderr = self._process.communicate()
+        self.seconds = time.perf_counter() - self._started
+        if self._process.returncode != 0 or self._error is not None:
+            raise RuntimeError(f"ffmpeg failed for profile '{self.profile.name}': "
+                               f"{stderr.decode(errors='replace') or self._error}")
+
+
+class OpenCVEncoder(_Encoder):
+    def __init__(self, profile: EncodingProfile, output_path: str, fps: int, width: int, height: int,
+                 fourcc: str = 'mp4v'):
+        super().__init__(profile, output_path, fps, width, height)
+        self._writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, self.size)
+
+    def write(self, frame: np.ndarray) -> None:
+        started = time.perf_counter()
+        self._writer.write(cv2.cvtColor(self.prepare(frame), cv2.COLOR_RGB2BGR))
+        self.seconds += time.perf_counter() - started
+
+    def close(self) -> None:
+        self._writer.release()
+
+
+def _double_rate(rate: str) -> str:
+    number = rate.rstrip('kKmM')
+    return f"{float(number) * 2:g}{rate[len(number):]}"
+
+
+def encode(frames: Iterable[np.ndarray], outputs: List[Tuple[EncodingProfile, str]], fps: int,
+           fourcc: str = 'mp4v') -> Dict[str, Dict[str, Any]]:
+    """
+    Encode frames into every requested rendition in a single pass
+
+    :param frames: HxWx3 uint8 RGB arrays, in order
+    :param outputs: (profile, output path) pairs
+    :param fps: Frames per second
+    :param fourcc: Codec for the OpenCV fallback
+    :return: Per profile: path, size_bytes, seconds, resolution, frames and encoder used
+    """
+    ffmpeg = find_ffmpeg()
+    encoders: List[_Encoder] = []
+    count = 0
+    completed = False
+    try:
+        for frame in frames:
+            if not encoders:
+                height, width = frame.shape[:2]
+                for profile, path in outputs:
+                    if ffmpeg:
+                        encoders.append(FFmpegEncoder(profile, path, fps, width, height, ffmpeg=ffmpeg))
+                    else:
+                        encoders.append(OpenCVEncoder(profile, path, fps, width, height, fourcc=fourcc))
+            for encoder in encoders:
+                encoder.write(frame)
+            count += 1
+        completed = True
+    finally:
+        errors = []
+        for encoder in encoders:
+            try:
+                encoder.close()
+            except RuntimeError as e:
+                errors.append(e)
+        # An error reading the frames is already on its way up and explains the broken files better
+        if errors and completed:
+            raise errors[0]
+
+    return {
+        encoder.profile.name: {
+            'path': encoder.output_path,
+            'size_bytes': os.path.getsize(encoder.output_path) if os.path.exists(encoder.output_path) else 0,
+            'seconds': round(encoder.seconds, 3),
+            'resolution': f"{encoder.size[0]}x{encoder.size[1]}",
+            'frames': count,
+            'encoder': 'ffmpeg' if isinstance(encoder, FFmpegEncoder) else 'opencv',
+        }
+        for encoder in encoders
+    }
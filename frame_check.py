@@ -0,0 +1,266 @@
+"""
+Validation of generated frames right after decode
+
+Backends sometimes answer with an image that is not a usable frame: the
+WebUI safety checker replaces filtered images with solid black, Stability
+blurs them beyond recognition (and says so, see backends.ContentFiltered),
+and a misbehaving backend can return the same picture twice. Such frames
+used to be encoded as they were, and users then regenerated the whole
+video. Every frame is now checked as soon as it is decoded and only the
+frames that fail are requested again:
+
+- blank: next to no variance (solid black, white or gray placeholders)
+- blurred: next to no difference between neighbouring pixels at full resolution
+- placeholder: perceptual hash close to a configured known-bad image
+- duplicate: perceptual hash close to another frame of the same job
+
+The checks are deterministic numpy reductions over a stack of small
+grayscale thumbnails plus a strided sample of full-resolution rows, so a
+batch of frames is checked in one pass, at 1-2 ms per 1024px frame (mostly
+downscaling).
+"""
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+HASH_ROWS = 8
+HASH_COLS = 9  # one more than the hash width: dHash compares horizontal neighbours
+BLOCK = 8  # thumbnail pixels per hash cell, so thumbnails are 72x64
+ROW_STRIDE = 8  # full-resolution rows sampled for sharpness
+
+REASONS = ('blank', 'blurred', 'placeholder', 'duplicate', 'filtered')  # filtered: reported by the backend
+
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def thumbnail(frame: np.ndarray) -> np.ndarray:
+    """
+    Grayscale thumbnail of a frame
+
+    The frame is halved with area averaging until it is close to the
+    thumbnail size: OpenCV has a fast path for exact halving, while a single
+    INTER_AREA resize by a fractional factor is about four times slower.
+
+    :param frame: HxWx3 uint8 RGB frame
+    :return: 64x72 uint8 array
+    """
+    width, height = HASH_COLS * BLOCK, HASH_ROWS * BLOCK
+    small = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    while small.shape[0] >= 4 * height and small.shape[1] >= 4 * width:
+        small = cv2.resize(small, (small.shape[1] // 2, small.shape[0] // 2), interpolation=cv2.INTER_AREA)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def sharpness(frame: np.ndarray) -> float:
+    """
+    Mean difference between horizontally neighbouring pixels, at full resolution
+
+    Generated images keep fine texture even in smooth areas; a frame blurred
+    by a content filter has almost none. Only every ROW_STRIDE-th row of the
+    green channel is looked at.
+
+    :param frame: HxWx3 uint8 RGB frame
+    :return: Mean absolute difference (0-255)
+    """
+    rows = frame[::ROW_STRIDE, :, 1].astype(np.int16)
+    return float(np.abs(np.diff(rows, axis=1)).mean())
+
+
+def measure(frames: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Thumbnails and sharpness of a batch of frames, for the vectorized checks
+
+    :param frames: HxWx3 uint8 RGB frames (sizes may differ)
+    :return: (n, 64, 72) float32 thumbnails and (n,) sharpness values
+    """
+    thumbs = np.stack([thumbnail(frame) for frame in frames]).astype(np.float32)
+    return thumbs, np.array([sharpness(frame) for frame in frames], dtype=np.float32)
+
+
+def dhash(thumbs: np.ndarray) -> np.ndarray:
+    """
+    64-bit difference hash of each thumbnail
+
+    Each bit says whether a cell of an 8x9 grid is brighter than its right
+    neighbour, so re-encoding and resizing keep the hash (nearly) unchanged
+    while different pictures differ in about half the bits.
+
+    :param thumbs: (n, 64, 72) grayscale thumbnails (see measure)
+    :return: (n,) uint64 array
+    """
+    cells = thumbs.reshape(len(thumbs), HASH_ROWS, BLOCK, HASH_COLS, BLOCK).mean(axis=(2, 4))
+    bits = cells[:, :, 1:] > cells[:, :, :-1]
+    return np.packbits(bits.reshape(len(thumbs), -1), axis=1).view('>u8')[:, 0].astype(np.uint64)
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Differing bits between hashes, broadcasting like a ^ b
+
+    :param a: uint64 hashes
+    :param b: uint64 hashes
+    :return: Bit distances (0-64)
+    """
+    xor = np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64))
+    return _POPCOUNT[xor[..., None].view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def frame_hash(frame: np.ndarray) -> str:
+    """
+    Perceptual hash of a frame in hex, e.g. to add a known placeholder image to config.yaml
+
+    :param frame: HxWx3 uint8 RGB frame
+    :return: 16 hex digits
+    """
+    return f'{int(dhash(measure([frame])[0])[0]):016x}'
+
+
+class FrameValidator:
+    def __init__(self, min_std: float = 2.0, min_sharpness: float = 0.25, duplicate_distance: int = 6,
+                 placeholders: Sequence[str] = (), placeholder_distance: int = 6, retries: int = 2):
+        """
+        Thresholds for usable frames, and counters shared by all jobs
+
+        :param min_std: Frames with a smaller grayscale standard deviation are blank
+        :param min_sharpness: Frames with a smaller sharpness (see sharpness) are blurred
+        :param duplicate_distance: Frames of a job whose hashes differ in at most this many bits are duplicates
+        :param placeholders: Hex hashes (see frame_hash) of known placeholder images
+        :param placeholder_distance: Hash bits within which a frame is a known placeholder
+        :param retries: New requests per bad frame; after that the last answer is kept
+        """
+        self.min_std = min_std
+        self.min_sharpness = min_sharpness
+        self.duplicate_distance = duplicate_distance
+        self.placeholders = np.array([int(value, 16) for value in placeholders], dtype=np.uint64)
+        self.placeholder_distance = placeholder_distance
+        self.retries = retries
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.rejected = dict.fromkeys(REASONS, 0)
+        self.jobs_saved = 0  # jobs that would have been regenerated in full, fixed by re-requesting frames
+        self.jobs_kept_bad = 0  # jobs that still had a bad frame after all retries
+
+    @classmethod
+    def from_config(cls, settings: Optional[Dict[str, Any]]) -> 'FrameValidator':
+        """
+        Build a validator from the frame_check section of config.yaml
+
+        :param settings: Keyword arguments of the constructor (None for the defaults)
+        :return: FrameValidator instance
+        """
+        return cls(**(settings or {}))
+
+    def problems(self, frames: Sequence[np.ndarray], others: Optional[Sequence[int]] = ()) -> List[Optional[str]]:
+        """
+        Check a batch of frames
+
+        :param frames: HxWx3 uint8 RGB frames
+        :param others: Hashes of accepted frames to look for duplicates of (None to skip duplicate
+                       detection); each frame of the batch is also compared with the ones before it
+        :return: Per frame, None if usable, else 'blank', 'blurred', 'placeholder' or 'duplicate'
+        """
+        if not len(frames):
+            return []
+        return self._problems(frames, others)[0]
+
+    def _problems(self, frames, others) -> Tuple[List[Optional[str]], np.ndarray]:
+        thumbs, sharp = measure(frames)
+        hashes = dhash(thumbs)
+        reasons = np.full(len(frames), None, dtype=object)
+        if others is not None:
+            earlier = np.concatenate((np.asarray(others, dtype=np.uint64), hashes))
+            distances = hamming(hashes[:, None], earlier[None, :])
+            # A frame of the batch only counts as a duplicate of the frames before it
+            distances[np.arange(len(earlier))[None, :] >= len(others) + np.arange(len(hashes))[:, None]] = 64
+            reasons[(distances <= self.duplicate_distance).any(axis=1)] = 'duplicate'
+        if len(self.placeholders):
+            distances = hamming(hashes[:, None], self.placeholders[None, :])
+            reasons[(distances <= self.placeholder_distance).any(axis=1)] = 'placeholder'
+        reasons[sharp < self.min_sharpness] = 'blurred'
+        reasons[thumbs.std(axis=(1, 2)) < self.min_std] = 'blank'
+
+        with self._lock:
+            self.checked += len(frames)
+            for reason in reasons:
+                if reason is not None:
+                    self.rejected[reason] += 1
+        return list(reasons), hashes
+
+    def job(self, duplicates: bool = True) -> 'JobCheck':
+        """
+        Start checking the frames of one job
+
+        :param duplicates: Whether frames repeating another frame of the job are rejected
+                           (a storyboard may repeat a scene on purpose)
+        :return: JobCheck instance
+        """
+        return JobCheck(self, duplicates)
+
+    def stats(self) -> Dict[str, Any]:
+        """Frames checked and rejected by reason, jobs saved from a full regeneration and jobs kept with bad frames"""
+        with self._lock:
+            return {'checked': self.checked, 'rejected': dict(self.rejected), 'jobs_saved': self.jobs_saved,
+                    'jobs_kept_bad': self.jobs_kept_bad}
+
+
+class JobCheck:
+    def __init__(self, validator: FrameValidator, duplicates: bool = True):
+        """
+        Frame checks of one job; use FrameValidator.job() to create
+
+        :param validator: Thresholds and shared counters
+        :param duplicates: Whether frames repeating another frame of the job are rejected
+        """
+        self.validator = validator
+        self.retries = validator.retries
+        self.duplicates = duplicates
+        self.hashes: Dict[int, int] = {}  # frame index -> hash of its accepted frame
+        self.bad: Dict[int, str] = {}  # frame index -> why its latest answer was rejected
+        self.rejections = 0
+
+    def check(self, index: int, frame: np.ndarray) -> Optional[str]:
+        """
+        Check a frame of the job as soon as it is decoded
+
+        A rejected frame should be requested again and checked under the same index.
+
+        :param index: Frame number
+        :param frame: HxWx3 uint8 RGB frame
+        :return: None if usable, else 'blank', 'blurred', 'placeholder' or 'duplicate'
+        """
+        others = [value for other, value in self.hashes.items() if other != index] if self.duplicates else None
+        reasons, hashes = self.validator._problems([frame], others)
+        if reasons[0] is None:
+            self.hashes[index] = int(hashes[0])
+            self.bad.pop(index, None)
+        else:
+            self.reject(index, reasons[0], counted=True)
+        return reasons[0]
+
+    def reject(self, index: int, reason: str, counted: bool = False) -> None:
+        """
+        Record a bad answer detected elsewhere, e.g. a backend reporting the image as filtered
+
+        :param index: Frame number
+        :param reason: One of REASONS
+        :param counted: Whether the validator's counters already include it
+        """
+        self.bad[index] = reason
+        self.rejections += 1
+        if not counted:
+            with self.validator._lock:
+                self.validator.rejected[reason] += 1
+
+    def finish(self, completed: bool) -> None:
+        """
+        Record the outcome of the job
+
+        :param completed: Whether every frame was generated (bad or not)
+        """
+        with self.validator._lock:
+            if completed and self.bad:
+                self.validator.jobs_kept_bad += 1
+            elif completed and self.rejections:
+                self.validator.jobs_saved += 1
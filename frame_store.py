@@ -0,0 +1,212 @@
+"""
+Memory-bounded storage for the frames of a job
+
+Frames are kept as one contiguous uint8 array per job (frames x height x
+width x 3, RGB) instead of a PIL Image per frame. All stores in a process
+draw from a shared MemoryBudget; a job whose frames do not fit is backed by
+a memory-mapped temporary file instead, and the pages it writes are handed
+back to the OS right away, so they count towards page cache rather than the
+process's RSS. Decoding a frame needs a scratch buffer of the decoded image
+before it lands in the store; part of the budget is set aside for those, and
+a decode waits while that part is in use, so frames plus scratch buffers stay
+within the budget however many jobs decode at once.
+"""
+import io
+import mmap
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, Optional, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+PAGE_SIZE = mmap.PAGESIZE
+
+
+class MemoryBudget:
+    def __init__(self, limit_bytes: int, decode_bytes: Optional[int] = None):
+        """
+        Byte budget shared by every FrameStore of a process
+
+        :param limit_bytes: Bytes of frame data and decode buffers allowed in anonymous memory
+        :param decode_bytes: Part of the limit set aside for decode buffers (default: an eighth)
+        """
+        self.limit_bytes = limit_bytes
+        self.decode_bytes = limit_bytes // 8 if decode_bytes is None else decode_bytes
+        self.used_bytes = 0
+        self.decoding_bytes = 0
+        self.peak_bytes = 0
+        self.spills = 0
+        self.decode_waits = 0
+        self._lock = threading.Lock()
+        self._decoded = threading.Condition(self._lock)
+
+    def reserve(self, nbytes: int) -> bool:
+        """
+        Claim part of the budget for frames
+
+        :param nbytes: Bytes wanted
+        :return: True if reserved, False if it would exceed the limit
+        """
+        with self._lock:
+            if self.used_bytes + nbytes > self.limit_bytes - self.decode_bytes:
+                self.spills += 1
+                return False
+            self.used_bytes += nbytes
+            self.peak_bytes = max(self.peak_bytes, self.used_bytes + self.decoding_bytes)
+            return True
+
+    def release(self, nbytes: int) -> None:
+        """Return a reservation to the budget"""
+        with self._lock:
+            self.used_bytes -= nbytes
+
+    @contextmanager
+    def decoding(self, nbytes: int) -> Iterator[None]:
+        """
+        Hold part of the decode allowance while a frame is decoded, waiting for it if needed
+
+        A decode larger than the whole allowance runs once no other decode does.
+
+        :param nbytes: Bytes of scratch memory the decode needs
+        """
+        with self._decoded:
+            if self.decoding_bytes and self.decoding_bytes + nbytes > self.decode_bytes:
+                self.decode_waits += 1
+                while self.decoding_bytes and self.decoding_bytes + nbytes > self.decode_bytes:
+                    self._decoded.wait()
+            self.decoding_bytes += nbytes
+            self.peak_bytes = max(self.peak_bytes, self.used_bytes + self.decoding_bytes)
+        try:
+            yield
+        finally:
+            with self._decoded:
+                self.decoding_bytes -= nbytes
+                self._decoded.notify_all()
+
+
+class FrameStore:
+    def __init__(self, num_frames: int, width: int, height: int, budget: Optional[MemoryBudget] = None,
+                 spill_dir: Optional[str] = None):
+        """
+        Allocate storage for the frames of one job
+
+        :param num_frames: Number of frames
+        :param width: Frame width in pixels
+        :param height: Frame height in pixels
+        :param budget: Process-wide budget; without one frames always stay in memory
+        :param spill_dir: Directory for the memory-mapped file (default: system temp dir)
+        """
+        self.shape = (num_frames, height, width, 3)
+        self.frame_bytes = height * width * 3
+        self.nbytes = num_frames * self.frame_bytes
+        self.budget = budget
+        self.filled = np.zeros(num_frames, dtype=bool)
+        self._file = None
+        self._mmap = None
+
+        self.reserved = budget is None or budget.reserve(self.nbytes)
+        if self.reserved:
+            self.frames = np.empty(self.shape, dtype=np.uint8)
+        else:
+            self._file = tempfile.TemporaryFile(prefix='frames_', dir=spill_dir)
+            self._file.truncate(self.nbytes)
+            self._mmap = mmap.mmap(self._file.fileno(), self.nbytes)
+            self.frames = np.frombuffer(self._mmap, dtype=np.uint8).reshape(self.shape)
+
+    @property
+    def spilled(self) -> bool:
+        """Whether the frames live in a memory-mapped file"""
+        return self._mmap is not None
+
+    def put(self, index: int, image: Union[bytes, Image.Image, np.ndarray]) -> np.ndarray:
+        """
+        Store a frame, decoding and resizing it if needed
+
+        :param index: Frame number
+        :param image: Encoded image bytes, PIL Image or HxWx3 uint8 RGB array
+        :return: The stored frame (a view into the store)
+        """
+        if isinstance(image, (bytes, bytearray)):
+            with self._decoding(image):
+                # cv2 decodes to a single array we convert straight into the store;
+                # going through PIL would hold the decoded frame twice
+                decoded = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if decoded is None:
+                    raise ValueError("Could not decode image data")
+                if decoded.shape[:2] != self.shape[1:3]:
+                    decoded = cv2.resize(decoded, (self.shape[2], self.shape[1]), interpolation=cv2.INTER_AREA)
+                cv2.cvtColor(decoded, cv2.COLOR_BGR2RGB, dst=self.frames[index])
+                del decoded
+            return self._stored(index)
+        if isinstance(image, Image.Image):
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            if image.size != (self.shape[2], self.shape[1]):
+                image = image.resize((self.shape[2], self.shape[1]), Image.LANCZOS)
+            image = np.asarray(image)
+        self.frames[index] = image
+        return self._stored(index)
+
+    def get(self, index: int) -> np.ndarray:
+        """A stored frame (a view into the store, do not keep it past close())"""
+        return self.frames[index]
+
+    def __len__(self) -> int:
+        return int(self.filled.sum())
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        """Stored frames in order"""
+        for index in np.flatnonzero(self.filled):
+            yield self.frames[index]
+
+    def close(self) -> None:
+        """Free the frames and give the reservation back to the budget"""
+        self.frames = None
+        if self.reserved and self.budget is not None:
+            self.budget.release(self.nbytes)
+            self.reserved = False
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # a caller still holds a view; the mapping goes with it
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'FrameStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _decoding(self, data: bytes):
+        """Hold the budget's decode allowance for the scratch buffers of decoding this image"""
+        if self.budget is None:
+            return nullcontext()
+        try:
+            width, height = Image.open(io.BytesIO(data)).size  # reads the header only
+        except Exception:
+            width, height = self.shape[2], self.shape[1]  # cv2 may still decode it, or report it
+        nbytes = width * height * 3
+        if (height, width) != self.shape[1:3]:
+            nbytes += self.frame_bytes  # the resized copy
+        return self.budget.decoding(nbytes)
+
+    def _stored(self, index: int) -> np.ndarray:
+        self.filled[index] = True
+        if self.spilled:
+            self._drop_pages(index)
+        return self.frames[index]
+
+    def _drop_pages(self, index: int) -> None:
+        # The data stays in the page cache (and the file), just not in our RSS
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        start = index * self.frame_bytes
+        aligned = start - start % PAGE_SIZE
+        self._mmap.madvise(mmap.MADV_DONTNEED, aligned, start + self.frame_bytes - aligned)
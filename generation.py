@@ -0,0 +1,121 @@
+"""
+The frame pipeline shared by both apps
+
+Generating one frame of a job takes several steps that both Streamlit apps
+need in the same order: look the normalized request up in the frame cache,
+otherwise send it to a backend through the single-flight group (so
+identical requests in flight share one call) on the generation pool, stream
+step-level progress while it runs, store the decoded frame, validate it and
+request it again when it comes back blank, filtered or duplicated. The UI
+only comes in through callbacks, for progress snapshots and warnings.
+"""
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from backends import BackendRouter, ContentFiltered
+from progress import ProgressHub
+from prompt_index import prompt_key
+from singleflight import SingleFlight
+
+
+class FrameGenerator:
+    def __init__(self, router: BackendRouter, singleflight: SingleFlight, pool: Executor, hub: ProgressHub,
+                 cache=None):
+        """
+        Initialize the pipeline
+
+        :param router: Backend router the frames are generated on
+        :param singleflight: Group that coalesces identical requests in flight
+        :param pool: Executor the backend calls run on
+        :param hub: Progress pollers to follow the running calls with
+        :param cache: FrameCache of validated frames (None to always generate)
+        """
+        self.router = router
+        self.singleflight = singleflight
+        self.pool = pool
+        self.hub = hub
+        self.cache = cache
+
+    def generate(self, store, frame: int, prompt: str, negative_prompt: str = "", width: int = 1024,
+                 height: int = 1024, steps: int = 30, check=None, use_cache: bool = True,
+                 on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 on_warning: Optional[Callable[[str], None]] = None) -> Tuple[np.ndarray, bool]:
+        """
+        Generate one frame of a job into its frame store
+
+        Runs on the calling (script) thread while the backend call runs on
+        the pool, so the callbacks may touch the UI. With a check (see
+        frame_check.py), a frame that comes back blank, filtered or
+        duplicated is requested again on its own, up to check.retries times,
+        after which the last answer is kept; only frames that pass are cached.
+        Backends pick a random seed, so without use_cache the frame is
+        generated anew (a new variation) even if the request is cached.
+
+        :param store: FrameStore of the job
+        :param frame: Index of the frame in the job
+        :param prompt: Text prompt
+        :param negative_prompt: What to avoid in the generation
+        :param width: Image width
+        :param height: Image height
+        :param steps: Sampling steps
+        :param check: frame_check.JobCheck of the job (None to accept any frame)
+        :param use_cache: Whether a cached frame may be returned; the new frame is cached either way
+        :param on_progress: Called with each progress snapshot of the running call (see progress.py)
+        :param on_warning: Called with a message when a frame is requested again or kept despite a problem
+        :return: The stored frame as an RGB array, and whether it came from the cache
+        :raises BackendError: If no backend produced the frame
+        """
+        on_progress = on_progress or (lambda snapshot: None)
+        on_warning = on_warning or (lambda message: None)
+        # Prompts that only differ in case, whitespace or punctuation share cached frames,
+        # and identical requests already in flight (double clicks, other users) share one backend call
+        key = prompt_key(prompt, negative_prompt, width, height, steps, frame)
+        retries = check.retries if check is not None else 0
+        image, cached = None, False
+        for attempt in range(retries + 1):
+            # A cached frame is only trusted on the first attempt
+            image_data = self.cache.get(key) if self.cache is not None and use_cache and attempt == 0 else None
+            cached = image_data is not None
+            if not cached:
+                try:
+                    image_data = self._fetch(key, prompt, negative_prompt, width, height, steps, on_progress)
+                except ContentFiltered:
+                    if check is None or attempt == retries:
+                        raise
+                    check.reject(frame, 'filtered')
+                    on_warning(f"Frame {frame + 1} was filtered by the backend, requesting it again")
+                    continue
+            image = store.put(frame, image_data)
+            problem = check.check(frame, image) if check is not None else None
+            if problem is None:
+                if not cached and self.cache is not None:
+                    self.cache.put(key, image_data)
+                break
+            if attempt < retries:
+                on_warning(f"Frame {frame + 1} came back {problem}, requesting it again")
+            else:
+                on_warning(f"Frame {frame + 1} is still {problem} after {retries} retries, keeping it")
+        return image, cached
+
+    def _fetch(self, key: str, prompt: str, negative_prompt: str, width: int, height: int, steps: int,
+               on_progress: Callable[[Dict[str, Any]], None]) -> bytes:
+        singleflight, router = self.singleflight, self.router
+
+        def txt2img():
+            # Sessions coalesced onto this call follow its backend and task through the call's shared info
+            job = singleflight.info(key)
+            job['steps'] = steps
+
+            def on_backend(backend, task_id):
+                job.update(backend=backend, task_id=task_id)
+
+            return router.txt2img(prompt, negative_prompt, width, height, steps, on_backend=on_backend)
+
+        future = self.pool.submit(singleflight.do, key, txt2img)
+        return self.hub.follow(future, lambda: singleflight.info(key), on_progress)
+
+    def stats(self) -> Dict[str, Any]:
+        """Backend and coalescing statistics, for debug output"""
+        return {'backends': self.router.stats(), 'coalescing': self.singleflight.stats()}
@@ -1,46 +1,94 @@
+import argparse
 import os
+import tempfile
 import cv2
 import numpy as np
-from typing import List, Union
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+from encoding import EncodingProfile, encode
+from storyboard import Scene, scene_frames
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+
+def is_image(name: str) -> bool:
+    """
+    Whether a file name has an image extension, in any case (cameras write IMG_0001.JPG)
+
+    :param name: File name or path
+    :return: True for image files
+    """
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+# Codecs to try, in order of preference, when probing the local OpenCV build
+FOURCC_CANDIDATES = ('avc1', 'mp4v')
+
+
+def probe_fourcc(candidates: Tuple[str, ...] = FOURCC_CANDIDATES) -> str:
+    """
+    Find the first codec the local OpenCV build can actually write with
+    
+    opencv-python-headless wheels usually ship without an H.264 encoder, in
+    which case 'avc1' silently produces an empty file. Probing writes a tiny
+    clip per candidate, so callers should cache the result.
+    
+    :param candidates: FourCC codes to try, most preferred first
+    :return: The first working FourCC code, or the last candidate if none work
+    """
+    frame = np.zeros((16, 16, 3), dtype=np.uint8)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for code in candidates:
+            probe_path = os.path.join(tmp_dir, f'probe_{code}.mp4')
+            out = cv2.VideoWriter(probe_path, cv2.VideoWriter_fourcc(*code), 1, (16, 16))
+            if out.isOpened():
+                out.write(frame)
+            out.release()
+            if os.path.exists(probe_path) and os.path.getsize(probe_path) > 0:
+                return code
+    return candidates[-1]
+
 
 class ImageToVideoConverter:
-    def __init__(self, output_path: str = 'output_video.mp4', fps: int = 1):
+    def __init__(self, output_path: str = 'output_video.mp4', fps: int = 1, fourcc: str = 'avc1'):
         """
         Initialize the video converter
         
         :param output_path: Path where the output video will be saved
         :param fps: Frames per second (how long each image is shown)
+        :param fourcc: FourCC code of the codec to encode with (see probe_fourcc)
         """
         self.output_path = output_path
         self.fps = fps
+        self.fourcc = fourcc
     
-    def convert_images_to_video(self, image_folder: str) -> bool:
+    def convert_images_to_video(self, images: Union[str, List[str]]) -> bool:
         """
-        Convert images in a folder to a video
+        Convert images to a video
         
-        :param image_folder: Path to folder containing images
+        :param images: Path to folder containing images, or an ordered list of image paths
         :return: True if video created successfully, False otherwise
         """
         # Get list of image files
-        images = [f for f in os.listdir(image_folder) if f.endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif'))]
-        images.sort()  # Sort images to ensure consistent order
+        if isinstance(images, str):
+            image_folder = images
+            images = [f for f in os.listdir(image_folder) if is_image(f)]
+            images.sort()  # Sort images to ensure consistent order
+            images = [os.path.join(image_folder, image) for image in images]
         
         if not images:
             print("No images found in the specified folder.")
             return False
         
         # Read first image to get dimensions
-        first_image_path = os.path.join(image_folder, images[0])
-        frame = cv2.imread(first_image_path)
+        frame = cv2.imread(images[0])
         height, width, layers = frame.shape
         
         # Define the codec and create VideoWriter object
-        fourcc = cv2.VideoWriter_fourcc(*'avc1')
+        fourcc = cv2.VideoWriter_fourcc(*self.fourcc)
         out = cv2.VideoWriter(self.output_path, fourcc, self.fps, (width, height))
         
         # Write images to video
-        for image in images:
-            img_path = os.path.join(image_folder, image)
+        for img_path in images:
             frame = cv2.imread(img_path)
             
             # Resize image if needed to match first image's dimensions
@@ -54,6 +102,79 @@ class ImageToVideoConverter:
         print(f"Video saved to {self.output_path}")
         return True
     
+    def convert_frames_to_video(self, frames: Iterable[np.ndarray]) -> bool:
+        """
+        Convert already decoded frames to a video, without touching the disk
+        
+        :param frames: HxWx3 uint8 RGB arrays (e.g. a FrameStore), in order
+        :return: True if video created successfully, False otherwise
+        """
+        out = None
+        for frame in frames:
+            if out is None:
+                height, width = frame.shape[:2]
+                fourcc = cv2.VideoWriter_fourcc(*self.fourcc)
+                out = cv2.VideoWriter(self.output_path, fourcc, self.fps, (width, height))
+            
+            # Resize frame if needed to match first frame's dimensions
+            if frame.shape[:2] != (height, width):
+                frame = cv2.resize(frame, (width, height))
+            
+            out.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        
+        if out is None:
+            print("No frames to convert.")
+            return False
+        
+        # Release the video writer
+        out.release()
+        
+        print(f"Video saved to {self.output_path}")
+        return True
+    
+    def convert_frames_to_profiles(self, frames: Iterable[np.ndarray],
+                                   profiles: List[EncodingProfile]) -> Dict[str, Dict[str, Any]]:
+        """
+        Encode frames into several renditions (e.g. web preview and master) in one pass
+        
+        Each rendition is written next to output_path with the profile name
+        appended, e.g. video_web.mp4 and video_master.mp4.
+        
+        :param frames: HxWx3 uint8 RGB arrays (e.g. a FrameStore), in order
+        :param profiles: Encoding profiles to produce
+        :return: Per profile name: path, size_bytes, seconds, resolution, frames and encoder
+        """
+        root, ext = os.path.splitext(self.output_path)
+        outputs = [(profile, f"{root}_{profile.name}{ext or '.mp4'}") for profile in profiles]
+        results = encode(frames, outputs, self.fps, fourcc=self.fourcc)
+        
+        if not results:
+            print("No frames to convert.")
+            return {}
+        
+        for name, result in results.items():
+            print(f"{name} video saved to {result['path']} "
+                  f"({result['size_bytes'] / 1024:.0f} KiB, {result['seconds']:.2f}s)")
+        return results
+    
+    def convert_storyboard_to_profiles(self, keyframes: Iterable[np.ndarray], scenes: List[Scene],
+                                       profiles: List[EncodingProfile],
+                                       transition_seconds: float = 0.75) -> Dict[str, Dict[str, Any]]:
+        """
+        Assemble scene keyframes into a video with transitions, in one pass per profile set
+        
+        Frames (holds and blended transitions) are generated as they are
+        encoded, see storyboard.scene_frames.
+        
+        :param keyframes: HxWx3 uint8 RGB keyframe per scene (e.g. a FrameStore), in order
+        :param scenes: The scenes, with their durations and transitions
+        :param profiles: Encoding profiles to produce
+        :param transition_seconds: Length of each cross-fade or fade
+        :return: Per profile name: path, size_bytes, seconds, resolution, frames and encoder
+        """
+        return self.convert_frames_to_profiles(scene_frames(keyframes, scenes, self.fps, transition_seconds),
+                                               profiles)
+    
     @staticmethod
     def resize_images(image_folder: str, target_width: int = 1920, target_height: int = 1080) -> None:
         """
@@ -63,7 +184,7 @@ class ImageToVideoConverter:
         :param target_width: Desired width of images
         :param target_height: Desired height of images
         """
-        images = [f for f in os.listdir(image_folder) if f.endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif'))]
+        images = [f for f in os.listdir(image_folder) if is_image(f)]
         
         for image in images:
             img_path = os.path.join(image_folder, image)
@@ -78,12 +199,22 @@ class ImageToVideoConverter:
         print(f"Resized {len(images)} images to {target_width}x{target_height}")
 
 def main():
-    # Example usage
-    converter = ImageToVideoConverter(output_path='my_video.mp4', fps=1)
-    converter.convert_images_to_video('path/to/your/image/folder')
-    
-    # Optional: Resize images before conversion
-    # converter.resize_images('path/to/your/image/folder')
+    parser = argparse.ArgumentParser(description="Convert a folder of images into a video "
+                                                 "(see batch.py for many folders or prompt manifests)")
+    parser.add_argument('image_folder', help='folder containing the images, encoded in name order')
+    parser.add_argument('--output', '-o', default='output_video.mp4', help='video path (default: output_video.mp4)')
+    parser.add_argument('--fps', type=int, default=1, help='frames per second (default: 1)')
+    parser.add_argument('--resize', metavar='WIDTHxHEIGHT',
+                        help='resize the images in place to this size before converting')
+    args = parser.parse_args()
+
+    if args.resize:
+        target_width, target_height = (int(v) for v in args.resize.lower().split('x'))
+        ImageToVideoConverter.resize_images(args.image_folder, target_width, target_height)
+
+    converter = ImageToVideoConverter(output_path=args.output, fps=args.fps, fourcc=probe_fourcc())
+    if not converter.convert_images_to_video(args.image_folder):
+        raise SystemExit(1)
 
 if __name__ == '__main__':
     main()
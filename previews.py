@@ -0,0 +1,121 @@
+"""
+Small in-page previews of generated frames
+
+st.image() re-encodes whatever it is given (a full 1024x1024 frame becomes
+a quality-100 JPEG) and ships it to the browser. Instead, each frame is
+downscaled once (cv2 INTER_AREA, a vectorized box filter) and encoded once
+to a small JPEG, which Streamlit passes through untouched. A contact sheet
+of the whole sequence is assembled from the same thumbnails with a single
+reshape. Full-size frames only ever go to the video encoder.
+
+JPEG rather than WebP: Streamlit 1.31 re-encodes anything that is not
+JPEG/PNG/GIF, which would undo the point.
+"""
+import math
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+THUMBNAIL_SIZE = 256
+THUMBNAIL_QUALITY = 80
+
+
+def downscale(frame: np.ndarray, max_side: int = THUMBNAIL_SIZE) -> np.ndarray:
+    """
+    Shrink a frame so its longer side is at most max_side
+
+    :param frame: HxWxC uint8 array
+    :param max_side: Longest side of the result in pixels
+    :return: The downscaled frame (the input itself if already small enough)
+    """
+    height, width = frame.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return frame
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def encode_jpeg(frame: np.ndarray, quality: int = THUMBNAIL_QUALITY) -> bytes:
+    """
+    Encode an RGB frame as JPEG
+
+    :param frame: HxWx3 uint8 RGB array
+    :param quality: JPEG quality (0-100)
+    :return: JPEG bytes
+    """
+    ok, encoded = cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR),
+                               [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode preview")
+    return encoded.tobytes()
+
+
+def contact_sheet(thumbnails: List[np.ndarray], columns: int = 4, background: int = 0) -> np.ndarray:
+    """
+    Lay equally sized thumbnails out in a grid
+
+    :param thumbnails: HxWx3 uint8 arrays of the same shape, in order
+    :param columns: Thumbnails per row
+    :param background: Gray level of unused cells
+    :return: Grid image as one array
+    """
+    count = len(thumbnails)
+    columns = min(columns, count)
+    rows = math.ceil(count / columns)
+    height, width, channels = thumbnails[0].shape
+    cells = np.full((rows * columns, height, width, channels), background, dtype=np.uint8)
+    cells[:count] = np.stack(thumbnails)
+    return (cells.reshape(rows, columns, height, width, channels)
+            .transpose(0, 2, 1, 3, 4)
+            .reshape(rows * height, columns * width, channels))
+
+
+class JobPreviews:
+    def __init__(self, max_side: int = THUMBNAIL_SIZE, quality: int = THUMBNAIL_QUALITY, columns: int = 4):
+        """
+        Thumbnails of one job's frames, each encoded once
+
+        :param max_side: Longest side of a thumbnail in pixels
+        :param quality: JPEG quality of thumbnails and contact sheet
+        :param columns: Thumbnails per row of the contact sheet
+        """
+        self.max_side = max_side
+        self.quality = quality
+        self.columns = columns
+        self._thumbnails: Dict[int, np.ndarray] = {}
+        self._encoded: Dict[int, bytes] = {}
+        self._sheet: Optional[bytes] = None
+
+    def add(self, index: int, frame: np.ndarray) -> bytes:
+        """
+        Make the thumbnail of a frame
+
+        :param index: Frame number
+        :param frame: Full-size HxWx3 uint8 RGB frame
+        :return: JPEG bytes to pass to st.image
+        """
+        thumbnail = downscale(frame, self.max_side)
+        if thumbnail is frame:
+            thumbnail = frame.copy()  # do not keep a view into the caller's frame store
+        self._thumbnails[index] = thumbnail
+        self._encoded[index] = encode_jpeg(thumbnail, self.quality)
+        self._sheet = None
+        return self._encoded[index]
+
+    def thumbnail(self, index: int) -> bytes:
+        """JPEG bytes of a frame's thumbnail"""
+        return self._encoded[index]
+
+    def contact_sheet(self) -> bytes:
+        """JPEG bytes of all thumbnails in a grid (built once until another frame is added)"""
+        if self._sheet is None:
+            thumbnails = [self._thumbnails[index] for index in sorted(self._thumbnails)]
+            self._sheet = encode_jpeg(contact_sheet(thumbnails, self.columns), self.quality)
+        return self._sheet
+
+    @property
+    def nbytes(self) -> int:
+        """Total bytes of encoded previews"""
+        return sum(len(data) for data in self._encoded.values()) + len(self._sheet or b'')
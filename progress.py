@@ -0,0 +1,204 @@
+"""
+Step-level generation progress from the WebUI /internal/progress endpoint
+
+Every txt2img request carries its own task id (force_task_id, see
+backends.BackendRouter.txt2img), and progress is asked for by that id: the
+WebUI only reports steps and a live preview for the task it is running, so
+sessions never see another request's image. A box serves many requests at
+once (one per generation worker), which is why the older
+/sdapi/v1/progress endpoint, reporting whatever job is running, is not
+used. WebUI versions without force_task_id (before 1.7) show no step
+progress at all.
+
+One ProgressPoller runs per task and only while somebody is watching: it
+issues a single request per interval no matter how many sessions are
+viewing (coalesced sessions share a task), decodes the live preview once
+per change and shrinks it to a thumbnail. Sessions just read the latest
+snapshot.
+"""
+import base64
+import io
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from PIL import Image
+
+PREVIEW_SIZE = (256, 256)
+
+
+class ProgressPoller:
+    def __init__(self, session: requests.Session, base_url: str, task_id: str, steps: int = 0,
+                 interval: float = 0.5, idle_timeout: float = 0.0):
+        """
+        Initialize the poller (the polling thread starts with the first watcher)
+
+        :param session: HTTP session to poll with
+        :param base_url: WebUI base URL
+        :param task_id: Task id the request was sent with
+        :param steps: Sampling steps of the request, to report the current step
+        :param interval: Seconds between progress requests
+        :param idle_timeout: Seconds the thread keeps running after the last watcher leaves
+        """
+        self.session = session
+        self.base_url = base_url.rstrip('/')
+        self.task_id = task_id
+        self.steps = steps
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.requests = 0
+        self._snapshot: Dict[str, Any] = {'progress': 0.0, 'step': 0, 'steps': steps, 'eta': None,
+                                          'preview': None, 'queued': False, 'updated': 0.0}
+        self._preview_id = -1
+        self._watchers = 0
+        self._idle_since = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def watch(self) -> None:
+        """Register a watcher, starting the polling thread if needed"""
+        with self._lock:
+            self._watchers += 1
+            self._idle_since = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"progress-{self.task_id}", daemon=True)
+                self._thread.start()
+
+    def unwatch(self) -> None:
+        """Unregister a watcher"""
+        with self._lock:
+            self._watchers -= 1
+            if self._watchers == 0:
+                self._idle_since = time.monotonic()
+
+    def idle(self) -> bool:
+        """Whether nobody watches and the polling thread has stopped (or is about to)"""
+        with self._lock:
+            return self._watchers == 0
+
+    def latest(self) -> Dict[str, Any]:
+        """
+        Most recent progress snapshot
+
+        :return: dict with progress (0..1), step, steps, eta (seconds), preview (JPEG
+                 bytes or None), queued (waiting for the box) and updated (monotonic time)
+        """
+        with self._lock:
+            return dict(self._snapshot)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if self._watchers == 0 and time.monotonic() - (self._idle_since or 0) >= self.idle_timeout:
+                    self._thread = None
+                    return
+            started = time.monotonic()
+            try:
+                self._poll()
+            except Exception:
+                pass  # a missed sample is not worth failing anyone's job over
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def _poll(self) -> None:
+        response = self.session.post(f"{self.base_url}/internal/progress", timeout=self.interval * 4,
+                                     json={'id_task': self.task_id, 'id_live_preview': self._preview_id,
+                                           'live_preview': True})
+        self.requests += 1
+        data = response.json()
+        if not data.get('active') and not data.get('queued'):
+            return  # not started under this id (yet), or already finished
+
+        preview = None
+        live_preview = data.get('live_preview')
+        if data.get('active') and live_preview:
+            encoded = live_preview.split(',', 1)[-1]  # data:image/...;base64,<data>
+            thumbnail = Image.open(io.BytesIO(base64.b64decode(encoded))).convert('RGB')
+            thumbnail.thumbnail(PREVIEW_SIZE)
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, format='JPEG', quality=80)
+            preview = buffer.getvalue()
+
+        progress = float(data.get('progress') or 0.0)
+        with self._lock:
+            if preview is not None:
+                self._preview_id = data.get('id_live_preview', self._preview_id)
+                self._snapshot['preview'] = preview
+            self._snapshot.update({
+                'progress': progress,
+                'step': int(progress * self.steps),
+                'eta': data.get('eta'),
+                'queued': bool(data.get('queued')) and not data.get('active'),
+                'updated': time.monotonic(),
+            })
+
+
+class ProgressHub:
+    def __init__(self, session: requests.Session, interval: float = 0.5):
+        """
+        Registry of pollers, one per watched task
+
+        :param session: HTTP session the pollers share
+        :param interval: Seconds between progress requests per task
+        """
+        self.session = session
+        self.interval = interval
+        self._pollers: Dict[Tuple[str, str], ProgressPoller] = {}
+        self._lock = threading.Lock()
+
+    def watch(self, base_url: str, task_id: str, steps: int = 0) -> ProgressPoller:
+        """
+        Get (or create) the poller of a task and register a watcher (call unwatch when done)
+
+        :param base_url: WebUI base URL the task was sent to
+        :param task_id: Task id the request was sent with
+        :param steps: Sampling steps of the request
+        :return: The task's poller
+        """
+        with self._lock:
+            for key in [key for key, poller in self._pollers.items() if poller.idle()]:
+                del self._pollers[key]  # finished tasks
+            poller = self._pollers.get((base_url, task_id))
+            if poller is None:
+                poller = self._pollers[(base_url, task_id)] = ProgressPoller(self.session, base_url, task_id, steps,
+                                                                             self.interval)
+            poller.watch()
+            return poller
+
+    def follow(self, future: Future, get_job: Callable[[], Optional[Dict[str, Any]]],
+               on_update: Callable[[Dict[str, Any]], None], tick: float = 0.25) -> Any:
+        """
+        Report step-level progress until a generation future completes
+
+        Runs on the calling (script) thread, so on_update may touch the UI.
+
+        :param future: Future of the running generation
+        :param get_job: Returns what is known about the request so far: a dict with the serving
+                        'backend', the 'task_id' it was sent with and its sampling 'steps' (or None)
+        :param on_update: Called with each new progress snapshot
+        :param tick: Seconds between UI updates
+        :return: The future's result
+        """
+        poller = None
+        last_update = time.monotonic()  # ignore snapshots from before we started
+        try:
+            while True:
+                job = get_job() or {}
+                backend, task_id = job.get('backend'), job.get('task_id')
+                if backend is not None and task_id and 'progress' in backend.capabilities and \
+                        (poller is None or (poller.base_url, poller.task_id) != (backend.url, task_id)):
+                    if poller is not None:
+                        poller.unwatch()
+                    poller = self.watch(backend.url, task_id, job.get('steps', 0))
+                if poller is not None:
+                    snapshot = poller.latest()
+                    if snapshot['updated'] > last_update:
+                        last_update = snapshot['updated']
+                        on_update(snapshot)
+                done, _ = wait([future], timeout=tick)
+                if done:
+                    return future.result()
+        finally:
+            if poller is not None:
+                poller.unwatch()
@@ -0,0 +1,290 @@
+"""
+Prompt normalization and a near-duplicate index of past generations
+
+Prompts that differ only by case, whitespace or punctuation are the same
+request: normalize_prompt() maps them to one canonical text and
+prompt_key() hashes it together with the generation settings, so such
+prompts share frame cache entries and in-flight backend calls. Word order
+is kept, since it changes the meaning ("red car on a blue road" is not
+"blue car on a red road").
+
+PromptIndex finds past jobs whose prompt is merely similar. Each prompt's
+word set gets a MinHash signature (a vectorized min over hashed tokens);
+signatures are split into bands, and two prompts become candidates when any
+band matches exactly (locality-sensitive hashing). Band hashes are kept in
+sorted numpy arrays searched with searchsorted, plus a small dict of recent
+additions merged in batches, so a lookup is a handful of binary searches
+regardless of the index size. Records are held as JSON strings and only
+decoded for the few results returned, so 100k prompts take a few tens of MB.
+Records can belong to an owner (a username); lookups only return records
+of the owner they are made for, so users never see each other's prompts.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from singleflight import make_key
+
+NUM_BANDS = 10
+BAND_ROWS = 4
+NUM_PERM = NUM_BANDS * BAND_ROWS
+PRIME = 4294967291  # largest prime below 2**32, so signature values fit uint32
+
+_rng = np.random.default_rng(0x5EED)  # fixed so signatures are stable across processes
+_PERM_A = _rng.integers(1, 2 ** 31, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 2 ** 31, NUM_PERM, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, 2 ** 63, BAND_ROWS, dtype=np.uint64) | np.uint64(1)
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Words of a prompt, case- and punctuation-insensitive
+
+    :param text: Prompt as typed
+    :return: Lower-case words in their original order
+    """
+    return _TOKEN.findall(unicodedata.normalize('NFKC', text or '').casefold())
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Canonical form of a prompt: case, whitespace and punctuation removed
+
+    :param text: Prompt as typed
+    :return: Lower-case words joined by single spaces
+    """
+    return ' '.join(tokenize(text))
+
+
+def prompt_key(prompt: str, negative_prompt: str, *settings) -> str:
+    """
+    Cache and coalescing key for a request, equal for equivalent prompts
+
+    :param prompt: Prompt as typed
+    :param negative_prompt: Negative prompt as typed
+    :param settings: Remaining request parameters (size, steps, frame, ...)
+    :return: Hex digest
+    """
+    return make_key('txt2img', normalize_prompt(prompt), normalize_prompt(negative_prompt), *settings)
+
+
+@lru_cache(maxsize=65536)
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=4).digest(), 'little')
+
+
+def minhash(tokens: List[str]) -> np.ndarray:
+    """
+    MinHash signature of a set of words
+
+    :param tokens: Words (duplicates are ignored)
+    :return: NUM_PERM uint32 values; the share of equal values between two
+             signatures estimates the Jaccard similarity of the word sets
+    """
+    return minhash_many([tokens])[0]
+
+
+def minhash_many(token_lists: List[List[str]]) -> np.ndarray:
+    """
+    MinHash signatures of many word sets at once
+
+    All tokens are hashed in one array and reduced per prompt with
+    np.minimum.reduceat.
+
+    :param token_lists: One list of words per prompt
+    :return: (len(token_lists), NUM_PERM) uint32 array
+    """
+    sets = [set(tokens) for tokens in token_lists]
+    lengths = np.fromiter((len(words) for words in sets), dtype=np.int64, count=len(sets))
+    signatures = np.full((len(sets), NUM_PERM), PRIME - 1, dtype=np.uint32)
+    present = lengths > 0
+    if not present.any():
+        return signatures
+    hashes = np.fromiter((_token_hash(token) for words in sets for token in words), dtype=np.uint64,
+                         count=int(lengths.sum()))
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % PRIME
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))[present]
+    signatures[present] = np.minimum.reduceat(permuted, offsets, axis=0)
+    return signatures
+
+
+def band_hashes(signatures: np.ndarray) -> np.ndarray:
+    """
+    One 64-bit hash per band of each signature
+
+    :param signatures: (n, NUM_PERM) or (NUM_PERM,) uint32 array
+    :return: (n, NUM_BANDS) or (NUM_BANDS,) uint64 array
+    """
+    bands = signatures.astype(np.uint64).reshape(signatures.shape[:-1] + (NUM_BANDS, BAND_ROWS))
+    return (bands * _BAND_MIX).sum(axis=-1, dtype=np.uint64)  # wraps around, which is fine for hashing
+
+
+def _exact_key(prompt: str, negative_prompt: str, owner: Optional[str] = None) -> bytes:
+    text = normalize_prompt(prompt) + '\x00' + normalize_prompt(negative_prompt) + '\x00' + (owner or '')
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+class PromptIndex:
+    def __init__(self, path: Optional[str] = None, merge_every: int = 1024, max_bucket: int = 64):
+        """
+        Index of past jobs by prompt
+
+        :param path: JSONL file the index is loaded from and appended to (None keeps it in memory)
+        :param merge_every: Additions kept in the recent dict before they are merged into the sorted bands
+        :param max_bucket: Bands shared by more prompts than this are skipped at lookup; such
+                           values come from boilerplate words ("photo", "8k") and say nothing
+        """
+        self.path = path
+        self.merge_every = merge_every
+        self.max_bucket = max_bucket
+        self._records: List[str] = []  # JSON, decoded only when returned
+        self._owners: List[Optional[str]] = []
+        self._signatures = np.empty((0, NUM_PERM), dtype=np.uint32)
+        self._bands = np.empty((0, NUM_BANDS), dtype=np.uint64)
+        self._exact: Dict[bytes, int] = {}
+        self._sorted_hashes = [np.empty(0, dtype=np.uint64) for _ in range(NUM_BANDS)]
+        self._sorted_ids = [np.empty(0, dtype=np.int64) for _ in range(NUM_BANDS)]
+        self._recent: List[Dict[int, List[int]]] = [{} for _ in range(NUM_BANDS)]
+        self._merged = 0  # entries below this are in the sorted arrays
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, prompt: str, negative_prompt: str = '', owner: Optional[str] = None, **details) -> Dict[str, Any]:
+        """
+        Record a finished job
+
+        A job of the same owner whose normalized prompts match an indexed one replaces its record.
+
+        :param prompt: Prompt as typed
+        :param negative_prompt: Negative prompt as typed
+        :param owner: User the job belongs to (None for jobs without one)
+        :param details: JSON-serializable job details (settings, video path, ...)
+        :return: The stored record
+        """
+        record = dict(details, prompt=prompt, negative_prompt=negative_prompt, owner=owner, created=time.time())
+        line = json.dumps(record)
+        signature = minhash(tokenize(prompt))
+        with self._lock:
+            self._insert(_exact_key(prompt, negative_prompt, owner), owner, line, signature,
+                         band_hashes(signature))
+            if len(self._records) - self._merged >= self.merge_every:
+                self._merge()
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(line + '\n')
+        return record
+
+    def similar(self, prompt: str, negative_prompt: str = '', owner: Optional[str] = None, threshold: float = 0.7,
+                limit: int = 3) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Past jobs of an owner with a near-identical prompt
+
+        Similarity compares the words of the prompts; the negative prompt
+        only counts for identical matches.
+
+        :param prompt: Prompt as typed
+        :param negative_prompt: Negative prompt as typed
+        :param owner: Only jobs of this user (None: only jobs without an owner)
+        :param threshold: Least estimated similarity (share of equal MinHash values, 0-1)
+        :param limit: Max results
+        :return: (similarity, record) pairs, most similar first; 1.0 means identical after normalization
+        """
+        exact_key = _exact_key(prompt, negative_prompt, owner)
+        signature = minhash(tokenize(prompt))
+        hashes = band_hashes(signature)
+
+        with self._lock:
+            exact = self._exact.get(exact_key)
+            found = []
+            for band in range(NUM_BANDS):
+                sorted_hashes = self._sorted_hashes[band]
+                start = sorted_hashes.searchsorted(hashes[band], side='left')
+                end = sorted_hashes.searchsorted(hashes[band], side='right')
+                if end - start <= self.max_bucket:
+                    found.append(self._sorted_ids[band][start:end])
+                recent = self._recent[band].get(int(hashes[band]))
+                if recent:
+                    found.append(np.asarray(recent, dtype=np.int64))
+            ids = np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+            mine = np.fromiter(((self._owners[entry] or '') == (owner or '') for entry in ids), dtype=bool,
+                               count=len(ids))
+            ids = ids[mine]
+            scores = (self._signatures[ids] == signature).mean(axis=1)
+            records = self._records
+
+        results = [(1.0, json.loads(records[exact]))] if exact is not None else []
+        for index in np.argsort(-scores, kind='stable'):
+            entry = int(ids[index])
+            if entry == exact:
+                continue
+            score = min(float(scores[index]), 0.99)  # 1.0 is kept for identical prompts
+            if score < threshold or len(results) >= limit:
+                break
+            results.append((score, json.loads(records[entry])))
+        return results
+
+    def _insert(self, exact_key: bytes, owner: Optional[str], line: str, signature: np.ndarray, bands: np.ndarray,
+                recent: bool = True) -> None:
+        """Add or replace an entry (call with the lock held)"""
+        existing = self._exact.get(exact_key)
+        if existing is not None:
+            self._records[existing] = line
+            return
+
+        entry = len(self._records)
+        self._records.append(line)
+        self._owners.append(owner)
+        self._exact[exact_key] = entry
+        if entry == len(self._signatures):
+            capacity = max(1024, 2 * entry)
+            self._signatures = np.resize(self._signatures, (capacity, NUM_PERM))
+            self._bands = np.resize(self._bands, (capacity, NUM_BANDS))
+        self._signatures[entry] = signature
+        self._bands[entry] = bands
+        if recent:
+            for band in range(NUM_BANDS):
+                self._recent[band].setdefault(int(bands[band]), []).append(entry)
+
+    def _merge(self) -> None:
+        """Move recent additions into the sorted band arrays (call with the lock held)"""
+        count = len(self._records)
+        new_ids = np.arange(self._merged, count, dtype=np.int64)
+        for band in range(NUM_BANDS):
+            # The old part is already one sorted run, so this stable sort is close to a linear merge
+            hashes = np.concatenate((self._sorted_hashes[band], self._bands[self._merged:count, band]))
+            ids = np.concatenate((self._sorted_ids[band], new_ids))
+            order = np.argsort(hashes, kind='stable')
+            self._sorted_hashes[band] = hashes[order]
+            self._sorted_ids[band] = ids[order]
+            self._recent[band] = {}
+        self._merged = count
+
+    def _load(self, path: str, chunk: int = 4096) -> None:
+        with open(path) as f:
+            lines = [line.strip() for line in f if line.strip()]
+        with self._lock:
+            for start in range(0, len(lines), chunk):
+                batch = lines[start:start + chunk]
+                records = [json.loads(line) for line in batch]
+                signatures = minhash_many([tokenize(record['prompt']) for record in records])
+                bands = band_hashes(signatures)
+                for line, record, signature, band in zip(batch, records, signatures, bands):
+                    owner = record.get('owner')
+                    self._insert(_exact_key(record['prompt'], record.get('negative_prompt', ''), owner), owner,
+                                 line, signature, band, recent=False)
+            self._merge()
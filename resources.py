@@ -0,0 +1,295 @@
+"""
+Process-wide resources shared by every Streamlit session
+
+Streamlit reruns the whole page script on every widget interaction, so
+anything that is expensive to build (config parsing, HTTP connection pools,
+codec probing, heavy imports such as cv2 and stripe) lives here behind
+st.cache_resource and is built at most once per process.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+import yaml
+
+CONFIG_PATH = os.getenv('APP_CONFIG', 'config.yaml')
+
+
+@st.cache_resource
+def load_environment() -> bool:
+    """
+    Load variables from .env into the process environment (once per process)
+
+    :return: True if a .env file was found and loaded
+    """
+    from dotenv import load_dotenv
+    return load_dotenv()
+
+
+@st.cache_resource
+def get_config() -> Dict[str, Any]:
+    """
+    Load config.yaml once, applying environment overrides
+
+    Callers must treat the returned dict as read-only since it is shared
+    between all sessions.
+
+    :return: Parsed configuration
+    """
+    load_environment()
+    with open(CONFIG_PATH) as file:
+        config = yaml.safe_load(file) or {}
+
+    config.setdefault('cookie', {})
+    config['cookie']['key'] = os.getenv('COOKIE_KEY', config['cookie'].get('key'))
+    config['debug'] = os.getenv('DEBUG', '').lower() in ('1', 'true', 'yes')
+    return config
+
+
+@st.cache_resource
+def get_backend_session() -> requests.Session:
+    """
+    HTTP client for the image generation backends
+
+    A single pooled session keeps TLS connections to the backends alive across
+    frames and reruns instead of re-handshaking on every request. Every
+    generation worker can be waiting on one box at once, each with a progress
+    poller beside it, so the pool keeps that many connections per host
+    (requests' default of 10 would close the rest after each request).
+
+    :return: Session with the JSON API headers preset
+    """
+    workers = get_config().get('generation', {}).get('workers', 16)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=2 * workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+    })
+    return session
+
+
+@st.cache_resource
+def get_router(kind: Optional[str] = None):
+    """
+    Shared backend router, so latency and health statistics span all sessions
+
+    :param kind: Only route to backends of this kind ('stability' or 'webui')
+    :return: BackendRouter instance
+    """
+    from backends import BackendRouter
+    load_environment()
+    routing = get_config().get('routing', {})
+    return BackendRouter.from_config(get_config().get('backends'), kind=kind,
+                                     session=get_backend_session(), **routing)
+
+
+@st.cache_resource
+def get_auth():
+    """
+    Shared authenticator: the user index from config.yaml and the password-checking pool
+
+    :return: Authenticator instance
+    """
+    from auth import PLACEHOLDER_KEY, Authenticator
+    config = get_config()
+    if config['cookie'].get('key') in (None, '', PLACEHOLDER_KEY):
+        print("Warning: COOKIE_KEY is not set; logins are remembered only until the process restarts")
+    return Authenticator.from_config(config, **config.get('auth', {}))
+
+
+@st.cache_resource
+def get_singleflight():
+    """
+    Shared single-flight group, so identical requests coalesce across sessions
+
+    :return: SingleFlight instance
+    """
+    from singleflight import SingleFlight
+    return SingleFlight()
+
+
+@st.cache_resource
+def get_generation_pool() -> ThreadPoolExecutor:
+    """
+    Worker threads that run backend calls while script threads stream progress
+
+    :return: Shared thread pool
+    """
+    return ThreadPoolExecutor(max_workers=get_config().get('generation', {}).get('workers', 16),
+                              thread_name_prefix='generate')
+
+
+@st.cache_resource
+def get_progress_hub():
+    """
+    Shared progress pollers, one per WebUI box regardless of how many sessions watch
+
+    :return: ProgressHub instance
+    """
+    from progress import ProgressHub
+    return ProgressHub(get_backend_session(), interval=get_config().get('progress', {}).get('interval', 0.5))
+
+
+@st.cache_resource
+def get_frame_generator(kind: Optional[str] = None):
+    """
+    Shared frame pipeline: cache, coalescing, backend routing and progress in one place
+
+    :param kind: Only generate on backends of this kind ('stability' or 'webui')
+    :return: FrameGenerator instance
+    """
+    from generation import FrameGenerator
+    return FrameGenerator(get_router(kind), get_singleflight(), get_generation_pool(), get_progress_hub(),
+                          cache=get_frame_cache())
+
+
+@st.cache_resource
+def get_stripe():
+    """
+    Import and configure the stripe module on first use
+
+    :return: The stripe module with its API key set
+    """
+    load_environment()
+    import stripe
+    stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+    # Point at a local stub (benchmarks/stripe_stub.py) when set
+    stripe.api_base = os.getenv('STRIPE_API_BASE', stripe.api_base)
+    return stripe
+
+
+@st.cache_resource
+def get_billing():
+    """
+    Shared billing manager (checkout sessions and tier cache)
+
+    :return: BillingManager instance
+    """
+    from billing import BillingManager
+    billing_config = get_config()['billing']
+    return BillingManager(
+        get_stripe(),
+        billing_config['prices'],
+        tier_ttl=billing_config.get('tier_cache_ttl', 300),
+        failure_backoff=billing_config.get('tier_lookup_backoff', 30),
+    )
+
+
+@st.cache_resource
+def get_fourcc() -> str:
+    """
+    Probe the OpenCV build for a working video codec (once per process)
+
+    :return: FourCC code to encode with
+    """
+    from image_to_video import probe_fourcc
+    return probe_fourcc()
+
+
+@st.cache_resource
+def get_encoding_profiles():
+    """
+    Output renditions from the encoding section of config.yaml
+
+    Also locates ffmpeg once, so the first job does not pay for it.
+
+    :return: EncodingProfile instances by name ('web', 'master', ...)
+    """
+    from encoding import find_ffmpeg, load_profiles
+    find_ffmpeg()
+    return load_profiles(get_config().get('encoding', {}).get('profiles'))
+
+
+@st.cache_resource
+def get_frame_budget():
+    """
+    Memory budget shared by the frame stores of all sessions in this process
+
+    :return: MemoryBudget instance
+    """
+    from frame_store import MemoryBudget
+    settings = get_config().get('frame_store', {})
+    decode_mb = settings.get('decode_mb')
+    return MemoryBudget(settings.get('budget_mb', 512) * 1024 * 1024,
+                        decode_bytes=decode_mb * 1024 * 1024 if decode_mb is not None else None)
+
+
+@st.cache_resource
+def get_frame_cache():
+    """
+    Disk cache of generated frames by normalized request, shared by all sessions
+
+    :return: FrameCache instance
+    """
+    from result_cache import FrameCache
+    settings = get_config().get('prompt_cache', {})
+    return FrameCache(settings.get('dir', 'cache'), settings.get('max_mb', 1024) * 1024 * 1024)
+
+
+@st.cache_resource
+def get_prompt_index():
+    """
+    Near-duplicate index of past jobs, loaded from the prompt cache directory once per process
+
+    :return: PromptIndex instance
+    """
+    from prompt_index import PromptIndex
+    directory = get_config().get('prompt_cache', {}).get('dir', 'cache')
+    os.makedirs(directory, exist_ok=True)
+    return PromptIndex(os.path.join(directory, 'prompts.jsonl'))
+
+
+@st.cache_resource
+def get_frame_validator():
+    """
+    Frame checks shared by all sessions, so their counters cover the whole process
+
+    :return: FrameValidator instance
+    """
+    from frame_check import FrameValidator
+    return FrameValidator.from_config(get_config().get('frame_check'))
+
+
+def new_frame_store(num_frames: int, width: int, height: int):
+    """
+    Create storage for the frames of one job, within the process memory budget
+
+    :param num_frames: Number of frames
+    :param width: Frame width
+    :param height: Frame height
+    :return: FrameStore instance (use as a context manager)
+    """
+    from frame_store import FrameStore
+    spill_dir = get_config().get('frame_store', {}).get('spill_dir')
+    return FrameStore(num_frames, width, height, budget=get_frame_budget(), spill_dir=spill_dir)
+
+
+def new_previews():
+    """
+    Create the thumbnail/contact sheet builder for one job (imports cv2 on first use)
+
+    :return: JobPreviews instance
+    """
+    from previews import JobPreviews
+    return JobPreviews()
+
+
+def new_converter(output_path: str, fps: int):
+    """
+    Create a video converter using the probed codec
+
+    image_to_video (and with it cv2) is only imported the first time a video
+    is actually encoded.
+
+    :param output_path: Path where the output video will be saved
+    :param fps: Frames per second
+    :return: ImageToVideoConverter instance
+    """
+    from image_to_video import ImageToVideoConverter
+    return ImageToVideoConverter(output_path=output_path, fps=fps, fourcc=get_fourcc())
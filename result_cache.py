@@ -0,0 +1,99 @@
+"""
+Disk cache of generated frames
+
+Backend responses (encoded image bytes) are stored under their request key
+(prompt_index.prompt_key), so a request that is identical after prompt
+normalization is answered without calling a backend. The cache is bounded
+in bytes and evicts the least recently used files first.
+"""
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class FrameCache:
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Open (or create) a cache directory
+
+        :param directory: Where cached frames are kept
+        :param max_bytes: Total size allowed before the least recently used frames are removed
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()  # key -> size, least recently used first
+        self._bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith('.img'):
+                stat = os.stat(os.path.join(directory, name))
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.img')
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Cached bytes for a key
+
+        :param key: Request key
+        :return: The bytes, or None if not cached
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._bytes -= self._entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        Store bytes under a key, evicting old entries past max_bytes
+
+        :param key: Request key
+        :param data: Encoded image bytes
+        """
+        # Write to a temp file and rename, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+        evicted = []
+        with self._lock:
+            self._bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self._bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        """Entries, bytes, hits and misses so far"""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
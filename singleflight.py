@@ -0,0 +1,114 @@
+"""
+Coalescing of identical in-flight calls ("single flight")
+
+When several sessions ask for the same thing at the same time (two users
+with the same prompt, a double-clicked "Generate Video"), only the first
+caller runs the backend call; the others wait for and share its result.
+Nothing is cached once the call completes. While it runs, the call has a
+small shared dict (see SingleFlight.info) where the running caller can put
+details every waiting caller may want, e.g. which backend is serving it.
+"""
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Optional
+
+
+def make_key(*parts) -> str:
+    """
+    Stable key for a request payload
+
+    :param parts: JSON-serializable values identifying the request
+    :return: Hex digest
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+        self.info: Dict[str, Any] = {}
+
+
+class SingleFlight:
+    def __init__(self):
+        """Initialize an empty set of in-flight calls"""
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.calls = 0  # calls actually executed
+        self.deduped = 0  # callers served by another caller's call
+
+    def do(self, key: str, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Run fn unless an identical call is already in flight, then share its result
+
+        A failure of the running call is raised to every caller waiting on it.
+        If the running caller is cancelled instead (KeyboardInterrupt, a
+        Streamlit rerun/stop, ...), waiters do not inherit that: one of them
+        takes over and runs the call itself.
+
+        :param key: Identity of the call (see make_key)
+        :param fn: Function to run
+        :param timeout: Max seconds to wait for another caller's result
+        :return: Result of fn
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.calls += 1
+                else:
+                    self.deduped += 1
+
+            if leader:
+                return self._run(key, call, fn, args, kwargs)
+
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"Timed out waiting for in-flight call {key[:12]}")
+            if call.cancelled:
+                with self._lock:
+                    self.deduped -= 1
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+    def info(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Shared details of the in-flight call for a key
+
+        The running call may write to the dict (call this from inside fn),
+        callers waiting on it read it. A caller taking over a cancelled call
+        gets a fresh dict.
+
+        :param key: Identity of the call (see make_key)
+        :return: The call's dict, or None if no call for the key is in flight
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            return call.info if call is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        """Counters: executed calls, deduplicated callers and calls in flight"""
+        with self._lock:
+            return {'calls': self.calls, 'deduped': self.deduped, 'in_flight': len(self._calls)}
+
+    def _run(self, key: str, call: _Call, fn, args, kwargs):
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            call.cancelled = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -0,0 +1,194 @@
+"""
+Storyboard mode: a video made of scenes, each with its own prompt
+
+A scene is rendered as one keyframe, independently of the others: all
+keyframes are requested in parallel, and each is cached on its own under
+the same key as frame 0 of a single-prompt job (prompt_index.prompt_key),
+so editing one scene re-renders only that scene. The video holds each
+keyframe for the scene's duration and ends it with the scene's transition
+into the next one. The frames of a transition are blended all at once with
+integer numpy arithmetic and streamed to the encoder, so a long storyboard
+never holds more than one transition in memory.
+"""
+import math
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from backends import ContentFiltered
+
+TRANSITIONS = ('crossfade', 'fade', 'cut')  # fade goes through black
+
+# Frames blended per numpy operation; bounds the uint16 intermediates
+BLEND_CHUNK = 4
+
+
+class Scene:
+    def __init__(self, prompt: str, duration: float = 3.0, transition: str = 'crossfade'):
+        """
+        One scene of a storyboard
+
+        :param prompt: What the scene shows
+        :param duration: Seconds on screen, including the transition at its end
+        :param transition: How the scene ends: 'crossfade' into the next scene, 'fade' through black, or 'cut'
+        """
+        if transition not in TRANSITIONS:
+            raise ValueError(f"Unknown transition '{transition}' (expected one of {', '.join(TRANSITIONS)})")
+        if not math.isfinite(duration) or duration <= 0:
+            raise ValueError(f"Scene duration must be a positive number of seconds, not {duration}")
+        self.prompt = prompt
+        self.duration = duration
+        self.transition = transition
+
+
+def parse_scenes(rows: Sequence[Dict[str, Any]]) -> List[Scene]:
+    """
+    Build scenes from table rows (e.g. st.data_editor output), skipping rows without a prompt
+
+    :param rows: Dicts with 'prompt' and optional 'duration' and 'transition'
+    :return: Scenes in order
+    :raises ValueError: If a row has an invalid duration or transition (the message names the row)
+    """
+    scenes = []
+    for number, row in enumerate(rows, 1):
+        prompt = (row.get('prompt') or '').strip()
+        if prompt:
+            try:
+                scenes.append(Scene(prompt, float(row.get('duration') or 3.0), row.get('transition') or 'crossfade'))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Row {number}: {e}") from e
+    return scenes
+
+
+def blend(start: np.ndarray, end: np.ndarray, count: int) -> Iterator[np.ndarray]:
+    """
+    Frames going from one image to another, computed a few at a time
+
+    :param start: HxWx3 uint8 frame to blend from
+    :param end: HxWx3 uint8 frame to blend to
+    :param count: Number of in-between frames (start and end themselves are not included)
+    :return: Iterator over HxWx3 uint8 frames
+    """
+    weights = (np.arange(1, count + 1, dtype=np.uint16) * 256 // (count + 1))[:, None, None, None]
+    start16 = start.astype(np.uint16)
+    end16 = end.astype(np.uint16)
+    for offset in range(0, count, BLEND_CHUNK):
+        w = weights[offset:offset + BLEND_CHUNK]
+        yield from ((start16 * (256 - w) + end16 * w) >> 8).astype(np.uint8)
+
+
+def scene_frames(keyframes: Sequence[np.ndarray], scenes: Sequence[Scene], fps: int,
+                 transition_seconds: float = 0.75) -> Iterator[np.ndarray]:
+    """
+    Every frame of a storyboard video, in order
+
+    Each scene lasts round(duration * fps) frames. Its transition takes the
+    last frames of that span (at most transition_seconds), so the video is
+    as long as the scenes' durations added up. The last scene's crossfade
+    has nothing to blend into and becomes a cut; its fade goes to black.
+
+    :param keyframes: HxWx3 uint8 RGB keyframe per scene (e.g. a FrameStore)
+    :param scenes: The scenes, in the same order
+    :param fps: Output frames per second
+    :param transition_seconds: Length of a transition
+    :return: Iterator over HxWx3 uint8 RGB frames
+    """
+    keyframes = list(keyframes)
+    black = np.zeros_like(keyframes[0]) if keyframes else None
+    for index, (frame, scene) in enumerate(zip(keyframes, scenes)):
+        total = max(1, round(scene.duration * fps))
+        following = keyframes[index + 1] if index + 1 < len(keyframes) else None
+        transition = scene.transition
+        if transition == 'crossfade' and following is None:
+            transition = 'cut'
+        blended = 0 if transition == 'cut' else min(round(transition_seconds * fps), total - 1)
+
+        for _ in range(total - blended):
+            yield frame
+        if transition == 'crossfade':
+            yield from blend(frame, following, blended)
+        elif transition == 'fade':
+            to_black = (blended + 1) // 2
+            yield from blend(frame, black, to_black)
+            if following is None:
+                yield from (black for _ in range(blended - to_black))
+            else:
+                yield from blend(black, following, blended - to_black)
+
+
+def render_scenes(store, scenes: Sequence[Scene], fetch: Callable[[Scene], bytes], key_for: Callable[[Scene], str],
+                  pool: Executor, cache=None, on_scene: Optional[Callable[[int, bool], None]] = None,
+                  check=None) -> Dict[str, int]:
+    """
+    Render the keyframe of every scene in parallel into a frame store
+
+    Scenes already in the cache are not rendered again. Scenes that fail do
+    not stop the others; every scene that succeeded is cached, so a retry
+    only renders the failed ones. With a check, a keyframe that comes back
+    blank or filtered is requested again on its own (up to check.retries
+    times, then the last answer is kept) and is not cached.
+
+    :param store: FrameStore with one frame per scene
+    :param scenes: The scenes
+    :param fetch: Returns the encoded keyframe of a scene (runs on the pool)
+    :param key_for: Cache key of a scene
+    :param pool: Executor the fetches run on
+    :param cache: FrameCache (None to always render)
+    :param on_scene: Called on this thread as on_scene(index, cached) whenever a scene is stored
+    :param check: frame_check.JobCheck the keyframes are validated with (None to accept any)
+    :return: Counts of 'cached', 'rendered' and 'retried' scenes
+    :raises RuntimeError: If any scene failed, after all the others have finished
+    """
+    counts = {'cached': 0, 'rendered': 0, 'retried': 0}
+    attempts = [0] * len(scenes)
+    pending = {}
+
+    def retry(index: int) -> bool:
+        if check is None or attempts[index] >= check.retries:
+            return False
+        attempts[index] += 1
+        counts['retried'] += 1
+        pending[pool.submit(fetch, scenes[index])] = index
+        return True
+
+    for index, scene in enumerate(scenes):
+        data = cache.get(key_for(scene)) if cache is not None else None
+        if data is not None:
+            frame = store.put(index, data)
+            if check is None or check.check(index, frame) is None:
+                counts['cached'] += 1
+                if on_scene:
+                    on_scene(index, True)
+                continue
+        pending[pool.submit(fetch, scene)] = index
+
+    failed = []
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = pending.pop(future)
+            try:
+                data = future.result()
+            except ContentFiltered as e:
+                if check is not None:
+                    check.reject(index, 'filtered')
+                if not retry(index):
+                    failed.append(f"scene {index + 1}: {e}")
+                continue
+            except Exception as e:
+                failed.append(f"scene {index + 1}: {e}")
+                continue
+            frame = store.put(index, data)
+            if check is not None and check.check(index, frame) is not None:
+                if retry(index):
+                    continue
+            elif cache is not None:
+                cache.put(key_for(scenes[index]), data)
+            counts['rendered'] += 1
+            if on_scene:
+                on_scene(index, False)
+
+    if failed:
+        raise RuntimeError("Could not render " + "; ".join(failed))
+    return counts
@@ -1,43 +1,30 @@
 import streamlit as st
-import requests
-from PIL import Image
 import os
-from image_to_video import ImageToVideoConverter
-import tempfile
+from resources import (get_config, get_encoding_profiles, get_frame_generator, get_frame_validator, get_prompt_index,
+                       new_converter, new_frame_store, new_previews)
 import uuid
-import io
-import json
 
 # Set page config
 st.set_page_config(page_title="AI Video Generator", layout="wide")
 
-# Constants
-SD_URL = "http://127.0.0.1:7860"
-
-def generate_image(prompt, negative_prompt="", width=1024, height=1024, steps=30):
-    """Generate an image using local Stable Diffusion WebUI API"""
-    payload = {
-        "prompt": prompt,
-        "negative_prompt": negative_prompt,
-        "steps": steps,
-        "width": width,
-        "height": height,
-        "sampler_name": "DPM++ 2M Karras",
-        "cfg_scale": 7,
-        "seed": -1,
-    }
+def generate_image(store, prompt, negative_prompt="", width=1024, height=1024, steps=30, frame=0, on_progress=None,
+                   check=None, use_cache=True):
+    """Generate an image on the configured Stable Diffusion WebUI backends into a frame store
     
+    See generation.FrameGenerator for the cache, coalescing, progress and
+    retry steps. Returns the stored frame as an RGB array (None on failure)
+    and whether it came from the cache.
+    """
     try:
-        response = requests.post(url=f"{SD_URL}/sdapi/v1/txt2img", json=payload)
-        r = response.json()
-        image = Image.open(io.BytesIO(bytes.fromhex(r['images'][0])))
-        return image
+        return get_frame_generator('webui').generate(store, frame, prompt, negative_prompt, width, height, steps,
+                                                     check=check, use_cache=use_cache, on_progress=on_progress,
+                                                     on_warning=st.warning)
     except Exception as e:
         st.error(f"Error generating image: {str(e)}")
-        return None
+        return None, False
 
 # Create necessary directories
-for folder in ['uploads', 'generated', 'output']:
+for folder in ['uploads', 'output']:
     os.makedirs(folder, exist_ok=True)
 
 # Title
@@ -54,6 +41,12 @@ with st.sidebar:
     width = st.select_slider("Image Width", options=[512, 768, 1024], value=1024)
     height = st.select_slider("Image Height", options=[512, 768, 1024], value=1024)
     steps = st.slider("Sampling Steps", min_value=20, max_value=50, value=30)
+    
+    st.header("Output")
+    high_quality = st.checkbox("High-quality download",
+                               help="Download a full-resolution master instead of the smaller preview")
+    new_variation = st.checkbox("New variation",
+                                help="Generate new frames even if this prompt was generated before")
 
 # Main interface
 prompt = st.text_area("Enter your prompt", height=100, 
@@ -63,65 +56,111 @@ negative_prompt = st.text_area("Enter negative prompt", height=100,
     placeholder="ugly, blurry, low quality, text, watermark, signature, deformed...",
     value="ugly, blurry, low quality, text, watermark, signature, deformed, bad anatomy, bad art, amateur")
 
+# Offer a past result for a near-identical prompt before spending backend time on it
+past = None
+if prompt:
+    similarity = get_config().get('prompt_cache', {}).get('similarity', 0.7)
+    past = next(((score, record) for score, record in
+                 get_prompt_index().similar(prompt, negative_prompt, threshold=similarity)
+                 if os.path.exists(record['video'])), None)
+if past:
+    score, record = past
+    st.info(f"{'An identical' if score == 1.0 else f'A {score:.0%} similar'} prompt was generated before: "
+            f"\"{record['prompt']}\" ({record['frames']} frames, {record['width']}x{record['height']})")
+    if st.button("Reuse this result"):
+        if record.get('sheet') and os.path.exists(record['sheet']):
+            st.image(record['sheet'], caption="All frames")
+        st.video(record['video'])
+        download = record.get('master') or record['video']
+        with open(download, 'rb') as f:
+            st.download_button("Download Video", data=f.read(), file_name=os.path.basename(download),
+                               mime="video/mp4")
+
 if prompt and st.button("Generate Video", type="primary"):
+    # Frames stay in memory (or a memory-mapped spill file) until encoded
+    store = new_frame_store(num_frames, width, height)
+    previews = new_previews()
     try:
         # Show progress
         progress_bar = st.progress(0)
         status_text = st.empty()
+        preview_slot = st.empty()
         
         # Generate frames
         status_text.text("Generating frames...")
-        image_paths = []
         
+        def show_progress(snapshot, frame=0):
+            """Advance the progress bar and live preview within a frame"""
+            progress_bar.progress(min((frame + snapshot['progress']) / (num_frames + 1), 1.0))
+            status_text.text(f"Generating frame {frame + 1}/{num_frames} "
+                             f"(step {snapshot['step']}/{snapshot['steps']})")
+            if snapshot['preview']:
+                preview_slot.image(snapshot['preview'], caption="Live preview")
+        
+        # Bad frames (blank, filtered, duplicated) are re-requested one by one
+        check = get_frame_validator().job()
         for i in range(num_frames):
-            progress = (i + 1) / (num_frames + 1)
+            progress = i / (num_frames + 1)
             progress_bar.progress(progress)
             
             # Generate image using local SD API
-            output = generate_image(
+            output, _ = generate_image(
+                store,
                 prompt=prompt,
                 negative_prompt=negative_prompt,
                 width=width,
                 height=height,
-                steps=steps
+                steps=steps,
+                frame=i,
+                on_progress=lambda snapshot, i=i: show_progress(snapshot, i),
+                check=check,
+                use_cache=not new_variation
             )
+            preview_slot.empty()
             
             if output is None:
                 st.error("Failed to generate image")
                 break
-                
-            # Save generated image
-            filename = f"generated_{uuid.uuid4()}.png"
-            filepath = os.path.join('generated', filename)
-            output.save(filepath)
-            image_paths.append(filepath)
             
             status_text.text(f"Generated frame {i + 1}/{num_frames}")
             
-            # Show the generated image
-            st.image(output, caption=f"Frame {i + 1}")
+            # Show a thumbnail; full frames only go to the encoder
+            st.image(previews.add(i, output), caption=f"Frame {i + 1}")
+        
+        check.finish(len(store) == num_frames)
         
         # Create video
-        if len(image_paths) == num_frames:
+        if len(store) == num_frames:
             status_text.text("Creating video...")
-            output_video = f"output_{uuid.uuid4()}.mp4"
-            output_path = os.path.join('output', output_video)
+            output_path = os.path.join('output', f"output_{uuid.uuid4()}.mp4")
             
-            converter = ImageToVideoConverter(output_path=output_path, fps=fps)
-            success = converter.convert_images_to_video('generated')
+            profiles = get_encoding_profiles()
+            wanted = [profiles['web']] + ([profiles['master']] if high_quality else [])
+            converter = new_converter(output_path=output_path, fps=fps)
+            videos = converter.convert_frames_to_profiles(store, wanted)
             
-            if success:
-                # Display video
+            if videos:
+                # Display the web preview
                 status_text.text("Video generated successfully!")
                 progress_bar.progress(1.0)
-                st.video(output_path)
+                st.image(previews.contact_sheet(), caption="All frames")
+                st.video(videos['web']['path'])
+                
+                # Index the job so near-identical prompts can reuse it
+                sheet_path = os.path.splitext(output_path)[0] + '_sheet.jpg'
+                with open(sheet_path, 'wb') as f:
+                    f.write(previews.contact_sheet())
+                get_prompt_index().add(prompt, negative_prompt, width=width, height=height, steps=steps,
+                                       frames=num_frames, fps=fps, video=videos['web']['path'],
+                                       master=videos.get('master', {}).get('path'), sheet=sheet_path)
                 
-                # Download button
-                with open(output_path, 'rb') as f:
+                # Download button, for the master when one was encoded
+                download = videos.get('master', videos['web'])
+                with open(download['path'], 'rb') as f:
                     st.download_button(
                         label="Download Video",
                         data=f.read(),
-                        file_name=output_video,
+                        file_name=os.path.basename(download['path']),
                         mime="video/mp4"
                     )
             else:
@@ -131,7 +170,5 @@ if prompt and st.button("Generate Video", type="primary"):
         st.error(f"An error occurred: {str(e)}")
         
     finally:
-        # Clean up temporary files
-        for path in image_paths:
-            if os.path.exists(path):
-                os.remove(path)
+        # Free the frames
+        store.close()